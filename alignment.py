@@ -0,0 +1,188 @@
+"""
+Glyph synchronization for recordings that do not start exactly on a glyph boundary.
+
+Encoded audio is a run of fixed length glyphs, so decoding only works when the analysis
+windows sit on the glyph grid. Captures from the wild have leading silence, are trimmed
+mid-glyph or come from a slightly different clock, all of which shift that grid. Here the
+first onset is found from an energy envelope (FFT convolution), then the grid position is
+fitted sample by sample by correlating the audio against the glyph tones, and re-fitted
+every few seconds so slow drift is followed through long files.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+ONSET_SMOOTHING_SECONDS = 0.005
+ONSET_THRESHOLD = 0.1  # Share of the loudest envelope point that counts as sound
+ONSET_EXCERPT_SECONDS = 5.0
+SYNC_WINDOWS = 10  # Windows correlated to find the grid at the first onset
+RESYNC_WINDOWS = 5  # Windows correlated to follow drift once the grid is known
+# A re-sync moves the grid by less than a quarter window, so no window is read twice or skipped
+SYNC_INTERVAL_WINDOWS = 100  # Windows decoded between two re-syncs
+SYNC_MIN_SCORE = 0.2  # Below this share of tone energy a re-sync is not trusted
+SYNC_COARSE_STEP = 16  # Start positions tried first, the best one is then refined sample by sample
+
+
+@lru_cache(maxsize=64)
+def fast_length(n):
+    """ Smallest 2^a 3^b 5^c >= n, pocketfft is many times slower on lengths with large prime factors """
+    best = 1 << max(0, (n - 1).bit_length())
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            length = power35 << max(0, (n - 1) // power35).bit_length()
+            best = min(best, length)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def fft_convolve_same(signal, kernel):
+    """
+    Convolution through the FFT, centered like scipy.signal.fftconvolve(mode='same'). Done with
+    numpy directly because scipy.signal alone takes over a second to import.
+    """
+    size = fast_length(len(signal) + len(kernel) - 1)
+    full = np.fft.irfft(np.fft.rfft(signal, size) * np.fft.rfft(kernel, size), size)
+    start = (len(kernel) - 1) // 2
+    return full[start:start + len(signal)]
+
+
+def first_onset(samples, sample_rate, threshold=ONSET_THRESHOLD, excerpt_seconds=ONSET_EXCERPT_SECONDS):
+    """ Index of the first sample where sound starts, or None for a silent recording """
+    smoothing = np.ones(max(1, int(ONSET_SMOOTHING_SECONDS * sample_rate)), dtype=np.float32)
+    smoothing /= len(smoothing)
+    excerpt_length = max(len(smoothing), int(excerpt_seconds * sample_rate))
+    loudest = None
+
+    # Only as much as it takes to get past the leading silence is looked at
+    for start in range(0, len(samples), excerpt_length):
+        excerpt = np.asarray(samples[start:start + excerpt_length], dtype=np.float32)
+        envelope = fft_convolve_same(excerpt * excerpt, smoothing)
+        if loudest is None or envelope.max() > loudest:
+            loudest = envelope.max()
+        if loudest <= 0:
+            continue
+        above = np.flatnonzero(envelope >= threshold * loudest)
+        if len(above):
+            return start + max(0, int(above[0]) - len(smoothing) // 2)
+    return None
+
+
+@lru_cache(maxsize=16)
+def tone_bank(candidates, window_length, sample_rate):
+    phase = 2 * np.pi * np.outer(np.arange(window_length), candidates) / sample_rate
+    return np.cos(phase).astype(np.float32), np.sin(phase).astype(np.float32)
+
+
+def tone_bank_hits(samples, sample_rate, window_length, candidates):
+    """ Index of the strongest candidate in each whole window of samples """
+    windows = samples[:len(samples) // window_length * window_length].reshape(-1, window_length).astype(np.float32)
+    cos_bank, sin_bank = tone_bank(tuple(candidates), window_length, sample_rate)
+    power = (windows @ cos_bank) ** 2 + (windows @ sin_bank) ** 2
+    return np.argmax(power, axis=1)
+
+
+def demodulators(tones, length, block, sample_rate):
+    """ exp(-2j pi f n / sample_rate) for every tone and n < length, built one block of samples at a time """
+    blocks = -(-length // block)
+    within = np.exp(-2j * np.pi * np.outer(tones, np.arange(block)) / sample_rate).astype(np.complex64)
+    block_starts = np.exp(-2j * np.pi * np.outer(tones, np.arange(blocks) * block) / sample_rate).astype(np.complex64)
+    return (block_starts[:, :, None] * within[:, None, :]).reshape(len(tones), -1)[:, :length]
+
+
+def sync_position(samples, sample_rate, window_length, candidates, earliest, latest, windows=SYNC_WINDOWS):
+    """
+    The start index in [earliest, latest) whose window grid best fits the glyph tones, with its score.
+
+    Every candidate tone is demodulated once and summed cumulatively, so the power of any
+    window is a difference of two sums and every start position can be scored exactly.
+    The score is the share of window energy held by the best matching tone, averaged over
+    `windows` consecutive windows. Returns (None, 0.0) when there is not enough audio.
+    """
+    earliest = max(0, earliest)
+    latest = min(latest, len(samples) - window_length + 1)
+    if latest <= earliest:
+        return None, 0.0
+    windows = max(1, min(windows, (len(samples) - latest + 1) // window_length))
+    excerpt = np.asarray(samples[earliest:latest + windows * window_length], dtype=np.float32)
+
+    # Only the tones that actually occur in the excerpt are worth correlating against
+    hits = set()
+    for shift in (0, window_length // 2):
+        hits.update(tone_bank_hits(excerpt[shift:], sample_rate, window_length, candidates).tolist())
+    tones = np.asarray(candidates, dtype=np.float64)[sorted(hits)]
+
+    # complex64 is plenty to rank start positions and halves the memory traffic of the sums
+    sums = np.zeros((len(tones), len(excerpt) + 1), dtype=np.complex64)
+    np.cumsum(excerpt * demodulators(tones, len(excerpt), window_length, sample_rate), axis=1, out=sums[:, 1:])
+    energy = np.concatenate(([0.0], np.cumsum(excerpt.astype(np.float64) ** 2)))
+
+    def scores_at(offsets):
+        starts = offsets[:, None] + window_length * np.arange(windows)[None, :]
+        tone_power = np.abs(sums[:, starts + window_length] - sums[:, starts]) ** 2
+        window_energy = (energy[starts + window_length] - energy[starts]) * window_length / 2
+        return tone_power.max(axis=0).sum(axis=1) / np.maximum(window_energy.sum(axis=1), 1e-9)
+
+    coarse = np.arange(0, latest - earliest, SYNC_COARSE_STEP)
+    best = coarse[np.argmax(scores_at(coarse))]
+    fine = np.arange(max(0, best - SYNC_COARSE_STEP + 1), min(latest - earliest, best + SYNC_COARSE_STEP))
+    fine_scores = scores_at(fine)
+    return earliest + int(fine[np.argmax(fine_scores)]), float(fine_scores.max())
+
+
+def refit_position(samples, sample_rate, window_length, candidates, position):
+    """
+    Follow drift: move a grid position that is already close by less than a quarter window.
+    Scoring starts one window earlier when there is audio for it, so a glyph followed by
+    silence cannot pull the grid back onto itself.
+    """
+    anchor = position - window_length if position - window_length - window_length // 4 >= 0 else position
+    found, score = sync_position(samples, sample_rate, window_length, candidates,
+                                 anchor - window_length // 4, anchor + window_length // 4,
+                                 RESYNC_WINDOWS + (anchor < position))
+    if found is None or score < SYNC_MIN_SCORE:
+        return position
+    return found + position - anchor
+
+
+def glyph_segments(samples, sample_rate, window_length, candidates, interval_windows=SYNC_INTERVAL_WINDOWS,
+                   final=True, start=None):
+    """
+    Split mono samples into (start, end) ranges whose windows sit on the glyph grid. Every range
+    but the last holds whole windows, the next one starts where the re-fitted grid says it should.
+    Without `final` more audio follows, so the last range stops at its last whole window too and
+    the caller carries the rest over. A `start` near the grid skips the onset search and is only refined.
+    A capture trimmed inside its first glyph gets a first range starting below 0, the samples before
+    0 are silence the caller pads with. Returns [] for silence.
+    """
+    if start is None:
+        onset = first_onset(samples, sample_rate)
+        if onset is None:
+            return []
+        # Sound from the first sample on may be a glyph trimmed anywhere up to its middle, its grid starts
+        # before the capture does and a window of zeros ahead of the audio leaves room for that
+        earliest = onset - window_length // 4 if onset > window_length // 4 else -(window_length // 2)
+        head = np.zeros(window_length, dtype=samples.dtype)
+        excerpt = np.concatenate((head, samples[:earliest + (SYNC_WINDOWS + 2) * window_length]))
+        start, _ = sync_position(excerpt, sample_rate, window_length, candidates,
+                                 earliest + len(head), earliest + len(head) + window_length)
+        start = onset if start is None else start - len(head)
+    else:
+        start = refit_position(samples, sample_rate, window_length, candidates, start)
+
+    segments = []
+    while True:
+        end = start + interval_windows * window_length
+        if end + window_length > len(samples):
+            # A sliver of a glyph past the last whole window cannot be read, only a real tail is kept
+            tail = (len(samples) - start) % window_length
+            keep_tail = final and tail >= window_length // 2
+            end = len(samples) if keep_tail else len(samples) - tail
+            if end > start:
+                segments.append((start, end))
+            return segments
+        segments.append((start, end))
+
+        start = refit_position(samples, sample_rate, window_length, candidates, end)
@@ -0,0 +1,95 @@
+"""
+Alphabet profiles: what synthesis, encoding and decoding have to agree on for a glyph sound type.
+That is the sample rate, how long a glyph and a word gap last, where the tones sit and the
+frequency below which a window reads as a word gap.
+
+The shipped sound types describe glyphs that exist as WAV files or glyph packs. Synthesized
+profiles have no files. glyph_bank generates their glyphs with NumPy the first time they are
+used and keeps them in memory:
+
+    narrowband   8 kHz, 30 ms glyphs, for bandwidth-limited links
+    studio       48 kHz, 100 ms glyphs
+
+More can be added with register_profile(); the profile's name is the sound type.
+"""
+import math
+
+# Glyph order, the first character gets the base frequency and every next one a step higher
+CHARACTERS = 'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*()_-+={<}>?/\'",.;:[]'
+MAX_FREQUENCY_SHARE = 0.95  # Highest tone allowed, as a share of the Nyquist frequency
+
+
+class AlphabetProfile:
+    """
+    One glyph alphabet. Without a `frequency_step` tones are one FFT bin of a glyph-long window
+    apart (1000 / symbol_ms Hz), so every glyph has its own bin. A synthesized profile's word gap
+    is a tone one step below the first glyph, and windows under `gap_frequency` (half a step below
+    the first glyph unless given) decode as a space.
+    """
+    def __init__(self, name, sample_rate=44100, symbol_ms=100, gap_ms=200, base_frequency=500,
+                 frequency_step=None, gap_frequency=None, use_modulation=False, volume=0.5, synthesized=True):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.symbol_ms = symbol_ms
+        self.gap_ms = gap_ms
+        self.frequency_step = frequency_step or 1000 / symbol_ms
+        # Tones land on bins: the base is rounded up to a whole number of steps
+        self.base_frequency = math.ceil(base_frequency / self.frequency_step - 1e-9) * self.frequency_step
+        self.gap_tone = self.base_frequency - self.frequency_step
+        self.gap_frequency = gap_frequency if gap_frequency is not None else self.base_frequency - self.frequency_step / 2
+        self.use_modulation = use_modulation
+        self.volume = volume
+        self.synthesized = synthesized
+
+        if sample_rate * symbol_ms % 1000 or sample_rate * gap_ms % 1000:
+            raise ValueError(f"profile {name}: {symbol_ms} ms glyphs and {gap_ms} ms gaps must be whole numbers "
+                             f"of samples at {sample_rate} Hz")
+        highest = self.frequency(len(CHARACTERS) - 1)
+        if synthesized and (highest > MAX_FREQUENCY_SHARE * sample_rate / 2 or self.gap_tone <= 0):
+            raise ValueError(f"profile {name}: tones from {self.gap_tone:.0f} to {highest:.0f} Hz do not fit "
+                             f"{sample_rate} Hz audio")
+
+    @property
+    def symbol_frames(self):
+        return self.sample_rate * self.symbol_ms // 1000
+
+    @property
+    def gap_frames(self):
+        return self.sample_rate * self.gap_ms // 1000
+
+    def frequency(self, index):
+        return self.base_frequency + index * self.frequency_step
+
+    def frequencies(self):
+        """ {character: tone frequency} """
+        return {char: self.frequency(index) for index, char in enumerate(CHARACTERS)}
+
+    def __repr__(self):
+        return (f"AlphabetProfile({self.name!r}, {self.sample_rate} Hz, {self.symbol_ms} ms glyphs, "
+                f"{self.gap_ms} ms gaps, {'synthesized' if self.synthesized else 'files'})")
+
+
+PROFILES = {}
+
+
+def register_profile(profile):
+    """ Make a profile available as a sound type, replacing one of the same name """
+    PROFILES[profile.name] = profile
+    return profile
+
+
+def get_profile(sound_type):
+    profile = PROFILES.get(sound_type)
+    if profile is None:
+        raise ValueError(f"Unknown sound type '{sound_type}', expected one of {', '.join(PROFILES)}")
+    return profile
+
+
+# The shipped glyphs were made outside this code base, their parameters are recorded here for the decoder
+register_profile(AlphabetProfile('modulated', base_frequency=500, gap_frequency=495, synthesized=False))
+register_profile(AlphabetProfile('beeps', base_frequency=500, gap_frequency=490, synthesized=False))
+# Generated at 65 kHz and folded down by the 44.1 kHz sample rate
+register_profile(AlphabetProfile('non_human', base_frequency=20900, gap_frequency=20890, synthesized=False))
+
+register_profile(AlphabetProfile('narrowband', sample_rate=8000, symbol_ms=30, gap_ms=60))
+register_profile(AlphabetProfile('studio', sample_rate=48000))
@@ -0,0 +1,23 @@
+import logging
+import os
+
+LOG_FILE = 'app.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def debug_requested():
+    return os.environ.get('AUDIOCIPHER_DEBUG', '') not in ('', '0')
+
+
+def configure_logging(debug=None, log_file=LOG_FILE):
+    """
+    Set up logging for an entry point. DEBUG logging to app.log is opt-in, either with
+    debug=True or by setting AUDIOCIPHER_DEBUG=1, otherwise only warnings go to stderr.
+    Library modules never configure logging themselves.
+    """
+    if debug is None:
+        debug = debug_requested()
+    if debug:
+        logging.basicConfig(filename=log_file, level=logging.DEBUG, format=LOG_FORMAT, force=True)
+    else:
+        logging.basicConfig(level=logging.WARNING, format=LOG_FORMAT, force=True)
@@ -0,0 +1,552 @@
+"""
+Output formats for encoded audio. Every encoder produces 16-bit PCM; this is where it is turned
+into something smaller for storage or transfer.
+
+    wav     16-bit PCM WAV, the default and what playback uses
+    mulaw   8-bit G.711 u-law WAV, half the size
+    adpcm   4-bit IMA ADPCM WAV, a quarter of the size
+    flac    lossless, about the size of adpcm for glyph audio (needs ffmpeg)
+    opus    lossy Ogg/Opus, the smallest (needs ffmpeg); the non_human tones sit above what it keeps
+
+mulaw and adpcm are written with NumPy alone and read back by wav_reader. Both are lossy, but
+the tones survive them well enough that every sound type decodes to the same text. flac and opus
+are piped through ffmpeg and read back with pydub.
+
+Writers take int16 blocks as they are produced and write them out as they go, so a long message
+never has to be held in memory in its encoded form.
+"""
+import io
+import os
+import struct
+
+import instrumentation
+from wav_reader import WAVE_FORMAT_PCM, WAVE_FORMAT_MULAW, WAVE_FORMAT_IMA_ADPCM, WavFile
+
+# extension, MIME type
+FORMATS = {
+    'wav': ('.wav', 'audio/wav'),
+    'mulaw': ('.wav', 'audio/wav'),
+    'adpcm': ('.wav', 'audio/wav'),
+    'flac': ('.flac', 'audio/flac'),
+    'opus': ('.opus', 'audio/ogg'),
+}
+
+MULAW_BIAS = 0x84
+MULAW_CLIP = 8159  # On the 14-bit scale the G.711 reference encoder works on
+
+IMA_STEPS = (
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+    107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796,
+    876, 963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871,
+    5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623,
+    27086, 29794, 32767)
+IMA_INDEX_ADJUST = (-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8)
+UNKNOWN_SIZE = 0xFFFFFFFF  # Chunk size left in the header when the destination cannot seek back to fill it in
+ADPCM_BATCH_BLOCKS = 64  # ADPCM blocks encoded together, bounds the writer's buffer to about 130k samples
+FFMPEG_CODECS = {'flac': ('flac', 'flac', ()), 'opus': ('libopus', 'ogg', ('-b:a', '64k'))}
+
+
+def check_format(format):
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}")
+    return format
+
+
+def extension_for(format):
+    return FORMATS[check_format(format)][0]
+
+
+def content_type_for(format):
+    return FORMATS[check_format(format)][1]
+
+
+def format_for_path(file_path, default='wav'):
+    """ The format a file name asks for by its extension, `default` for .wav and anything unknown """
+    extension = os.path.splitext(file_path)[1].lower()
+    return next((name for name, (ext, _) in FORMATS.items() if ext == extension and ext != '.wav'), default)
+
+
+def mulaw_encode(samples):
+    """ int16 samples to G.711 u-law bytes (uint8) """
+    import numpy as np
+
+    samples = np.asarray(samples, dtype=np.int32) >> 2
+    sign = (samples < 0).astype(np.uint8) << 7
+    # magnitude is in [33, 8191], its highest set bit is 5 to 12
+    magnitude = np.minimum(np.minimum(np.abs(samples), MULAW_CLIP) + (MULAW_BIAS >> 2), 0x1FFF)
+    exponent = (np.frexp(magnitude)[1] - 6).astype(np.uint8)
+    mantissa = ((magnitude >> (exponent + 1)) & 0x0F).astype(np.uint8)
+    return ~(sign | (exponent << 4) | mantissa)
+
+
+def _mulaw_table():
+    import numpy as np
+
+    codes = ~np.arange(256, dtype=np.uint8)
+    exponent = (codes >> 4).astype(np.int32) & 7
+    mantissa = codes.astype(np.int32) & 0x0F
+    magnitude = (((mantissa << 3) + MULAW_BIAS) << exponent) - MULAW_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+_mulaw_decode_table = None
+
+
+def mulaw_decode(codes):
+    """ G.711 u-law bytes back to int16 samples """
+    import numpy as np
+
+    global _mulaw_decode_table
+    if _mulaw_decode_table is None:
+        _mulaw_decode_table = _mulaw_table()
+    return _mulaw_decode_table[np.asarray(codes, dtype=np.uint8)]
+
+
+def adpcm_block_align(frame_rate, channels=1):
+    """ Bytes per ADPCM block, what Windows' encoder uses: 256 per channel, more at higher rates """
+    return 256 * channels * max(1, frame_rate // 11025)
+
+
+def adpcm_samples_per_block(block_align, channels=1):
+    # A 4 byte header per channel carries the first sample, then two samples per byte
+    return (block_align - 4 * channels) * 2 // channels + 1
+
+
+def _initial_indexes(blocks):
+    """ A starting step index per block, from the typical sample-to-sample change at its start """
+    import numpy as np
+
+    if blocks.shape[1] < 2:
+        # A block of a single sample has no change to go by
+        return np.zeros(len(blocks), dtype=np.int32)
+    change = np.abs(np.diff(blocks[:, :9], axis=1)).mean(axis=1)
+    return np.clip(np.searchsorted(IMA_STEPS, change) - 8, 0, 88).astype(np.int32)
+
+
+_adpcm_tables = None
+
+
+def adpcm_tables():
+    """
+    (deltas, next indexes): for every step index * 16 + code, the change to the predictor and the
+    next step index, so all blocks move along one sample with a couple of lookups
+    """
+    import numpy as np
+
+    global _adpcm_tables
+    if _adpcm_tables is None:
+        steps = np.array(IMA_STEPS, dtype=np.int32)[:, None]
+        codes = np.arange(16, dtype=np.int32)[None, :]
+        shares = (np.where(codes & 4, steps, 0) + np.where(codes & 2, steps >> 1, 0) + np.where(codes & 1, steps >> 2, 0))
+        deltas = np.where(codes & 8, -1, 1) * ((steps >> 3) + shares)
+        next_indexes = np.clip(np.arange(89)[:, None] + np.array(IMA_INDEX_ADJUST)[None, :], 0, 88)
+        _adpcm_tables = deltas.reshape(-1).astype(np.int32), next_indexes.reshape(-1).astype(np.int32)
+    return _adpcm_tables
+
+
+_adpcm_encode_tables = None
+_ADPCM_ROW = 1 << 18  # Spacing of the step indexes in adpcm_encode_tables, wider than any difference
+
+
+def adpcm_encode_tables():
+    """
+    (bounds, deltas, next rows, codes) to encode a sample with one searchsorted: the code the
+    reference encoder gives a difference at a step index changes at 16 bounds, and the bounds of
+    every step index sit in a row of their own along one sorted array. Searching it for
+    index * _ADPCM_ROW + difference gives a position, and the other tables are indexed by that.
+    """
+    import numpy as np
+
+    global _adpcm_encode_tables
+    if _adpcm_encode_tables is None:
+        deltas, next_indexes = adpcm_tables()
+        steps = np.array(IMA_STEPS, dtype=np.int64)[:, None]
+        magnitudes = np.arange(1, 8)[None, :]
+        # The step and its halves are taken off greedily, so a code's magnitude is how many of these
+        # thresholds the absolute difference reaches
+        thresholds = (np.where(magnitudes & 4, steps, 0) + np.where(magnitudes & 2, steps >> 1, 0) +
+                      np.where(magnitudes & 1, steps >> 2, 0))
+        # From the lowest difference up: codes 15 down to 8 for negative ones, then 0 up to 7
+        bounds = np.concatenate((np.full((89, 1), -_ADPCM_ROW // 2), 1 - thresholds[:, ::-1],
+                                 np.zeros((89, 1), dtype=np.int64), thresholds), axis=1)
+        bounds = (bounds + (np.arange(89)[:, None] * _ADPCM_ROW)).reshape(-1)
+        # searchsorted lands one past the last bound reached, position 0 is never hit
+        codes = np.concatenate(([0], np.tile(np.r_[15:7:-1, 0:8], 89))).astype(np.uint8)
+        keys = np.concatenate(([0], np.repeat(np.arange(89) * 16, 16))) + codes
+        _adpcm_encode_tables = (bounds, deltas[keys].astype(np.int64),
+                                next_indexes[keys].astype(np.int64) * _ADPCM_ROW, codes)
+    return _adpcm_encode_tables
+
+
+def adpcm_encode_blocks(blocks):
+    """
+    IMA ADPCM codes for rows of samples, one row per block and channel. Every block starts afresh
+    from its first sample, so the rows are encoded side by side, one sample position at a time.
+    Returns (first samples, step indexes, uint8 codes of the remaining samples).
+    """
+    import numpy as np
+
+    bounds, deltas, next_rows, code_of = adpcm_encode_tables()
+    blocks = np.asarray(blocks, dtype=np.int32)
+    columns = np.ascontiguousarray(blocks.T, dtype=np.int64)
+    index = _initial_indexes(blocks)
+    first, first_index = blocks[:, 0].copy(), index.copy()
+    codes = np.empty((blocks.shape[1] - 1, len(blocks)), dtype=np.uint8)
+
+    # All int64 and np.minimum/np.maximum rather than np.clip, the loop runs once per sample
+    # position and its cost is mostly numpy's per-call overhead
+    predictor = columns[0].copy()
+    low, high = np.int64(-32768), np.int64(32767)
+    row = index.astype(np.int64) * _ADPCM_ROW
+    for position in range(1, blocks.shape[1]):
+        found = np.searchsorted(bounds, row + (columns[position] - predictor), 'right')
+        predictor += deltas[found]
+        np.minimum(predictor, high, out=predictor)
+        np.maximum(predictor, low, out=predictor)
+        row = next_rows[found]
+        codes[position - 1] = code_of[found]
+    return first, first_index, codes.T
+
+
+def adpcm_decode_blocks(first, first_index, codes):
+    """ The inverse of adpcm_encode_blocks, int16 rows of samples """
+    import numpy as np
+
+    deltas, next_indexes = adpcm_tables()
+    columns = np.ascontiguousarray(np.asarray(codes, dtype=np.int32).T)
+    predictor = np.asarray(first, dtype=np.int32).copy()
+    index = np.clip(np.asarray(first_index, dtype=np.int32), 0, 88)
+    samples = np.empty((len(columns) + 1, len(predictor)), dtype=np.int16)
+    samples[0] = predictor
+
+    for position, code in enumerate(columns, 1):
+        key = index * 16 + code
+        predictor += deltas[key]
+        np.clip(predictor, -32768, 32767, out=predictor)
+        index = next_indexes[key]
+        samples[position] = predictor
+    return samples.T
+
+
+def adpcm_pack(frames, channels, block_align):
+    """ int16 frames (a whole number of blocks, interleaved) to IMA ADPCM WAV blocks as bytes """
+    import numpy as np
+
+    per_block = adpcm_samples_per_block(block_align, channels)
+    # rows: (block, channel)
+    rows = frames.reshape(-1, per_block, channels).transpose(0, 2, 1).reshape(-1, per_block)
+    first, index, codes = adpcm_encode_blocks(rows)
+
+    block_count = len(rows) // channels
+    header = np.zeros((block_count, channels, 4), dtype=np.uint8)
+    header[..., :2] = first.astype('<i2').view(np.uint8).reshape(block_count, channels, 2)
+    header[..., 2] = index.reshape(block_count, channels)
+    # Each channel's codes go out 8 at a time (4 bytes), low nibble first, channels taking turns
+    nibbles = codes.astype(np.uint8).reshape(block_count, channels, -1, 8)
+    data = (nibbles[..., 0::2] | (nibbles[..., 1::2] << 4)).transpose(0, 2, 1, 3)
+    return np.concatenate((header.reshape(block_count, -1), data.reshape(block_count, -1)), axis=1).tobytes()
+
+
+def adpcm_unpack(data, channels, block_align):
+    """ IMA ADPCM WAV blocks to interleaved int16 samples, a partial last block included """
+    import numpy as np
+
+    data = np.frombuffer(data, dtype=np.uint8)
+    full = len(data) // block_align
+    pieces = []
+    if full:
+        pieces.append(_unpack_blocks(data[:full * block_align].reshape(full, block_align), channels))
+    tail = data[full * block_align:]
+    tail = tail[:4 * channels + (len(tail) - 4 * channels) // (4 * channels) * 4 * channels]
+    if len(tail) >= 4 * channels:
+        pieces.append(_unpack_blocks(tail.reshape(1, -1), channels))
+    return np.concatenate(pieces) if pieces else np.zeros(0, dtype=np.int16)
+
+
+def _unpack_blocks(blocks, channels):
+    import numpy as np
+
+    block_count = len(blocks)
+    header = blocks[:, :4 * channels].reshape(block_count, channels, 4)
+    first = header[..., :2].copy().view('<i2').reshape(-1)
+    index = header[..., 2].reshape(-1)
+    data = blocks[:, 4 * channels:].reshape(block_count, -1, channels, 4).transpose(0, 2, 1, 3)
+    nibbles = np.empty(data.shape[:-1] + (8,), dtype=np.uint8)
+    nibbles[..., 0::2] = data & 0x0F
+    nibbles[..., 1::2] = data >> 4
+    samples = adpcm_decode_blocks(first, index, nibbles.reshape(block_count * channels, -1))
+    return samples.reshape(block_count, channels, -1).transpose(0, 2, 1).reshape(-1)
+
+
+class _RiffWavWriter:
+    """
+    A WAV file written as it goes. Its sizes are filled in on close when the destination can seek,
+    otherwise they stay UNKNOWN_SIZE, which wav_reader reads as "up to the end of the file".
+    PCM gets the plain 16-byte fmt chunk of the wave module and no fact chunk.
+    """
+    def __init__(self, destination, frame_rate, channels, format_tag, bytes_per_second, block_align,
+                 bits_per_sample, extra=b''):
+        self.file, self._owned = _open_destination(destination)
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.frames = 0
+        self.data_size = 0
+        fmt = struct.pack('<HHIIHH', format_tag, channels, frame_rate, bytes_per_second, block_align, bits_per_sample)
+        if format_tag != WAVE_FORMAT_PCM:
+            fmt += struct.pack('<H', len(extra)) + extra
+        header = b'RIFF' + struct.pack('<I', UNKNOWN_SIZE) + b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+        # Formats other than PCM carry the number of frames in a fact chunk
+        self._fact = len(header) + 8 if format_tag != WAVE_FORMAT_PCM else None
+        if self._fact:
+            header += b'fact' + struct.pack('<II', 4, UNKNOWN_SIZE)
+        header += b'data' + struct.pack('<I', UNKNOWN_SIZE)
+        self._data = len(header) - 4
+        self._start = self.file.tell() if self.file.seekable() else 0
+        self.file.write(header)
+
+    def _write_data(self, data, frames):
+        self.file.write(data)
+        self.data_size += len(data)
+        self.frames += frames
+        instrumentation.add_bytes('audio.write', len(data))
+
+    def _finish(self):
+        pass
+
+    def close(self):
+        self._finish()
+        if self.data_size & 1:
+            self.file.write(b'\0')
+        if self.file.seekable():
+            end = self.file.tell()
+            self.file.seek(self._start + 4)
+            self.file.write(struct.pack('<I', end - self._start - 8))
+            if self._fact:
+                self.file.seek(self._start + self._fact)
+                self.file.write(struct.pack('<I', self.frames))
+            self.file.seek(self._start + self._data)
+            self.file.write(struct.pack('<I', self.data_size))
+            self.file.seek(end)
+        if self._owned:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MulawWavWriter(_RiffWavWriter):
+    def __init__(self, destination, frame_rate, channels=1):
+        super().__init__(destination, frame_rate, channels, WAVE_FORMAT_MULAW, frame_rate * channels, channels, 8)
+
+    def write(self, samples):
+        data = mulaw_encode(samples).tobytes()
+        self._write_data(data, len(data) // self.channels)
+
+
+class AdpcmWavWriter(_RiffWavWriter):
+    """ Samples are held back until they fill whole ADPCM blocks, the rest goes out as a shorter last block """
+    def __init__(self, destination, frame_rate, channels=1):
+        self.block_align = adpcm_block_align(frame_rate, channels)
+        self.samples_per_block = adpcm_samples_per_block(self.block_align, channels)
+        super().__init__(destination, frame_rate, channels, WAVE_FORMAT_IMA_ADPCM,
+                         frame_rate * self.block_align // self.samples_per_block, self.block_align, 4,
+                         struct.pack('<H', self.samples_per_block))
+        self._pending = []
+        self._pending_frames = 0
+
+    def write(self, samples):
+        import numpy as np
+
+        samples = np.asarray(samples, dtype=np.int16)
+        self._pending.append(samples)
+        self._pending_frames += len(samples) // self.channels
+        if self._pending_frames >= ADPCM_BATCH_BLOCKS * self.samples_per_block:
+            self._flush(whole_blocks=True)
+
+    def _flush(self, whole_blocks):
+        import numpy as np
+
+        if not self._pending:
+            return
+        frames = np.concatenate(self._pending).reshape(-1, self.channels)
+        blocks = len(frames) // self.samples_per_block
+        cut = blocks * self.samples_per_block
+        if cut:
+            self._write_data(adpcm_pack(frames[:cut], self.channels, self.block_align), cut)
+        rest = frames[cut:]
+        if not whole_blocks and len(rest):
+            self._write_last_block(rest)
+            rest = rest[:0]
+        self._pending = [rest.reshape(-1)] if len(rest) else []
+        self._pending_frames = len(rest)
+
+    def _write_last_block(self, rest):
+        import numpy as np
+
+        # A short block still holds its codes in groups of 8 per channel, padded with the last sample
+        frames = len(rest)
+        codes = -(-(frames - 1) // 8) * 8
+        padded = np.concatenate((rest, np.repeat(rest[-1:], codes + 1 - frames, axis=0)))
+        block_align = 4 * self.channels + codes // 2 * self.channels
+        data = adpcm_pack(padded, self.channels, block_align)
+        self._write_data(data, frames)
+
+    def _finish(self):
+        self._flush(whole_blocks=False)
+
+
+class PcmWavWriter(_RiffWavWriter):
+    def __init__(self, destination, frame_rate, channels=1):
+        super().__init__(destination, frame_rate, channels, WAVE_FORMAT_PCM, frame_rate * channels * 2, channels * 2, 16)
+
+    def write(self, samples):
+        import numpy as np
+
+        data = np.asarray(samples, dtype='<i2').tobytes()
+        self._write_data(data, len(data) // (2 * self.channels))
+
+
+def ffmpeg_path():
+    import shutil
+
+    path = shutil.which('ffmpeg') or shutil.which('avconv')
+    if path is None:
+        raise RuntimeError("ffmpeg is needed for flac and opus output, install it or use wav, mulaw or adpcm")
+    return path
+
+
+class FfmpegWriter:
+    """ Raw PCM piped into ffmpeg as it comes; its output goes straight to a path or is copied to a file object """
+    def __init__(self, destination, frame_rate, channels=1, format='flac'):
+        import shutil
+        import subprocess
+        import threading
+
+        codec, container, options = FFMPEG_CODECS[format]
+        self.channels = channels
+        to_path = isinstance(destination, (str, os.PathLike))
+        command = [ffmpeg_path(), '-hide_banner', '-loglevel', 'error', '-y',
+                   '-f', 's16le', '-ar', str(frame_rate), '-ac', str(channels), '-i', 'pipe:0',
+                   '-c:a', codec, *options, '-f', container, os.fspath(destination) if to_path else 'pipe:1']
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.DEVNULL if to_path else subprocess.PIPE,
+                                         stderr=subprocess.PIPE)
+        self._copier = None
+        self._closed = False
+        if not to_path:
+            # ffmpeg's output is drained while it is fed, or both ends could block on full pipes
+            self._copier = threading.Thread(target=shutil.copyfileobj, args=(self._process.stdout, destination),
+                                            daemon=True)
+            self._copier.start()
+
+    def write(self, samples):
+        import numpy as np
+
+        data = np.asarray(samples, dtype='<i2').tobytes()
+        try:
+            self._process.stdin.write(data)
+        except BrokenPipeError:
+            # ffmpeg gave up, close() raises with its reason
+            self.close()
+        instrumentation.add_bytes('audio.write', len(data))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._copier is not None:
+            self._copier.join()
+        errors = self._process.stderr.read()
+        if self._process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed: {errors.decode('utf-8', 'replace').strip()}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_destination(destination):
+    """ (file object, whether it was opened here) """
+    if isinstance(destination, (str, os.PathLike)):
+        return open(destination, 'wb'), True
+    return destination, False
+
+
+def open_writer(destination, frame_rate, channels=1, format='wav'):
+    """ A writer for int16 blocks: call write(samples) for every block, then close() (or use it as a context manager) """
+    check_format(format)
+    if format == 'wav':
+        return PcmWavWriter(destination, frame_rate, channels)
+    if format == 'mulaw':
+        return MulawWavWriter(destination, frame_rate, channels)
+    if format == 'adpcm':
+        return AdpcmWavWriter(destination, frame_rate, channels)
+    return FfmpegWriter(destination, frame_rate, channels, format)
+
+
+@instrumentation.timed('audio.write')
+def write_audio(blocks, frame_rate, destination=None, channels=1, format='wav'):
+    """
+    Write int16 samples, one array or an iterable of blocks, in `format` to a path or file object.
+    Without a destination the file is returned as bytes.
+    """
+    import numpy as np
+
+    target = io.BytesIO() if destination is None else destination
+    if isinstance(blocks, np.ndarray):
+        blocks = (blocks,)
+    with open_writer(target, frame_rate, channels, format) as writer:
+        for block in blocks:
+            writer.write(block)
+    return target.getvalue() if destination is None else destination
+
+
+def read_audio(source):
+    """
+    (int16 samples, frame_rate, channels) of a file in any of the FORMATS, from a path or bytes.
+    WAV files are read by wav_reader, anything else is left to pydub and ffmpeg.
+    """
+    import numpy as np
+
+    try:
+        wav_file = WavFile(source)
+    except ValueError:
+        wav_file = None
+    if wav_file is not None and wav_file.sample_width == 2:
+        return wav_file.samples, wav_file.frame_rate, wav_file.channels
+
+    import shutil
+
+    if shutil.which('ffprobe') is None and shutil.which('avprobe') is None:
+        raise ValueError("not a WAV file this reader knows, and ffmpeg is needed to read anything else")
+    from pydub import AudioSegment
+    from pydub.exceptions import CouldntDecodeError
+    try:
+        sound = AudioSegment.from_file(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    except CouldntDecodeError as e:
+        raise ValueError(f"not a readable audio file: {e}")
+    sound = sound.set_sample_width(2)
+    return np.array(sound.get_array_of_samples(), dtype=np.int16), sound.frame_rate, sound.channels
+
+
+def convert_wav(wav_bytes, destination=None, format='wav'):
+    """ Re-encode a 16-bit WAV file held in memory, e.g. the GUI's last encoding, in another format """
+    if format == 'wav':
+        if destination is None:
+            return wav_bytes
+        target, owned = _open_destination(destination)
+        target.write(wav_bytes)
+        if owned:
+            target.close()
+        return destination
+    samples, frame_rate, channels = read_audio(wav_bytes)
+    return write_audio(samples, frame_rate, destination, channels, format)
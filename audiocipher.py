@@ -1,24 +1,38 @@
-import logging
-
-# Setup logging at the top
-logging.basicConfig(filename='app.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+import sys
 
-from os import environ
-environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+if __name__ == "__main__" and sys.argv[1:2] == ['batch']:
+    # Headless batch runs never load Qt or an audio backend
+    from batch import main
+    sys.exit(main(sys.argv[2:]))
 
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QTextEdit, QPushButton, QFileDialog, QComboBox
-from PyQt5.QtGui import QFont, QIcon
-from PyQt5.QtCore import QTimer, Qt
-import pygame
-import sys
-from combining_sounds import combining_sounds, play_sound
-from recognize_text import recognize_text_from_sound
-from morse_playback import read_scales_from_file, morse_code_to_musical_sequence, generate_audio_from_sequence
+import logging
 import os
-import shutil
-import atexit
+import threading
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
 
-logging.debug(os.environ)
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton, QFileDialog,
+                             QComboBox, QProgressBar)
+from PyQt5.QtGui import QFont, QIcon
+from PyQt5.QtCore import QTimer, Qt, QObject, QRunnable, QThreadPool, pyqtSignal
+from app_logging import configure_logging
+from instrumentation import configure_metrics, export as export_metrics
+from morse_playback import read_scales_from_file
+from live_decoding import LiveDecoder, MicrophoneSource, WavSource
+import alphabet_profile
+import audio_formats
+import glyph_bank
+
+# numpy, the decoder and pygame are imported by the handlers that need them, so the window opens
+# without waiting for them
+
+# Save dialog filters and the audio_formats format each one writes
+SAVE_FILTERS = {
+    "WAV files (*.wav)": 'wav',
+    "u-law WAV, half the size (*.wav)": 'mulaw',
+    "IMA ADPCM WAV, a quarter of the size (*.wav)": 'adpcm',
+    "FLAC, lossless (*.flac)": 'flac',
+    "Opus (*.opus)": 'opus',
+}
 
 class CustomTitleBar(QWidget):
     def __init__(self, parent=None):
@@ -56,6 +70,52 @@ class CustomTitleBar(QWidget):
             self.parentWidget().close()
 
 
+class JobCancelled(Exception):
+    """ Raised inside a job's work once the job was cancelled """
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+class Job(QRunnable):
+    """
+    Runs work(report) on a QThreadPool thread. The work calls report(done, total) as it goes, which
+    emits the progress in percent and raises JobCancelled once cancel() was called. The result, an
+    error or the cancellation comes back to the GUI thread through the signals.
+    """
+    def __init__(self, work):
+        super().__init__()
+        self.work = work
+        self.signals = JobSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def report(self, done, total):
+        if self._cancelled.is_set():
+            raise JobCancelled()
+        self.signals.progress.emit(int(100 * done / total) if total else 0)
+
+    def run(self):
+        try:
+            result = self.work(self.report)
+        except JobCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            logging.debug(f"Background job failed: {e}")
+            self.signals.failed.emit(str(e))
+        else:
+            if self._cancelled.is_set():
+                self.signals.cancelled.emit()
+            else:
+                self.signals.finished.emit(result)
+
+
 class TextToSoundConverterApp(QWidget):
     def __init__(self):
         super().__init__()
@@ -65,18 +125,19 @@ class TextToSoundConverterApp(QWidget):
         # Otherwise, use the directory of this script file
         self.base_dir = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
 
-        audio_types = ['modulated', 'morse', 'non_human']
-        for audio_type in audio_types:
-            final_wav_path = os.path.join(self.base_dir, audio_type, 'final.wav')
-            if os.path.exists(final_wav_path):
-                os.remove(final_wav_path)
-                print(f"Deleted {final_wav_path}")   
-
         # Construct the path to the scales_frequencies.txt file
         scales_frequencies_path = os.path.join(self.base_dir, 'morse', 'scales_frequencies.txt')
 
         # Now use the resolved path to read the scales from the file
         self.scales = read_scales_from_file(scales_frequencies_path)
+
+        # Encoding and decoding run here, the GUI thread only starts them and shows their progress
+        self.thread_pool = QThreadPool(self)
+        self.job = None  # The Job the progress bar shows
+
+        # Decode every character sound once, in the background, so playback never hits the disk per letter
+        self.preload_job = Job(lambda report: glyph_bank.preload(['modulated', 'non_human']))
+        self.thread_pool.start(self.preload_job)
         
         self.setWindowTitle("Text to Sound Converter")
         self.setGeometry(100, 100, 800, 600)
@@ -87,6 +148,13 @@ class TextToSoundConverterApp(QWidget):
 
         self.selected_sound_file_path = None
 
+        self.last_encoded_wav = None  # WAV bytes of the last encoded message, kept in memory for download
+        self.last_encoding = None  # Encodes the last streamed message on demand, playback does not wait for the WAV
+        self.player = None  # streaming_playback.StreamPlayer of the message being played
+        self.playback_job = None  # The Job loading the selected file for playback
+        self.live_decoder = None  # live_decoding.LiveDecoder feeding the typewriter while a file plays or the microphone listens
+        self.decode_while_playing = False  # The selected file is a 16-bit WAV the live decoder can read
+
         # Set application icon
         icon_path = ".\icons\icon_for_windows.ico"  # Replace with the actual path to your icon file
         self.setWindowIcon(QIcon(icon_path))
@@ -176,6 +244,8 @@ class TextToSoundConverterApp(QWidget):
         self.sound_type_combo.addItem("modulated")
         #self.sound_type_combo.addItem("beeps")
         self.sound_type_combo.addItem("non_human")
+        self.sound_type_combo.addItem("narrowband")
+        self.sound_type_combo.addItem("studio")
         
         # Morse dropdown
         self.morse_scale_combo = QComboBox(self)
@@ -192,6 +262,8 @@ class TextToSoundConverterApp(QWidget):
         self.create_start_button()
         self.create_download_button()
         self.create_sound_file_button()
+        self.create_listen_button()
+        self.create_progress_bar()
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.check_status)
@@ -200,8 +272,12 @@ class TextToSoundConverterApp(QWidget):
         selected_text = self.sound_type_combo.itemText(index)
         if selected_text == "morse":
             self.morse_scale_combo.show()
+            self.duration_per_character, self.gap_between_words = 100, 200
         else:
             self.morse_scale_combo.hide()
+            # Typing keeps pace with the profile's glyphs
+            profile = alphabet_profile.get_profile(selected_text)
+            self.duration_per_character, self.gap_between_words = profile.symbol_ms, profile.gap_ms
         self.sound_type = selected_text
 
     def get_sound_type(self):
@@ -223,53 +299,133 @@ class TextToSoundConverterApp(QWidget):
             logging.debug("Starting playback.")
             text = self.text_entry.toPlainText()
             selected_text = self.get_sound_type()
-            if not pygame.mixer.get_init():
-                pygame.mixer.init()
             if self.selected_sound_file and not self.text_typed_for_current_file:
-                pygame.mixer.music.load(self.selected_sound_file)
-                pygame.mixer.music.play()
                 self.is_playing = True
-                self.timer.start(100)
+                self.prepare_file_playback(self.selected_sound_file, self.decode_while_playing)
                 self.selected_sound_file = None
                 self.text_entry.clear()
-                self.type_text()
                 self.text_typed_for_current_file = True
             elif not self.selected_sound_file or self.playback_source == 'text':
+                from streaming_playback import stream_text, stream_morse
+
+                self.last_encoded_wav = None
                 if selected_text == "morse":
+                    from morse_playback import morse_code_to_musical_sequence
+
                     selected_scale = self.morse_scale_combo.currentText()  # Get the selected scale
                     scale = self.scales[selected_scale]
+                    # The sequence is random per call, keep it so the download matches what was played
                     sequence = morse_code_to_musical_sequence(text, scale)
-                    audio = generate_audio_from_sequence(sequence, scale)
-                    audio_file_path = self.resource_path(os.path.join(self.get_sound_type(), 'final.wav'))
-                    audio.export(audio_file_path, format="wav")
-
-                    # Play the audio file using Pygame
-                    pygame.mixer.music.load(audio_file_path)
-                    pygame.mixer.music.play()
-                    
-                    # Track the playback status
-                    self.is_playing = True
-                    self.timer.start(100)  # You might adjust or remove this timer depending on how you handle playback checking
-                    logging.debug("Started morse playback.")
+                    self.last_encoding = self.morse_encoding(sequence, scale)
+
+                    # Start playing the first notes while the rest is still being rendered
+                    prepare = lambda report: stream_morse(sequence, scale, start=False)
                 else:
-                    generated_sound = combining_sounds(text, sound_type=selected_text)
-                    play_sound(generated_sound, sound_type=selected_text)
+                    self.last_encoding = self.text_encoding(text, selected_text)
+                    prepare = lambda report: stream_text(text, selected_text, start=False)
                     logging.debug(f"Starting playback for sound type: {selected_text}")
-                    self.is_playing = True
-                    self.timer.start(100)
-                    logging.debug(f"Started {selected_text} playback.")
-                    #print("recognized text:", recognize_text_from_sound(f"{selected_text}/final.wav", sound_type=selected_text))
+
+                # Loading the glyphs and opening the audio device happen on the pool, playback starts once they are done
+                self.is_playing = True
+                self.run_job(prepare, self.start_player, "Preparing playback")
+                #print("recognized text:", recognize_text_from_sound(f"{selected_text}/final.wav", sound_type=selected_text))
+
+    def prepare_file_playback(self, file_path, decode_while_playing):
+        """ Open the audio device, load the file and build its live decoder on the pool, play_file starts them """
+        from combining_sounds import mixer
+
+        sound_type = self.get_sound_type()
+
+        def prepare(report):
+            music = mixer().music
+            music.load(file_path)
+            decoder = LiveDecoder(WavSource(file_path, realtime=True), sound_type) if decode_while_playing else None
+            return music, decoder
+
+        # Not run_job, that would cancel decoding a file that is not a WAV, which playback types along with
+        job = Job(prepare)
+        job.signals.finished.connect(lambda prepared: self.play_file(job, prepared))
+        job.signals.failed.connect(lambda message: self.play_file(job, None))
+        self.playback_job = job
+        self.thread_pool.start(job)
+
+    def play_file(self, job, prepared):
+        if job is not self.playback_job:
+            # Stopped while preparing
+            return
+        self.playback_job = None
+        if prepared is None:
+            # Preparing playback failed
+            self.is_playing = False
+            return
+        music, decoder = prepared
+        music.play()
+        if decoder is not None:
+            # Decode alongside playback, the typewriter types whatever has been recognized so far
+            self.start_live_decoding(decoder)
+        self.timer.start(100)
+        self.type_text()
+
+    def start_player(self, player):
+        if not self.is_playing:
+            return
+        self.player = player.start()
+        self.timer.start(100)
+        logging.debug(f"Started {self.get_sound_type()} playback.")
+
+    def text_encoding(self, text, sound_type):
+        """ Work for a Job that encodes text to WAV bytes a word at a time """
+        def work(report):
+            import numpy as np
+            import glyph_bank
+            from combining_sounds import iter_encode_pcm, write_wav
+
+            bank = glyph_bank.get_glyph_bank(sound_type)
+            blocks = list(iter_encode_pcm(text, sound_type, progress=report))
+            samples = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int16)
+            return write_wav(samples, bank.frame_rate, channels=bank.channels)
+        return work
+
+    def morse_encoding(self, sequence, scale):
+        """ Work for a Job that renders a Morse note sequence to WAV bytes a note at a time """
+        def work(report):
+            import numpy as np
+            from combining_sounds import write_wav
+            from morse_playback import iter_render_sequence
+
+            blocks = list(iter_render_sequence(sequence, scale, progress=report))
+            samples = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int16)
+            return write_wav(samples, 44100)
+        return work
 
     def check_status(self):
         logging.debug("Check status function called.")
+        import pygame
+
         selected_text = self.get_sound_type()
-        if pygame.mixer.music.get_busy():
+        if self.player is not None and self.player.active:
+            self.timer.start(100)
+        elif pygame.mixer.get_init() and pygame.mixer.music.get_busy():
             self.timer.start(100)
         else:
             self.stop_playback()
 
     def stop_playback(self):
         logging.debug("Stop playback function called.")
+        import pygame
+
+        if self.job is not None and self.is_playing and self.player is None:
+            # Still preparing, playback never started
+            self.cancel_job()
+        if self.playback_job is not None:
+            self.playback_job.cancel()
+            self.playback_job = None
+
+        if self.player is not None:
+            self.player.stop()
+            self.player = None
+        if self.live_decoder is not None and isinstance(self.live_decoder.source, WavSource):
+            self.live_decoder.stop()
         selected_text = self.get_sound_type()
         if selected_text == "morse":
             if pygame.mixer.get_init():
@@ -292,21 +448,25 @@ class TextToSoundConverterApp(QWidget):
 
     def download_wav_file(self):
         # Open a file dialog to get the location where the user wants to save the file
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save WAV File", "", "WAV files (*.wav)")
+        file_path, selected_filter = QFileDialog.getSaveFileName(self, "Save Sound File", "", ";;".join(SAVE_FILTERS))
         if file_path:
-            # Get the full path to the existing 'final.wav' based on the selected sound type
-            source_path = os.path.join(self.base_dir, f'{self.get_sound_type()}', 'final.wav')
-            
-            # Check if the source file exists
-            if os.path.exists(source_path):
-                # Copy the file to the new location specified by the user
-                shutil.copy(source_path, file_path)
-                logging.debug(f"File saved successfully to: {file_path}")
+            format = SAVE_FILTERS.get(selected_filter, 'wav')
+            if not os.path.splitext(file_path)[1]:
+                file_path += audio_formats.extension_for(format)
+            if self.last_encoded_wav is not None:
+                self.save_wav(file_path, self.last_encoded_wav, format)
+            elif self.last_encoding is not None:
+                self.run_job(self.last_encoding, lambda wav_bytes: self.save_wav(file_path, wav_bytes, format), "Encoding")
             else:
-                logging.debug("Source file does not exist.")
+                logging.debug("Nothing has been encoded yet.")
         else:
             logging.debug("File save operation canceled.")
 
+    def save_wav(self, file_path, wav_bytes, format='wav'):
+        self.last_encoded_wav = wav_bytes
+        audio_formats.convert_wav(wav_bytes, file_path, format)
+        logging.debug(f"File saved successfully to: {file_path} as {format}")
+
     def create_sound_file_button(self):
         sound_file_button = QPushButton("Select Sound File", self)
         sound_file_button.clicked.connect(self.select_sound_file)
@@ -314,14 +474,121 @@ class TextToSoundConverterApp(QWidget):
 
 
     def select_sound_file(self):
-        sound_file_path, _ = QFileDialog.getOpenFileName(self, "Select Sound File", "", "Sound Files (*.wav;*.mp3)")
+        sound_file_path, _ = QFileDialog.getOpenFileName(self, "Select Sound File", "", "Sound Files (*.wav *.mp3 *.flac *.opus)")
         if sound_file_path:
+            from recognize_text import recognize_text_with_progress
+
             self.selected_sound_file = sound_file_path
-            recognized_text = recognize_text_from_sound(sound_file_path, sound_type=self.get_sound_type())
-            self.text_to_type = recognized_text
             self.current_typing_pos = 0
-    
+            self.text_to_type = ""
+            try:
+                WavSource(sound_file_path)
+                # 16-bit WAV files are decoded live while they play
+                self.decode_while_playing = True
+            except ValueError:
+                self.decode_while_playing = False
+                sound_type = self.get_sound_type()
+                self.run_job(lambda report: recognize_text_with_progress(sound_file_path, sound_type, report),
+                             self.set_text_to_type, "Decoding")
+
+    def set_text_to_type(self, text):
+        self.text_to_type = text
+        if self.is_playing and not self.typing_timer.isActive():
+            # The file started playing before it was decoded, type along from here
+            self.type_text()
+
+    def create_progress_bar(self):
+        row = QHBoxLayout()
+        self.progress_bar = QProgressBar(self)
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.clicked.connect(self.cancel_job)
+        row.addWidget(self.progress_bar)
+        row.addWidget(self.cancel_button)
+        self.main_layout.addLayout(row)
+        self.show_progress(None)
+
+    def show_progress(self, label):
+        if label is None:
+            self.progress_bar.hide()
+            self.cancel_button.hide()
+        else:
+            self.progress_bar.setFormat(f"{label} %p%")
+            self.progress_bar.setValue(0)
+            self.progress_bar.show()
+            self.cancel_button.show()
+
+    def run_job(self, work, on_finished, label):
+        """ Run work(report) on the thread pool with its progress shown, on_finished(result) runs on the GUI thread """
+        self.cancel_job()
+        job = Job(work)
+        job.signals.progress.connect(self.progress_bar.setValue)
+        job.signals.finished.connect(lambda result: self.job_done(job, on_finished, result))
+        job.signals.failed.connect(lambda message: self.job_done(job))
+        job.signals.cancelled.connect(lambda: self.job_done(job))
+        self.job = job
+        self.show_progress(label)
+        self.thread_pool.start(job)
+
+    def job_done(self, job, on_finished=None, result=None):
+        if job is not self.job:
+            # Cancelled or replaced by a newer job, its result is no longer wanted
+            return
+        self.job = None
+        self.show_progress(None)
+        if on_finished is not None:
+            on_finished(result)
+        elif self.is_playing and self.player is None:
+            # Preparing playback failed
+            self.is_playing = False
+
+    def cancel_job(self):
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+            self.show_progress(None)
+            if self.is_playing and self.player is None:
+                self.is_playing = False
+
+    def create_listen_button(self):
+        self.listen_button = QPushButton("Listen to Microphone", self)
+        self.listen_button.clicked.connect(self.toggle_listening)
+        self.main_layout.addWidget(self.listen_button)
+
+    def toggle_listening(self):
+        listening = self.live_decoder is not None and isinstance(self.live_decoder.source, MicrophoneSource)
+        if listening and self.live_decoder.active:
+            self.stop_live_decoding()
+            return
+        self.stop_live_decoding()
+        self.text_entry.clear()
+        self.text_to_type = ""
+        self.current_typing_pos = 0
+        sound_type = self.get_sound_type()
+        # Opening the microphone and building the decoder happen on the pool, a failure is logged by the job
+        self.run_job(lambda report: LiveDecoder(MicrophoneSource(), sound_type), self.start_listening, "Preparing decoder")
+
+    def start_listening(self, decoder):
+        self.start_live_decoding(decoder)
+        self.listen_button.setText("Stop Listening")
+        self.type_text()
+
+    def start_live_decoding(self, decoder):
+        """ Start a decoder built on the pool, the glyph bank and frequency index take too long for the GUI thread """
+        # A decoder still running, say on the last file played, would keep reading its source
+        self.stop_live_decoding()
+        self.live_decoder = decoder.start()
+
+    def stop_live_decoding(self):
+        if self.live_decoder is not None:
+            # The decoder flushes what it has, the typewriter still types that out
+            self.live_decoder.stop()
+        self.listen_button.setText("Listen to Microphone")
+
     def type_text(self):
+        # Checked before taking the text, so the last text of a decoder that just finished is not missed
+        decoding = self.live_decoder is not None and self.live_decoder.active
+        if self.live_decoder is not None:
+            self.text_to_type += self.live_decoder.take_text()
         if self.current_typing_pos < len(self.text_to_type):
             next_char = self.text_to_type[self.current_typing_pos]
 
@@ -332,6 +599,9 @@ class TextToSoundConverterApp(QWidget):
                 self.typing_timer.start(self.gap_between_words)
             else:
                 self.typing_timer.start(self.duration_per_character)
+        elif decoding:
+            # Caught up with the decoder, look again for new text shortly
+            self.typing_timer.start(self.duration_per_character)
         else:
             # Stop the timer if the entire text has been typed out
             self.typing_timer.stop()
@@ -351,7 +621,10 @@ class TextToSoundConverterApp(QWidget):
 
 
 if __name__ == "__main__":
+    configure_logging()
+    configure_metrics()
     app = QApplication([])
+    app.aboutToQuit.connect(export_metrics)
     root = TextToSoundConverterApp()
     root.show()
     app.exec_()
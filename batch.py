@@ -0,0 +1,344 @@
+"""
+Headless batch encoding and decoding.
+
+    python -m audiocipher batch manifest.jsonl --workers 8 --output-dir out --results results.jsonl
+
+Every manifest row (JSON lines or CSV with the same column names) is either an encode job,
+{"text": ..., "type": "modulated" | "non_human" | "morse" | "parallel", "scale": ..., "output": ...},
+or a decode job, {"wav": ..., "type": ...}. Parallel rows may also set "bands" and "symbol_ms",
+a decode row the same values its audio was encoded with. Morse rows may set an integer "seed", so
+the same text always gets the same notes. Rows are spread over a pool of worker processes and
+their results are written in manifest order. With --timeout, a worker still on its chunk of rows
+--timeout seconds per row after starting it is terminated and replaced, and the rows it had not
+finished are reported as timed out.
+
+Encoded audio is written in --format (wav, mulaw, adpcm, flac or opus, see audio_formats), or in
+an encode row's own "format". It goes to disk block by block as it is encoded. Decode rows read
+any of these formats.
+
+With --cache-mb, repeated messages are encoded once per worker and then copied from a memory
+cache of that size; with --cache-dir they are kept on disk, shared by the workers and by later
+runs (see encode_cache). A cached message is held in memory whole, so the cache is off by default
+and messages over CACHE_MAX_CHARACTERS are always streamed. Morse rows without a seed are never cached.
+
+--metrics FILE collects the workers' timers and counters and writes them there at the end
+(Prometheus text for a .prom file, JSON lines otherwise). --profile-dir runs every row under
+cProfile and names its stats file in the row's result.
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+from collections import deque
+
+import audio_formats
+import encode_cache
+import glyph_bank
+import instrumentation
+from app_logging import configure_logging
+from instrumentation import configure_metrics
+from combining_sounds import iter_encode_pcm, resource_path
+from parallel_tones import DEFAULT_BANDS, DEFAULT_SYMBOL_MS, iter_parallel_pcm
+from recognize_text import recognize_text_from_sound
+from morse_playback import read_scales_from_file, morse_code_to_musical_sequence, iter_render_sequence
+
+DEFAULT_SCALE = 'C Major'
+CACHE_MAX_CHARACTERS = 1000  # Longer messages are streamed to their file even with the cache on
+
+_scales = None
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as file:
+        if manifest_path.lower().endswith('.csv'):
+            return [dict(row) for row in csv.DictReader(file)]
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def morse_scales():
+    global _scales
+    if _scales is None:
+        _scales = read_scales_from_file(resource_path(os.path.join('morse', 'scales_frequencies.txt')))
+    return _scales
+
+
+def parallel_options(item):
+    return int(item.get('bands') or DEFAULT_BANDS), int(item.get('symbol_ms') or DEFAULT_SYMBOL_MS)
+
+
+def morse_seed(item):
+    seed = item.get('seed')
+    return int(seed) if seed not in (None, '') else None
+
+
+def pcm_blocks(item):
+    """ (int16 blocks of an encode row's audio as they are produced, their frame rate and channels) """
+    sound_type = item.get('type') or 'modulated'
+    text = item['text']
+    if sound_type == 'parallel':
+        bands, symbol_ms = parallel_options(item)
+        return iter_parallel_pcm(text, bands, symbol_ms), 44100, 1
+    if sound_type == 'morse':
+        scale = morse_scales()[item.get('scale') or DEFAULT_SCALE]
+        sequence = morse_code_to_musical_sequence(text, scale, morse_seed(item))
+        return iter_render_sequence(sequence, scale), 44100, 1
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    return iter_encode_pcm(text, sound_type), bank.frame_rate, bank.channels
+
+
+def cached_item(cache, item, output_path, format='wav'):
+    """ encode_item through the encode cache, the whole message is held in memory """
+    sound_type = item.get('type') or 'modulated'
+    bands, symbol_ms = parallel_options(item)
+    scale = morse_scales()[item.get('scale') or DEFAULT_SCALE] if sound_type == 'morse' else None
+    options = {'scale': scale, 'seed': morse_seed(item), 'bands': bands, 'symbol_ms': symbol_ms}
+    samples, frame_rate, channels = cache.pcm(item['text'], sound_type, **options)
+    cache.write(item['text'], sound_type, output_path, format, **options)
+    return {'output': output_path, 'format': format, 'characters': len(item['text']),
+            'audio_seconds': len(samples) / channels / frame_rate, 'bytes': os.path.getsize(output_path)}
+
+
+def encode_item(item, output_path, format='wav'):
+    cache = encode_cache.get_cache()
+    if (cache is not None and len(item['text']) <= CACHE_MAX_CHARACTERS and
+            not (item.get('type') == 'morse' and morse_seed(item) is None)):
+        return cached_item(cache, item, output_path, format)
+    blocks, frame_rate, channels = pcm_blocks(item)
+    frames = 0
+    with audio_formats.open_writer(output_path, frame_rate, channels, format) as writer:
+        for block in blocks:
+            writer.write(block)
+            frames += len(block) // channels
+    return {'output': output_path, 'format': format, 'characters': len(item['text']),
+            'audio_seconds': frames / frame_rate, 'bytes': os.path.getsize(output_path)}
+
+
+def decode_item(item):
+    sound_type = item.get('type') or 'modulated'
+    bands, symbol_ms = parallel_options(item)
+    text = recognize_text_from_sound(item['wav'], sound_type, bands=bands, symbol_ms=symbol_ms)
+    return {'text': text, 'characters': len(text), 'bytes': os.path.getsize(item['wav'])}
+
+
+def run_item(index, item, output_dir, format='wav'):
+    try:
+        if item.get('text') is not None:
+            format = audio_formats.check_format(item.get('format') or format)
+            output_path = item.get('output') or os.path.join(output_dir, f"{index:06d}{audio_formats.extension_for(format)}")
+            with instrumentation.timer('batch.encode'):
+                result = encode_item(item, output_path, format)
+            result['op'] = 'encode'
+        elif item.get('wav'):
+            with instrumentation.timer('batch.decode'):
+                result = decode_item(item)
+            result['op'] = 'decode'
+        else:
+            raise ValueError("row has neither 'text' nor 'wav'")
+        result['status'] = 'ok'
+    except Exception as e:
+        logging.debug(f"Batch item {index} failed: {e}")
+        result = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    result['index'] = index
+    return result
+
+
+def profiled_item(index, item, output_dir, format='wav'):
+    with instrumentation.profiled(f"row-{index:06d}") as capture:
+        result = run_item(index, item, output_dir, format)
+    if capture.path:
+        result['profile'] = capture.path
+    return result
+
+
+def init_worker(metrics_setup, cache_setup):
+    instrumentation.configure_metrics(*metrics_setup)
+    encode_cache.configure_cache(*cache_setup)
+
+
+def worker_loop(connection, metrics_setup, cache_setup):
+    """
+    A worker process: runs the chunks sent over its pipe, sending back every row's result as it
+    finishes and the worker's metrics since its last chunk (None while they are off) after each chunk.
+    """
+    init_worker(metrics_setup, cache_setup)
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        start, items, output_dir, format = task
+        for offset, item in enumerate(items):
+            connection.send(('row', profiled_item(start + offset, item, output_dir, format)))
+        connection.send(('chunk', instrumentation.snapshot(reset=True)))
+
+
+class Worker:
+    """
+    One worker process and the chunk it is on. Each has a pipe of its own, so one that runs past
+    its deadline can be terminated without breaking anything the other workers use.
+    """
+    def __init__(self, setup):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_loop, args=(child_connection,) + setup, daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.chunk = None  # (first row, rows) of the chunk being run
+        self.finished = 0  # Rows of it sent back, they run in order
+        self.deadline = None
+
+    def assign(self, start, items, output_dir, format, timeout):
+        self.connection.send((start, items, output_dir, format))
+        self.chunk = (start, len(items))
+        self.finished = 0
+        # The clock starts when the worker gets the chunk, not while it waits for a free worker
+        self.deadline = None if timeout is None else time.monotonic() + timeout * len(items)
+
+    def unfinished(self):
+        start, count = self.chunk
+        return range(start + self.finished, start + count)
+
+    def receive(self, results):
+        """ Put the row results sent back so far into `results` by index """
+        try:
+            while self.connection.poll():
+                kind, payload = self.connection.recv()
+                if kind == 'row':
+                    results[payload['index']] = payload
+                    self.finished += 1
+                else:
+                    instrumentation.merge(payload)
+                    self.chunk = self.deadline = None
+        except (EOFError, OSError):
+            # The process is gone, run_batch finds out from its exit code
+            pass
+
+    def stop(self, kill=False):
+        if not kill and self.process.is_alive():
+            try:
+                self.connection.send(None)
+                self.process.join(1.0)
+            except OSError:
+                pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+
+def run_batch(items, output_dir, workers=None, chunksize=1, timeout=None, format='wav', cache_setup=(0,)):
+    """
+    Yield one result dict per manifest row, in manifest order. `timeout` is per row: a chunk that
+    has not finished within timeout * rows-in-chunk seconds of its worker starting on it has that
+    worker terminated and replaced, and only its rows without a result are reported as timed out.
+    Encode rows without a "format" of their own are written in `format`. `cache_setup` are the
+    workers' encode_cache.configure_cache arguments, the default turns caching off.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    chunksize = max(1, chunksize)
+    # Workers measure and profile like this process was set up to, their metrics come back with each chunk
+    metrics_setup = (instrumentation.enabled(), instrumentation.MemorySink(), instrumentation.profile_dir())
+    setup = (metrics_setup, cache_setup)
+    pending = deque((start, items[start:start + chunksize]) for start in range(0, len(items), chunksize))
+    pool = [Worker(setup) for _ in range(min(workers or os.cpu_count() or 1, len(pending)))]
+    results = {}
+    next_index = 0
+    try:
+        while next_index < len(items):
+            for slot, worker in enumerate(pool):
+                if worker.chunk is None and pending:
+                    if not worker.process.is_alive():
+                        worker.stop(kill=True)
+                        worker = pool[slot] = Worker(setup)
+                    worker.assign(*pending.popleft(), output_dir, format, timeout)
+            busy = [worker for worker in pool if worker.chunk is not None]
+            deadlines = [worker.deadline for worker in busy if worker.deadline is not None]
+            wait = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            multiprocessing.connection.wait([worker.connection for worker in busy] +
+                                            [worker.process.sentinel for worker in busy], wait)
+
+            for slot, worker in enumerate(pool):
+                if worker.chunk is None:
+                    continue
+                worker.receive(results)
+                if worker.chunk is None:
+                    continue
+                if not worker.process.is_alive():
+                    # The worker process died, the rows of its chunk it had not finished are lost
+                    error = f"worker process exited with code {worker.process.exitcode}"
+                    lost = {'status': 'error', 'error': error}
+                elif worker.deadline is not None and time.monotonic() >= worker.deadline:
+                    lost = {'status': 'timeout', 'error': f"no result within {timeout}s per item"}
+                    logging.debug(f"Batch rows {worker.unfinished()} timed out, replacing their worker")
+                else:
+                    continue
+                for index in worker.unfinished():
+                    results[index] = dict(lost, index=index)
+                worker.stop(kill=True)
+                worker.chunk = worker.deadline = None
+                if pending:
+                    pool[slot] = Worker(setup)
+
+            while next_index in results:
+                yield results.pop(next_index)
+                next_index += 1
+    finally:
+        for worker in pool:
+            worker.stop(kill=next_index < len(items))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='audiocipher batch', description="Encode or decode a manifest of messages in parallel.")
+    parser.add_argument('manifest', help="JSONL or CSV file with one encode or decode job per row")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--chunksize', type=int, default=4, help="rows handed to a worker at a time")
+    parser.add_argument('--timeout', type=float, default=None, help="seconds allowed per row")
+    parser.add_argument('--output-dir', default='batch_output', help="where encoded audio files are written")
+    parser.add_argument('--format', default='wav', choices=list(audio_formats.FORMATS),
+                        help="format of encoded audio, rows can set their own")
+    parser.add_argument('--results', default=None, help="JSONL file for per-row results (default: stdout)")
+    parser.add_argument('--metrics', default=None, help="write timers and counters here, Prometheus text for a .prom file")
+    parser.add_argument('--profile-dir', default=None, help="run every row under cProfile and keep the stats here")
+    parser.add_argument('--cache-mb', type=float, default=0, help="memory cache of encoded messages per worker, off by default")
+    parser.add_argument('--cache-dir', default=None, help="also keep encoded messages on disk here, across runs")
+    parser.add_argument('--cache-disk-mb', type=float, default=512, help="size the --cache-dir is evicted down to")
+    args = parser.parse_args(argv)
+    configure_logging()
+    configure_metrics(True if args.metrics else None,
+                      instrumentation.sink_for(args.metrics) if args.metrics else None, args.profile_dir)
+
+    items = load_manifest(args.manifest)
+    results_file = open(args.results, 'w', encoding='utf-8') if args.results else sys.stdout
+
+    counts = {'ok': 0, 'error': 0, 'timeout': 0}
+    characters = 0
+    audio_seconds = 0.0
+    started = time.perf_counter()
+    try:
+        cache_setup = (int(args.cache_mb * 2 ** 20), args.cache_dir, int(args.cache_disk_mb * 2 ** 20))
+        for result in run_batch(items, args.output_dir, args.workers, args.chunksize, args.timeout, args.format,
+                                cache_setup):
+            counts[result['status']] += 1
+            characters += result.get('characters', 0)
+            audio_seconds += result.get('audio_seconds', 0.0)
+            results_file.write(json.dumps(result) + "\n")
+    finally:
+        if results_file is not sys.stdout:
+            results_file.close()
+    elapsed = time.perf_counter() - started
+    instrumentation.export()
+
+    print(f"{len(items)} items in {elapsed:.2f}s with {args.workers} workers: "
+          f"{counts['ok']} ok, {counts['error']} failed, {counts['timeout']} timed out | "
+          f"{len(items) / elapsed if elapsed else 0:.1f} items/s, "
+          f"{characters / elapsed if elapsed else 0:.0f} chars/s, "
+          f"{audio_seconds:.1f}s of audio encoded", file=sys.stderr)
+
+    return 0 if counts['error'] == 0 and counts['timeout'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
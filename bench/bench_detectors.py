@@ -0,0 +1,62 @@
+""" Speed and accuracy of the FFT detector vs the Goertzel filter bank, clean and with added noise """
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_bank
+from combining_sounds import encode_pcm
+from recognize_text import recognize_text_from_samples
+from bench_encode import make_text
+
+
+def add_noise(samples, snr_db, seed=0):
+    if snr_db is None:
+        return samples
+    rng = np.random.default_rng(seed)
+    signal_power = np.mean(samples.astype(np.float64) ** 2)
+    noise = rng.normal(0, np.sqrt(signal_power / 10 ** (snr_db / 10)), len(samples))
+    return np.clip(samples + noise, -32768, 32767).astype(np.int16)
+
+
+def character_accuracy(expected, actual):
+    matches = sum(a == b for a, b in zip(expected, actual))
+    return matches / max(len(expected), len(actual), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--characters', type=int, default=5000)
+    parser.add_argument('--sound-types', nargs='+', default=['modulated', 'non_human'])
+    parser.add_argument('--snr-db', type=float, nargs='+', default=[None, 10, 0],
+                        help="noise levels to test, leave out for clean audio only")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    text = make_text(args.characters)
+    for sound_type in args.sound_types:
+        bank = glyph_bank.get_glyph_bank(sound_type)
+        clean = encode_pcm(text, sound_type)
+        expected = recognize_text_from_samples(clean, bank.frame_rate, sound_type)
+
+        for snr_db in args.snr_db:
+            samples = add_noise(clean, snr_db)
+            label = "clean" if snr_db is None else f"{snr_db:g} dB"
+            line = f"{sound_type:10s} {label:>7s}"
+            for detector in ('fft', 'goertzel'):
+                best = float('inf')
+                for _ in range(args.repeats):
+                    start = time.perf_counter()
+                    decoded = recognize_text_from_samples(samples, bank.frame_rate, sound_type, detector=detector)
+                    best = min(best, time.perf_counter() - start)
+                line += f"  {detector} {best * 1000:8.1f} ms  {character_accuracy(expected, decoded) * 100:6.2f}%"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
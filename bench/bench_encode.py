@@ -0,0 +1,73 @@
+""" Scaling benchmark for the text encoder: pydub appends vs the preallocated encode_pcm path """
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydub import AudioSegment
+
+import glyph_bank
+from combining_sounds import encode_pcm
+
+
+def make_text(num_characters, seed=0):
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    words = []
+    length = 0
+    while length < num_characters:
+        word = ''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 9)))
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:num_characters]
+
+
+def legacy_combining_sounds(text, bank):
+    # The previous algorithm: grow one AudioSegment with an append per glyph
+    sound_file = AudioSegment.silent(duration=0)
+    words = text.split()
+    for i, word in enumerate(words):
+        for letter in word:
+            new_sound = bank.segment(letter.lower())
+            if new_sound is not None:
+                sound_file = sound_file.append(new_sound, crossfade=0)
+        if i < len(words) - 1:
+            sound_file += bank.segment('gap')
+    return sound_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--sound-type', default='modulated')
+    parser.add_argument('--legacy-max', type=int, default=1000,
+                        help="largest size to also run through the quadratic append path")
+    args = parser.parse_args()
+
+    bank = glyph_bank.get_glyph_bank(args.sound_type)
+
+    for size in args.sizes:
+        text = make_text(size)
+
+        start = time.perf_counter()
+        samples = encode_pcm(text, args.sound_type)
+        linear = time.perf_counter() - start
+        line = f"{size:>7d} chars  encode_pcm {linear * 1000:9.1f} ms  ({samples.nbytes / 1e6:8.1f} MB)"
+
+        if size <= args.legacy_max:
+            start = time.perf_counter()
+            legacy = legacy_combining_sounds(text, bank)
+            quadratic = time.perf_counter() - start
+            assert legacy.raw_data == samples.tobytes()
+            line += f"  append {quadratic * 1000:9.1f} ms  speedup {quadratic / linear:6.1f}x"
+
+        print(line)
+        del samples
+
+
+if __name__ == "__main__":
+    main()
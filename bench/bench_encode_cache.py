@@ -0,0 +1,165 @@
+"""
+The encode cache under repeated traffic: a stream of requests drawn from a few message templates
+is encoded without the cache, through the memory tier and through the disk tier alone (a cache
+reading files an earlier one wrote, as another worker would).
+Checks that cached PCM and files equal what the encoders make, that a seeded Morse message comes
+out the same every time (and the same as seeding the random module did before), and that both
+tiers stay within their byte bounds while leaving files they did not write alone.
+Exits non-zero on any mismatch.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_formats
+import encode_cache
+import glyph_bank
+from encode_cache import EncodeCache, render
+from morse_playback import read_scales_from_file, morse_code_to_musical_sequence
+from bench_encode import make_text
+
+SOUND_TYPES = ('modulated', 'non_human', 'narrowband', 'parallel', 'morse')
+
+
+def request_stream(templates, requests, seed=0):
+    """ Indexes into the templates, a few of them far more often than the rest like real traffic """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(templates)]
+    return rng.choices(range(templates), weights, k=requests)
+
+
+def timed_run(encode, texts, stream):
+    started = time.perf_counter()
+    for index in stream:
+        encode(texts[index])
+    return time.perf_counter() - started
+
+
+def seed_checks(scale):
+    failures = 0
+    text = make_text(200)
+    first = morse_code_to_musical_sequence(text, scale, seed=7)
+    again = morse_code_to_musical_sequence(text, scale, seed=7)
+    other = morse_code_to_musical_sequence(text, scale, seed=8)
+    random.seed(7)
+    module_seeded = morse_code_to_musical_sequence(text, scale)
+    ok = first == again == module_seeded and first != other
+    failures += not ok
+    print(f"morse seed 7 gives the same notes every time, and not seed 8's {'ok' if ok else 'FAIL'}")
+    ok = encode_cache.cache_key(text, 'morse', scale) is None and encode_cache.cache_key(text, 'morse', scale, 7)
+    failures += not ok
+    print(f"morse without a seed is never cached {'ok' if ok else 'FAIL'}")
+    return failures
+
+
+def equality_checks(scale, folder):
+    """ Cached PCM and files against the encoders, for every sound type and both tiers """
+    failures = 0
+    text = make_text(300)
+    cache = EncodeCache(directory=os.path.join(folder, 'equality'))
+    for sound_type in SOUND_TYPES:
+        options = {'scale': scale, 'seed': 3} if sound_type == 'morse' else {}
+        expected, frame_rate, channels = render(text, sound_type, **options)
+        from_memory = cache.pcm(text, sound_type, **options)[0]
+        memory_hits = cache.stats['memory_hits']
+        again = cache.pcm(text, sound_type, **options)[0]
+        from_memory_ok = again is from_memory and cache.stats['memory_hits'] == memory_hits + 1
+        from_disk = EncodeCache(0, cache.directory).pcm(text, sound_type, **options)[0]
+        files_ok = True
+        for format in ('wav', 'mulaw', 'adpcm'):
+            written = audio_formats.write_audio(expected, frame_rate, None, channels, format)
+            with open(cache.path(text, sound_type, format, **options), 'rb') as file:
+                files_ok &= file.read() == written
+            files_ok &= cache.write(text, sound_type, None, format, **options) == written
+        ok = (np.array_equal(from_memory, expected) and np.array_equal(from_disk, expected) and from_memory_ok and
+              files_ok)
+        failures += not ok
+        print(f"{sound_type:10s} memory, disk and wav/mulaw/adpcm files equal the encoder {'ok' if ok else 'FAIL'}")
+    return failures
+
+
+def eviction_checks(folder, messages):
+    failures = 0
+    directory = os.path.join(folder, 'eviction')
+    os.makedirs(directory)
+    bystander = os.path.join(directory, 'notes.txt')
+    with open(bystander, 'w') as file:
+        file.write("not the cache's")
+
+    texts = [make_text(100, seed) for seed in range(messages)]
+    one_message = render(texts[0], 'modulated')[0].nbytes
+    # Room for about a fifth of the messages in either tier
+    bound = one_message * messages // 5
+    cache = EncodeCache(bound, directory, bound)
+    for text in texts:
+        cache.pcm(text, 'modulated')
+    on_disk = cache._disk_entries()
+    disk_used = sum(size for _, size, _ in on_disk)
+    ok = (cache._memory_used <= bound and disk_used <= bound and os.path.exists(bystander) and
+          0 < len(cache._memory) < messages and 0 < len(on_disk) < messages)
+    failures += not ok
+    print(f"eviction: {len(cache._memory)} messages in memory ({cache._memory_used / 2 ** 20:.2f} MiB), "
+          f"{len(on_disk)} on disk ({disk_used / 2 ** 20:.2f} MiB), bound {bound / 2 ** 20:.2f} MiB each, "
+          f"other files kept {'ok' if ok else 'FAIL'}")
+
+    # The most recently used messages are the ones still there
+    ok = all(cache._read_disk(encode_cache.cache_key(text, 'modulated')) is not None for text in texts[-len(on_disk):])
+    failures += not ok
+    print(f"eviction keeps the most recent messages {'ok' if ok else 'FAIL'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--templates', type=int, default=50, help="distinct messages in the traffic")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--characters', type=int, default=200, help="length of every message")
+    parser.add_argument('--morse-characters', type=int, default=40, help="length of every Morse message")
+    parser.add_argument('--format', default='wav', choices=list(audio_formats.FORMATS))
+    parser.add_argument('--eviction-messages', type=int, default=50)
+    args = parser.parse_args()
+
+    glyph_bank.preload(['modulated', 'non_human'])
+    scale = read_scales_from_file(os.path.join('morse', 'scales_frequencies.txt'))['C Major']
+    failures = seed_checks(scale)
+
+    with tempfile.TemporaryDirectory() as folder:
+        failures += equality_checks(scale, folder)
+        failures += eviction_checks(folder, args.eviction_messages)
+
+        stream = request_stream(args.templates, args.requests)
+        for sound_type in ('modulated', 'parallel', 'morse'):
+            options = {'scale': scale, 'seed': 1} if sound_type == 'morse' else {}
+            characters = args.morse_characters if sound_type == 'morse' else args.characters
+            texts = [make_text(characters, seed) for seed in range(args.templates)]
+            def encode(text):
+                samples, frame_rate, channels = render(text, sound_type, **options)
+                return audio_formats.write_audio(samples, frame_rate, None, channels, args.format)
+            uncached = timed_run(encode, texts, stream)
+            memory = EncodeCache()
+            with_memory = timed_run(lambda text: memory.write(text, sound_type, None, args.format, **options),
+                                    texts, stream)
+            # Written by one cache, read by a fresh one with no memory tier like another worker would
+            directory = os.path.join(folder, f"traffic-{sound_type}")
+            for text in texts:
+                EncodeCache(0, directory).write(text, sound_type, None, args.format, **options)
+            disk = EncodeCache(0, directory)
+            with_disk = timed_run(lambda text: disk.write(text, sound_type, None, args.format, **options), texts, stream)
+            print(f"{sound_type:10s} {args.requests} requests of {args.templates} messages as {args.format}: "
+                  f"uncached {uncached * 1000:8.1f} ms  memory {with_memory * 1000:8.1f} ms "
+                  f"({uncached / with_memory:5.1f}x)  disk {with_disk * 1000:8.1f} ms ({uncached / with_disk:5.1f}x)  "
+                  f"hits {memory.stats['memory_hits']} memory, {disk.stats['disk_hits']} disk")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
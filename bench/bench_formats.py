@@ -0,0 +1,171 @@
+"""
+Output formats side by side: file size against 16-bit WAV, encode and read-back times, and a
+round trip for every sound type, where a file has to decode to the same text as its WAV. Morse
+is the exception: its decoder already flips the odd character on noise 60 dB down, so up to
+--morse-tolerance of its characters may differ.
+Samples are checked too. WAV comes back bit-exact. u-law and IMA ADPCM have to match the
+stdlib audioop codecs where Python still has them, and their signal-to-noise ratio is reported.
+Writing a long message is run under tracemalloc: the writers hold blocks, not the whole file,
+so the peak has to stay under --max-peak-share of the size written. flac and opus are only run when ffmpeg is installed. Exits non-zero on any mismatch.
+"""
+import argparse
+import difflib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_formats
+import glyph_bank
+from combining_sounds import encode_audio, encode_pcm
+from morse_playback import morse_code_to_musical_sequence, read_scales_from_file, write_sequence
+from parallel_tones import encode_parallel_audio
+from recognize_text import recognize_text_from_sound
+from bench_encode import make_text
+
+def encoders(text, morse_text, scale):
+    """ {sound type: (write(destination, format), frame rate)} """
+    sequence = morse_code_to_musical_sequence(morse_text.upper(), scale)
+    result = {
+        'parallel': (lambda destination, format: encode_parallel_audio(text, destination=destination, format=format),
+                     44100),
+        'morse': (lambda destination, format: write_sequence(sequence, scale, destination, format), 44100),
+    }
+    for sound_type in ('modulated', 'non_human', 'narrowband'):
+        result[sound_type] = (lambda destination, format, s=sound_type: encode_audio(text, s, destination, format),
+                              glyph_bank.get_glyph_bank(sound_type).frame_rate)
+    return result
+
+
+def changed_share(expected, decoded):
+    matcher = difflib.SequenceMatcher(None, expected, decoded, autojunk=False)
+    return 1 - sum(block.size for block in matcher.get_matching_blocks()) / max(len(expected), 1)
+
+
+def snr_db(reference, samples):
+    error = samples.astype(float) - reference
+    return 10 * np.log10(np.mean(reference.astype(float) ** 2) / max(np.mean(error ** 2), 1e-12))
+
+
+def codec_checks(samples):
+    """ Sample-level checks of the NumPy codecs, against audioop when it is there """
+    failures = 0
+    written = audio_formats.write_audio(samples, 44100, format='wav')
+    exact = np.array_equal(audio_formats.read_audio(written)[0], samples)
+    failures += not exact
+    print(f"wav    read back bit-exact {'ok' if exact else 'FAIL'}")
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+    every_value = np.arange(-32768, 32768).astype(np.int16)
+    codes = audio_formats.mulaw_encode(every_value)
+    if audioop is not None:
+        ok = (np.array_equal(codes, np.frombuffer(audioop.lin2ulaw(every_value.tobytes(), 2), np.uint8)) and
+              np.array_equal(audio_formats.mulaw_decode(codes), np.frombuffer(audioop.ulaw2lin(codes.tobytes(), 2), '<i2')))
+        failures += not ok
+        print(f"mulaw  all 65536 values match audioop {'ok' if ok else 'FAIL'}")
+
+    per_block = audio_formats.adpcm_samples_per_block(audio_formats.adpcm_block_align(44100))
+    rows = samples[:len(samples) // per_block * per_block][:64 * per_block].reshape(-1, per_block)
+    first, index, codes = audio_formats.adpcm_encode_blocks(rows)
+    decoded = audio_formats.adpcm_decode_blocks(first, index, codes)
+    if audioop is not None and len(rows):
+        ok = True
+        for row in range(len(rows)):
+            state = (int(first[row]), int(index[row]))
+            packed, _ = audioop.lin2adpcm(rows[row, 1:].tobytes(), 2, state)
+            nibbles = np.frombuffer(packed, np.uint8)
+            # audioop puts the first code in the high nibble
+            expected = np.stack((nibbles >> 4, nibbles & 0x0F), axis=1).reshape(-1)[:per_block - 1]
+            reference = np.frombuffer(audioop.adpcm2lin(packed, 2, state)[0], '<i2')[:per_block - 1]
+            ok &= np.array_equal(expected, codes[row]) and np.array_equal(reference, decoded[row, 1:])
+        failures += not ok
+        print(f"adpcm  {len(rows)} blocks match audioop {'ok' if ok else 'FAIL'}")
+
+    for format in ('mulaw', 'adpcm'):
+        read_back = audio_formats.read_audio(audio_formats.write_audio(samples, 44100, format=format))[0]
+        ok = len(read_back) == len(samples)
+        failures += not ok
+        print(f"{format:6s} {len(read_back)} of {len(samples)} samples back, SNR {snr_db(samples, read_back):5.1f} dB "
+              f"{'ok' if ok else 'FAIL'}")
+    return failures
+
+
+def streaming_peak(text, format, folder):
+    """ Peak traced memory while a message is written to disk block by block """
+    path = os.path.join(folder, f"long-{format}{audio_formats.extension_for(format)}")
+    tracemalloc.start()
+    encode_audio(text, 'modulated', path, format)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--morse-characters', type=int, default=200)
+    parser.add_argument('--morse-tolerance', type=float, default=0.01, help="share of Morse characters allowed to differ")
+    parser.add_argument('--long-characters', type=int, default=20000, help="message size for the memory check")
+    parser.add_argument('--max-peak-share', type=float, default=0.1,
+                        help="largest peak traced memory while streaming, as a share of the file written")
+    parser.add_argument('--formats', nargs='*', default=None, help="default: every format this machine can write")
+    args = parser.parse_args()
+
+    formats = args.formats or [format for format in audio_formats.FORMATS
+                               if format not in audio_formats.FFMPEG_CODECS or shutil.which('ffmpeg')]
+    # Every other format is measured against WAV
+    formats = ['wav'] + [format for format in formats if format != 'wav']
+    glyph_bank.preload(['modulated', 'non_human'])
+    scale = read_scales_from_file(os.path.join('morse', 'scales_frequencies.txt'))['C Major']
+    text = make_text(args.characters)
+    failures = codec_checks(encode_pcm(text, 'modulated'))
+
+    with tempfile.TemporaryDirectory() as folder:
+        morse_text = make_text(args.morse_characters)
+        for sound_type, (write, frame_rate) in encoders(text, morse_text, scale).items():
+            expected = None
+            wav_size = None
+            for format in formats:
+                path = os.path.join(folder, f"{sound_type}-{format}{audio_formats.extension_for(format)}")
+                started = time.perf_counter()
+                write(path, format)
+                encode_seconds = time.perf_counter() - started
+                started = time.perf_counter()
+                read_back = audio_formats.read_audio(path)[0]
+                read_seconds = time.perf_counter() - started
+                decoded = recognize_text_from_sound(path, sound_type)
+                size = os.path.getsize(path)
+                if format == 'wav':
+                    # The WAV's text is what every other format has to give back
+                    expected, wav_size = decoded, size
+                changed = changed_share(expected, decoded)
+                ok = changed <= (args.morse_tolerance if sound_type == 'morse' else 0)
+                failures += not ok
+                print(f"{sound_type:10s} {format:6s} {size / 2 ** 20:7.2f} MiB  {size / wav_size:6.1%} of wav  "
+                      f"encode {encode_seconds * 1000:7.1f} ms  read {read_seconds * 1000:7.1f} ms  "
+                      f"{len(read_back) / frame_rate:6.1f} s  text {'ok' if ok else 'DIFFERS'}"
+                      f"{f' ({changed:.1%} changed)' if changed else ''}")
+
+        long_text = make_text(args.long_characters)
+        for format in [format for format in ('wav', 'mulaw', 'adpcm') if format in formats]:
+            peak, size = streaming_peak(long_text, format, folder)
+            ok = peak <= args.max_peak_share * size
+            failures += not ok
+            print(f"streaming {format:6s} {size / 2 ** 20:7.2f} MiB written, peak {peak / 2 ** 20:6.2f} MiB in memory, "
+                  f"{peak / size:5.1%} of the file {'ok' if ok else 'FAIL'}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+""" Glyph bank load time from a directory of WAV files vs from a single glyph pack """
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+import glyph_bank
+import glyph_pack
+
+
+def time_load(sound_type, repeats=20):
+    best = float('inf')
+    for _ in range(repeats):
+        glyph_bank.invalidate(sound_type)
+        start = time.perf_counter()
+        glyph_bank.get_glyph_bank(sound_type)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder:
+        # Work on a copy so the packs do not end up in the repository
+        os.chdir(folder)
+        for sound_type in ('modulated', 'non_human', 'beeps'):
+            shutil.copytree(os.path.join(REPO, sound_type), sound_type)
+            wavs = time_load(sound_type)
+            glyph_pack.convert_directory(sound_type)
+            pack = time_load(sound_type)
+            print(f"{sound_type:10s} WAV files {wavs * 1000:7.2f} ms   pack {pack * 1000:7.2f} ms   "
+                  f"speedup {wavs / pack:5.1f}x")
+        os.chdir(REPO)
+
+
+if __name__ == "__main__":
+    main()
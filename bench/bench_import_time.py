@@ -0,0 +1,76 @@
+"""
+Import time of the audiocipher modules, measured with `python -X importtime` in a fresh interpreter.
+Exits non-zero when a module is over its budget or pulls in a backend it should load lazily.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget in milliseconds (cumulative import time) and modules that must not be loaded by the import
+BUDGETS = {
+    'combining_sounds': (100, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'glyph_bank': (100, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'wav_reader': (50, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'morse_playback': (100, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'streaming_playback': (50, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'live_decoding': (50, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'instrumentation': (20, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'parallel_tones': (30, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'alphabet_profile': (20, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'audio_formats': (30, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'encode_cache': (30, ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')),
+    'recognize_text': (400, ('pydub', 'pygame', 'scipy', 'PyQt5')),
+    'batch': (500, ('pygame', 'scipy', 'PyQt5')),
+    'server': (600, ('pygame', 'scipy', 'PyQt5')),
+    'audiocipher': (800, ('numpy', 'pygame', 'scipy')),
+}
+WATCHED = ('numpy', 'pydub', 'pygame', 'scipy', 'PyQt5')
+
+
+def measure(module, repeats):
+    """ Best cumulative import time in ms over `repeats` runs, and the watched packages it loaded """
+    check = f"import sys, {module}; print(','.join(m for m in {WATCHED!r} if m in sys.modules))"
+    best = None
+    loaded = []
+    for _ in range(repeats):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', check], cwd=REPO,
+                                capture_output=True, text=True, env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1'))
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        for line in result.stderr.splitlines():
+            parts = [part.strip() for part in line.split('|')]
+            if len(parts) == 3 and parts[2] == module:
+                cumulative = int(parts[1]) / 1000
+                best = cumulative if best is None else min(best, cumulative)
+        loaded = [name for name in result.stdout.strip().split(',') if name]
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS))
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    failures = 0
+    for module in args.modules:
+        budget, forbidden = BUDGETS.get(module, (None, ()))
+        elapsed, loaded = measure(module, args.repeats)
+        if elapsed is None:
+            print(f"{module:18s} skipped: {loaded}")
+            continue
+        over = budget is not None and elapsed > budget
+        unexpected = [name for name in loaded if name in forbidden]
+        status = "FAIL" if over or unexpected else "ok"
+        failures += status == "FAIL"
+        print(f"{module:18s} {elapsed:8.1f} ms  budget {budget if budget else '-':>4} ms  "
+              f"loads {', '.join(loaded) or 'nothing heavy':24s} {status}"
+              + (f"  (should not load {', '.join(unexpected)})" if unexpected else ""))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
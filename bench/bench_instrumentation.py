@@ -0,0 +1,146 @@
+"""
+Cost of the instrumentation hooks. Measures a disabled hook per call against a plain function
+call, then an encode + decode workload with metrics off and on, and writes the three sinks to a
+temporary folder as a smoke test. The workload runs in pairs, off then on and on then off, and
+the slowdown is the median of the pairs' ratios, allowed --max-overhead plus the pairs' own
+spread (their median absolute deviation), so one noisy run cannot fail it. Exits non-zero, after
+naming the checks that failed, when a disabled hook costs more than --budget-ns per call or
+enabled metrics slow the workload down by more than that.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_bank
+import instrumentation
+from combining_sounds import encode_pcm, encode_wav
+from recognize_text import recognize_text_from_samples
+from bench_encode import make_text
+
+
+def added_ns(statement, baseline, number=200000, repeats=9):
+    """ Per call cost of statement over baseline, best of runs that alternate between the two """
+    best = best_baseline = float('inf')
+    for _ in range(repeats):
+        best_baseline = min(best_baseline, timeit.timeit(baseline, number=number))
+        best = min(best, timeit.timeit(statement, number=number))
+    return (best - best_baseline) / number * 1e9
+
+
+def hook_costs():
+    def plain():
+        pass
+
+    timed_plain = instrumentation.timed('bench.plain')(plain)
+
+    def with_timer():
+        with instrumentation.timer('bench.timer'):
+            pass
+
+    return {
+        'timed decorator': added_ns(timed_plain, plain),
+        'timer block': added_ns(with_timer, plain),
+        'count': added_ns(lambda: instrumentation.count('bench.count'), plain),
+        'peak': added_ns(lambda: instrumentation.peak('bench.peak', 1), plain),
+    }
+
+
+def workload(text):
+    start = time.perf_counter()
+    for sound_type in ('modulated', 'non_human'):
+        samples = encode_pcm(text, sound_type)
+        encode_wav(text, sound_type)
+        recognize_text_from_samples(samples, 44100, sound_type)
+    return time.perf_counter() - start
+
+
+def compare_workload(text, repeats, profile_dir):
+    """
+    Workload times with metrics off and on, one pair per repeat. Every other pair runs on first,
+    so a machine speeding up or slowing down over the run favours neither side.
+    """
+    pairs = []
+    for repeat in range(repeats):
+        times = {}
+        for enabled in ((False, True) if repeat % 2 == 0 else (True, False)):
+            if enabled:
+                instrumentation.configure_metrics(enabled=True, profile_dir=profile_dir)
+            else:
+                instrumentation.configure_metrics(enabled=False)
+            times[enabled] = workload(text)
+        pairs.append((times[False], times[True]))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--characters', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=9, help="workload pairs with metrics off and on")
+    parser.add_argument('--budget-ns', type=float, default=500, help="allowed cost of a disabled hook per call")
+    parser.add_argument('--max-overhead', type=float, default=0.05, help="allowed slowdown with metrics on, as a ratio")
+    args = parser.parse_args()
+
+    glyph_bank.preload(['modulated', 'non_human'])
+    text = make_text(args.characters)
+    failed = []
+
+    instrumentation.configure_metrics(enabled=False)
+    for hook, cost in hook_costs().items():
+        ok = cost <= args.budget_ns
+        if not ok:
+            failed.append(f"disabled {hook} costs {cost:.0f} ns per call, over the {args.budget_ns:.0f} ns budget")
+        print(f"disabled {hook:16s} {cost:7.0f} ns per call   {'ok' if ok else 'FAIL'}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        pairs = compare_workload(text, args.repeats, os.path.join(folder, 'profiles'))
+        ratios = [on / off - 1 for off, on in pairs]
+        overhead = statistics.median(ratios)
+        noise = statistics.median(abs(ratio - overhead) for ratio in ratios)
+        ok = overhead <= args.max_overhead + noise
+        if not ok:
+            failed.append(f"metrics slow the workload down by {overhead:+.1%}, over {args.max_overhead:.1%} "
+                          f"plus {noise:.1%} noise")
+        off = statistics.median(off for off, on in pairs)
+        on = statistics.median(on for off, on in pairs)
+        print(f"workload {args.characters} chars x2 sound types, median of {len(pairs)} pairs: metrics off "
+              f"{off * 1000:.1f} ms, on {on * 1000:.1f} ms ({overhead * 100:+.1f}% +- {noise * 100:.1f}%)   "
+              f"{'ok' if ok else 'FAIL'}")
+
+        with instrumentation.profiled('bench workload') as capture:
+            workload(text)
+        snapshot = instrumentation.snapshot()
+        for sink in (instrumentation.MemorySink(), instrumentation.JsonLinesSink(os.path.join(folder, 'metrics.jsonl')),
+                     instrumentation.PrometheusSink(os.path.join(folder, 'metrics.prom'))):
+            sink.write(snapshot)
+        with open(os.path.join(folder, 'metrics.jsonl')) as file:
+            exported = json.loads(file.readline())
+        with open(os.path.join(folder, 'metrics.prom')) as file:
+            prometheus = file.read()
+        ok = (exported['timers'] == snapshot['timers'] and 'audiocipher_encode_concatenate_seconds_count' in prometheus
+              and capture.path is not None and os.path.getsize(capture.path) > 0)
+        if not ok:
+            failed.append("the sinks or the profile capture did not write what was recorded")
+        print(f"sinks and profile capture {'ok' if ok else 'FAIL'}")
+        for name, timing in sorted(snapshot['timers'].items()):
+            print(f"  {name:24s} {timing['count']:6d} calls  {timing['seconds'] * 1000:9.2f} ms  "
+                  f"max {timing['max_seconds'] * 1000:8.2f} ms")
+        for name, value in sorted(snapshot['counters'].items()):
+            print(f"  {name:24s} {value}")
+        for name, value in sorted(snapshot['peaks'].items()):
+            print(f"  {name:24s} peak {value / 2 ** 20:.2f} MiB")
+
+    for failure in failed:
+        print(f"FAILED: {failure}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Live decoding of encoded audio fed block by block, as a microphone would deliver it.
+Checks that the text matches the batch decoder (for Morse, which is decoded again at every pause,
+that it has the same words), reports the CPU spent per block against the block's duration and how
+long after its glyph ended the text comes out. Exits non-zero when the text differs or a block takes
+longer than it lasts.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_bank
+from combining_sounds import encode_pcm, resource_path
+from morse_playback import read_scales_from_file, morse_code_to_musical_sequence, render_sequence
+from recognize_text import recognize_text_from_samples, stream_decoder
+from bench_encode import make_text
+
+
+def live_decode(samples, sample_rate, sound_type, block_frames):
+    """ Feed samples block by block, returns (text, seconds per block, delays in seconds) """
+    decoder = stream_decoder(sound_type, sample_rate)
+    text = ""
+    block_seconds = []
+    delays = []
+    for start in range(0, len(samples), block_frames):
+        began = time.perf_counter()
+        piece = decoder.feed(samples[start:start + block_frames])
+        block_seconds.append(time.perf_counter() - began)
+        text += piece
+        if piece and getattr(decoder, 'position', None) is not None:
+            # The last window decoded ends at the grid position, the block ending now delivered it
+            delays.append((start + block_frames - decoder.position) / sample_rate)
+    text += decoder.flush()
+    return text, np.array(block_seconds), delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--characters', type=int, default=2000)
+    parser.add_argument('--block-frames', type=int, default=1024)
+    parser.add_argument('--leading-silence', type=float, default=0.37,
+                        help="seconds of silence before the message, so the grid does not start at sample 0")
+    args = parser.parse_args()
+
+    glyph_bank.preload(['modulated', 'non_human'])
+    scale = read_scales_from_file(resource_path(os.path.join('morse', 'scales_frequencies.txt')))['C Major']
+    text = make_text(args.characters)
+    failures = 0
+
+    for sound_type in ('modulated', 'non_human', 'morse'):
+        if sound_type == 'morse':
+            random.seed(0)
+            message = text[:300].upper()
+            samples = render_sequence(morse_code_to_musical_sequence(message, scale), scale)
+            sample_rate = 44100
+        else:
+            samples = encode_pcm(text, sound_type)
+            sample_rate = glyph_bank.get_glyph_bank(sound_type).frame_rate
+        padded = np.concatenate((np.zeros(int(args.leading_silence * sample_rate), dtype=np.int16), samples))
+        expected = recognize_text_from_samples(padded, sample_rate, sound_type)
+        decoded, block_seconds, delays = live_decode(padded, sample_rate, sound_type, args.block_frames)
+
+        block_duration = args.block_frames / sample_rate
+        if sound_type == 'morse':
+            identical = len(decoded.split()) == len(expected.split())
+        else:
+            identical = decoded == expected
+        ok = identical and block_seconds.max() < block_duration
+        failures += not ok
+        # Morse text only comes out at word pauses
+        delay = f"{np.median(delays) * 1000:6.0f} ms" if delays else "     -   "
+        print(f"{sound_type:10s} {len(block_seconds):6d} blocks of {block_duration * 1000:4.1f} ms   "
+              f"cpu mean {block_seconds.mean() * 1000:5.2f} ms  worst {block_seconds.max() * 1000:5.2f} ms   "
+              f"real time x{block_duration / block_seconds.mean():6.0f}   median text delay {delay}   "
+              f"text {'matches' if identical else 'DIFFERS'}   {'ok' if ok else 'FAIL'}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Throughput of parallel-tone encoding for a range of band counts and symbol durations, against the
+100 ms single-tone glyphs. Every layout is round-tripped clean and again with leading silence,
+a start cut mid frame and white noise at --snr dB; exits non-zero when the decoded text differs.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_bank
+from combining_sounds import encode_pcm
+from parallel_tones import get_layout, encode_parallel_pcm
+from recognize_text import recognize_text_from_samples
+from bench_encode import make_text
+
+LAYOUTS = [(1, 100), (1, 20), (2, 20), (4, 20), (6, 20), (2, 10), (3, 10), (8, 50)]
+
+
+def degrade(samples, snr, frame_length, seed=0, leading=0.37, cut=0.25, sample_rate=44100):
+    """
+    Leading silence, the first `cut` of a frame gone and white noise at `snr` dB. Nothing is added
+    after the message, its last frame ends where the audio does.
+    """
+    rng = np.random.default_rng(seed)
+    noisy = np.concatenate((np.zeros(int(leading * sample_rate)), samples[int(cut * frame_length):])).astype(float)
+    noisy += rng.normal(0, samples.std() / 10 ** (snr / 20), len(noisy))
+    return np.clip(noisy, -32768, 32767).astype(np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--characters', type=int, default=5000)
+    parser.add_argument('--snr', type=float, default=10)
+    args = parser.parse_args()
+
+    text = make_text(args.characters)
+    glyph_bank.preload(['modulated'])
+    glyph_seconds = len(encode_pcm(text, 'modulated')) / 44100
+    print(f"modulated glyphs    {glyph_seconds:8.1f} s of audio  {args.characters / glyph_seconds:6.1f} chars/s")
+    failures = 0
+
+    for bands, symbol_ms in LAYOUTS:
+        layout = get_layout(bands, symbol_ms)
+        expected = layout.normalize(text)
+        started = time.perf_counter()
+        samples = encode_parallel_pcm(text, bands, symbol_ms)
+        encode_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        clean = recognize_text_from_samples(samples, 44100, 'parallel', bands=bands, symbol_ms=symbol_ms)
+        decode_seconds = time.perf_counter() - started
+        noisy = recognize_text_from_samples(degrade(samples, args.snr, layout.frame_length), 44100, 'parallel',
+                                            bands=bands, symbol_ms=symbol_ms)
+        # The cut removes part of the first frame, its characters may still come through or not
+        noisy_ok = noisy == expected or noisy == expected[bands:]
+        ok = clean == expected and noisy_ok
+        failures += not ok
+        audio_seconds = len(samples) / 44100
+        print(f"{bands} bands x {symbol_ms:3d} ms  {audio_seconds:8.1f} s of audio  "
+              f"{len(expected) / audio_seconds:6.1f} chars/s  top {layout.frequencies.max():6.0f} Hz   "
+              f"encode {encode_seconds * 1000:6.1f} ms  decode {decode_seconds * 1000:6.1f} ms   "
+              f"clean {'ok' if clean == expected else 'DIFFERS'}  {args.snr:g} dB {'ok' if noisy_ok else 'DIFFERS'}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Alphabet profiles side by side: glyph synthesis time, the WAV size of a message, encode and
+decode times with both detectors, and a round trip through a WAV file. Exits non-zero when a
+profile does not decode back to its text.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_bank
+from alphabet_profile import PROFILES
+from combining_sounds import encode_pcm, encode_wav
+from recognize_text import recognize_text_from_samples, recognize_text_from_sound
+from bench_encode import make_text
+
+
+def expected_text(text):
+    return ' '.join(text.lower().split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('profiles', nargs='*', default=['modulated', 'narrowband', 'studio'])
+    parser.add_argument('--characters', type=int, default=2000)
+    args = parser.parse_args()
+
+    text = make_text(args.characters)
+    expected = expected_text(text)
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as folder:
+        for name in args.profiles:
+            profile = PROFILES[name]
+            started = time.perf_counter()
+            bank = glyph_bank.get_glyph_bank(name)
+            load_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            samples = encode_pcm(text, name)
+            encode_seconds = time.perf_counter() - started
+            path = os.path.join(folder, f"{name}.wav")
+            encode_wav(text, name, path)
+
+            results = []
+            for detector in ('fft', 'goertzel'):
+                started = time.perf_counter()
+                decoded = recognize_text_from_samples(samples, bank.frame_rate, name, detector=detector)
+                results.append((detector, time.perf_counter() - started, decoded == expected))
+            from_file = recognize_text_from_sound(path, name) == expected
+            ok = from_file and all(result for _, _, result in results)
+            failures += not ok
+
+            print(f"{name:11s} {profile.sample_rate:6d} Hz {profile.symbol_ms:4d} ms  "
+                  f"{'synthesized' if profile.synthesized else 'files':11s} load {load_seconds * 1000:7.1f} ms  "
+                  f"wav {os.path.getsize(path) / 2 ** 20:7.2f} MiB  encode {encode_seconds * 1000:6.1f} ms  " +
+                  '  '.join(f"{detector} {seconds * 1000:6.1f} ms" for detector, seconds, _ in results) +
+                  f"   {'ok' if ok else 'DIFFERS'}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+Time to first audio of streaming playback vs encoding the whole message first.
+Runs headless through NullSink, checks that the streamed PCM equals the batch encoder's
+output and exits non-zero if the first audio takes longer than --budget-ms.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import glyph_bank
+from combining_sounds import encode_wav, encode_pcm, resource_path
+from morse_playback import read_scales_from_file, morse_code_to_musical_sequence, render_sequence
+from streaming_playback import NullSink, PygameSink, stream_text, stream_morse
+from bench_encode import make_text
+
+
+def played(player):
+    player.wait(timeout=600)
+    return np.concatenate(player.sink.played) if player.sink.played else np.empty(0, dtype=np.int16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 20000])
+    parser.add_argument('--budget-ms', type=float, default=50)
+    parser.add_argument('--pygame', action='store_true', help="also stream through PygameSink (SDL_AUDIODRIVER=dummy works)")
+    args = parser.parse_args()
+
+    glyph_bank.preload(['modulated', 'non_human'])
+    scale = read_scales_from_file(resource_path(os.path.join('morse', 'scales_frequencies.txt')))['C Major']
+    failures = 0
+
+    for size in args.sizes:
+        text = make_text(size)
+        for sound_type in ('modulated', 'non_human', 'morse'):
+            start = time.perf_counter()
+            if sound_type == 'morse':
+                sequence = morse_code_to_musical_sequence(text, scale)
+                expected = render_sequence(sequence, scale)
+            else:
+                encode_wav(text, sound_type)
+                expected = encode_pcm(text, sound_type)
+            batch_first_audio = time.perf_counter() - start
+
+            sink = NullSink(keep=True)
+            if sound_type == 'morse':
+                player = stream_morse(sequence, scale, sink)
+            else:
+                player = stream_text(text, sound_type, sink)
+            output = played(player)
+
+            latency = player.first_audio_latency or 0.0
+            identical = np.array_equal(output, expected)
+            ok = identical and latency * 1000 <= args.budget_ms
+            failures += not ok
+            print(f"{size:>7d} chars {sound_type:10s} streaming first audio {latency * 1000:7.2f} ms   "
+                  f"encode-then-play {batch_first_audio * 1000:9.1f} ms   "
+                  f"pcm {'identical' if identical else 'DIFFERS'}   {'ok' if ok else 'FAIL'}")
+
+    if args.pygame:
+        player = stream_text(make_text(200), 'modulated', PygameSink())
+        player.wait(timeout=60)
+        print(f"pygame sink: first audio {player.first_audio_latency * 1000:.2f} ms, "
+              f"{player.frames_played} frames, {player.underruns} underruns")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
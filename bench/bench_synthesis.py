@@ -0,0 +1,42 @@
+""" Compare BeepGenerator against NumpyBeepGenerator on a full glyph bank """
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from creating_sounds import BeepGenerator, NumpyBeepGenerator
+
+
+def build_bank(generator_class, folder, use_modulation=False, count=64):
+    base_frequency = 500
+    for index in range(count):
+        bg = generator_class()
+        bg.append_sinewave(freq=base_frequency, volume=0.5, duration_milliseconds=100, use_modulation=use_modulation)
+        bg.save_wav(os.path.join(folder, f"{index}.wav"))
+        base_frequency += 10
+
+
+def time_bank(generator_class, use_modulation, repeats=3):
+    best = float('inf')
+    with tempfile.TemporaryDirectory() as folder:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            build_bank(generator_class, folder, use_modulation)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    for use_modulation in (False, True):
+        label = "fm" if use_modulation else "plain"
+        reference = time_bank(BeepGenerator, use_modulation)
+        vectorized = time_bank(NumpyBeepGenerator, use_modulation)
+        print(f"{label:6s} BeepGenerator {reference * 1000:8.1f} ms   "
+              f"NumpyBeepGenerator {vectorized * 1000:8.1f} ms   "
+              f"speedup {reference / vectorized:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+""" Load test for server.py: hammer a running server with encode/decode requests and report latency """
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from combining_sounds import encode_wav
+
+
+async def request(reader, writer, host, path, body):
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, jobs, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            path, body = jobs.pop()
+            started = time.perf_counter()
+            status = await request(reader, writer, host, path, body)
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def make_jobs(count, decode_ratio, seed=0):
+    rng = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    jobs = []
+    for _ in range(count):
+        text = ' '.join(''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 8))) for _ in range(rng.randint(1, 6)))
+        if rng.random() < decode_ratio:
+            jobs.append(("/decode?type=modulated", encode_wav(text, 'modulated')))
+        else:
+            sound_type = rng.choice(['modulated', 'non_human'])
+            jobs.append((f"/encode?type={sound_type}", text.encode('utf-8')))
+    return jobs
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    jobs = make_jobs(args.requests, args.decode_ratio)
+    latencies = []
+    statuses = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, jobs, latencies, statuses) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(latencies)} requests in {elapsed:.2f}s with {args.concurrency} connections: "
+          f"{len(latencies) / elapsed:.1f} req/s, "
+          f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+          f"statuses {dict(sorted(statuses.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--decode-ratio', type=float, default=0.3, help="share of requests that are decodes")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
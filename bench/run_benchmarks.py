@@ -0,0 +1,297 @@
+"""
+Benchmark suite for the encode, decode, synthesis and I/O paths.
+
+Every case is timed over a few repeats, then run once more under tracemalloc for its peak
+Python/NumPy allocation. Inputs are generated here from fixed seeds, so two runs measure the
+same work. Results go out as JSON; with --compare an earlier result file is read back and the
+run fails when a case got slower (or hungrier) than the tolerance allows.
+
+    python bench/run_benchmarks.py --output results.json
+    python bench/run_benchmarks.py --filter decode --compare results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(REPO)
+
+import numpy as np
+
+import glyph_bank
+import glyph_pack
+import wav_reader
+from combining_sounds import combining_sounds, encode_pcm, encode_wav, write_wav, resource_path
+from creating_sounds import BeepGenerator, NumpyBeepGenerator
+from parallel_tones import encode_parallel_pcm
+from morse_playback import (read_scales_from_file, morse_code_to_musical_sequence, generate_audio_from_sequence,
+                            render_sequence, tone_samples)
+from recognize_text import analyze_audio, analyze_samples, decode_morse_samples, decode_parallel_samples
+from bench_encode import make_text
+
+SEED = 0
+
+
+class Case:
+    """ One benchmark: setup() builds the inputs outside the timing, run(inputs) is what gets measured """
+    def __init__(self, name, run, setup=None, params=None, repeats=None):
+        self.name = name
+        self.run = run
+        self.setup = setup or (lambda: None)
+        self.params = params or {}
+        self.repeats = repeats
+
+
+def measure(case, repeats):
+    """ Best and median seconds over `repeats` runs, and the tracemalloc peak in bytes of one more run """
+    repeats = case.repeats or repeats
+    timings = []
+    for _ in range(repeats):
+        inputs = case.setup()
+        start = time.perf_counter()
+        case.run(inputs)
+        timings.append(time.perf_counter() - start)
+
+    inputs = case.setup()
+    tracemalloc.start()
+    try:
+        case.run(inputs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'best_s': min(timings), 'median_s': statistics.median(timings), 'repeats': repeats, 'peak_bytes': peak}
+
+
+def synthesis_cases(scratch):
+    cases = []
+    for generator_class in (BeepGenerator, NumpyBeepGenerator):
+        for use_modulation in (False, True):
+            def synthesize(_, generator_class=generator_class, use_modulation=use_modulation):
+                generator = generator_class()
+                for index in range(64):
+                    generator.append_sinewave(freq=500 + 10 * index, volume=0.5, duration_milliseconds=100,
+                                              use_modulation=use_modulation)
+                return generator
+
+            label = 'fm' if use_modulation else 'plain'
+            cases.append(Case(f"synthesis/{generator_class.__name__}/{label}", synthesize,
+                              params={'glyphs': 64, 'modulation': use_modulation}))
+
+        def save(generator, generator_class=generator_class):
+            generator.save_wav(os.path.join(scratch, f"{generator_class.__name__}.wav"))
+
+        def one_second(generator_class=generator_class):
+            generator = generator_class()
+            generator.append_sinewave(freq=500, volume=0.5, duration_milliseconds=1000)
+            return generator
+
+        cases.append(Case(f"synthesis/{generator_class.__name__}/save_wav", save, one_second, {'seconds': 1}))
+    return cases
+
+
+def encode_cases(sizes):
+    cases = []
+    for size in sizes:
+        text = make_text(size, SEED)
+        for sound_type in ('modulated', 'non_human', 'narrowband'):
+            params = {'characters': size, 'sound_type': sound_type}
+            cases.append(Case(f"encode/encode_pcm/{sound_type}/{size}", lambda _, t=text, s=sound_type: encode_pcm(t, s),
+                              params=params))
+            cases.append(Case(f"encode/encode_wav/{sound_type}/{size}", lambda _, t=text, s=sound_type: encode_wav(t, s),
+                              params=params))
+        cases.append(Case(f"encode/encode_parallel_pcm/{size}", lambda _, t=text: encode_parallel_pcm(t),
+                          params={'characters': size, 'sound_type': 'parallel'}))
+        # The pydub path appends segment by segment, it is only run on the smaller messages
+        if size <= 10000:
+            cases.append(Case(f"encode/combining_sounds/modulated/{size}",
+                              lambda _, t=text: combining_sounds(t, 'modulated'),
+                              params={'characters': size, 'sound_type': 'modulated'}, repeats=1 if size > 1000 else None))
+    return cases
+
+
+def morse_sequence(message, scale):
+    random.seed(SEED)
+    return morse_code_to_musical_sequence(message, scale)
+
+
+def sequence_cases(scales, characters):
+    message = make_text(characters, SEED).upper()
+    cases = []
+    for name, scale in scales.items():
+        sequence = morse_sequence(message, scale)
+        params = {'scale': name, 'characters': characters, 'notes': len(sequence)}
+        cases.append(Case(f"morse/generate_audio_from_sequence/{name}",
+                          lambda _, q=sequence, s=scale: generate_audio_from_sequence(q, s), params=params))
+        # The tone cache is cleared so every run renders its notes
+        cases.append(Case(f"morse/render_sequence/{name}", lambda _, q=sequence, s=scale: render_sequence(q, s),
+                          setup=tone_samples.cache_clear, params=params))
+    return cases
+
+
+def decode_cases(characters, morse_characters, scale):
+    cases = []
+    for sound_type in ('modulated', 'non_human', 'narrowband'):
+        bank = glyph_bank.get_glyph_bank(sound_type)
+        sound_map = {k: bank.segment(k) for k in bank.glyphs}
+        samples = encode_pcm(make_text(characters, SEED), sound_type)
+        params = {'characters': characters, 'sound_type': sound_type}
+        for detector in ('fft', 'goertzel'):
+            cases.append(Case(f"decode/analyze_samples/{detector}/{sound_type}",
+                              lambda _, x=samples, r=bank.frame_rate, m=sound_map, s=sound_type, d=detector:
+                              analyze_samples(x, r, m, s, detector=d), params=params))
+
+        # The per-segment pydub decoder is slow, it gets a tenth of the message
+        short = encode_pcm(make_text(characters // 10, SEED), sound_type)
+        segment = bank.segment(next(iter(bank.glyphs)))._spawn(short.tobytes())
+        cases.append(Case(f"decode/analyze_audio/{sound_type}",
+                          lambda _, a=segment, m=sound_map, s=sound_type: analyze_audio(a, m, s),
+                          params={'characters': characters // 10, 'sound_type': sound_type}, repeats=1))
+
+    parallel_samples = encode_parallel_pcm(make_text(characters, SEED))
+    cases.append(Case("decode/decode_parallel_samples", lambda _, x=parallel_samples: decode_parallel_samples(x, 44100),
+                      params={'characters': characters, 'sound_type': 'parallel'}))
+
+    message = make_text(morse_characters, SEED).upper()
+    morse_samples = render_sequence(morse_sequence(message, scale), scale)
+    cases.append(Case("decode/decode_morse_samples", lambda _, x=morse_samples: decode_morse_samples(x, 44100),
+                      params={'characters': morse_characters, 'seconds': round(len(morse_samples) / 44100, 1)}))
+    return cases
+
+
+def io_cases(scratch, characters):
+    samples = encode_pcm(make_text(characters, SEED), 'modulated')
+    path = os.path.join(scratch, 'message.wav')
+    write_wav(samples, 44100, path)
+    params = {'characters': characters, 'megabytes': round(samples.nbytes / 2 ** 20, 1)}
+
+    def read_with_wave(_):
+        import wave
+        with wave.open(path, 'rb') as wav_file:
+            return np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+
+    def read_with_pydub(_):
+        from pydub import AudioSegment
+        return AudioSegment.from_wav(path)
+
+    pack_folder = os.path.join(scratch, 'packs')
+    os.makedirs(pack_folder, exist_ok=True)
+    pack_path = os.path.join(pack_folder, 'modulated.glyphs')
+    bank = glyph_bank.get_glyph_bank('modulated')
+    glyph_pack.write_pack(pack_path, {**bank.glyphs, 'gap': bank.gap}, bank.frame_rate, bank.channels)
+
+    return [
+        Case("io/write_wav", lambda _: write_wav(samples, 44100, path), params=params),
+        Case("io/wav_reader", lambda _: int(wav_reader.open_wav(path).samples.sum(dtype=np.int64)), params=params),
+        Case("io/wave_module", read_with_wave, params=params),
+        Case("io/pydub_from_wav", read_with_pydub, params=params),
+        Case("io/glyph_pack_load", lambda _: glyph_pack.open_pack(pack_path), params={'glyphs': len(bank.glyphs)}),
+        Case("io/glyph_wav_directory_load", lambda _: glyph_bank.GlyphBank('modulated').load_wavs(),
+             params={'glyphs': len(bank.glyphs)}),
+    ]
+
+
+def build_cases(args, scratch):
+    scales = read_scales_from_file(resource_path(os.path.join('morse', 'scales_frequencies.txt')))
+    if args.quick:
+        scales = dict(list(scales.items())[:2])
+    cases = []
+    cases += synthesis_cases(scratch)
+    cases += encode_cases(args.sizes)
+    cases += sequence_cases(scales, args.morse_characters)
+    cases += decode_cases(args.decode_characters, args.morse_characters, scales['C Major'])
+    cases += io_cases(scratch, args.decode_characters)
+    return [case for case in cases if not args.filter or any(part in case.name for part in args.filter)]
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def regressions(results, baseline, tolerance, min_seconds):
+    """
+    Cases that got slower or use more memory than `tolerance` (a ratio) allows compared to the baseline.
+    Slowdowns under `min_seconds` are timer noise on the quick cases and are not reported.
+    """
+    previous = {case['name']: case for case in baseline['cases']}
+    found = []
+    for case in results['cases']:
+        before = previous.get(case['name'])
+        if before is None:
+            continue
+        for key in ('best_s', 'peak_bytes'):
+            if key == 'best_s' and case[key] - before[key] < min_seconds:
+                continue
+            if before[key] and case[key] > before[key] * (1 + tolerance):
+                found.append(f"{case['name']}: {key} {before[key]:.6g} -> {case[key]:.6g} "
+                             f"(+{100 * (case[key] / before[key] - 1):.0f}%)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--filter', nargs='+', help="only run cases whose name contains one of these")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help="message sizes in characters for the encoders")
+    parser.add_argument('--decode-characters', type=int, default=5000)
+    parser.add_argument('--morse-characters', type=int, default=200)
+    parser.add_argument('--quick', action='store_true', help="smaller inputs and two scales, for a smoke run")
+    parser.add_argument('--compare', help="earlier JSON results to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown as a ratio, 0.25 = 25%%")
+    parser.add_argument('--min-seconds', type=float, default=0.005, help="slowdowns smaller than this are ignored")
+    args = parser.parse_args()
+    if args.quick:
+        args.sizes = [100, 1000]
+        args.decode_characters = 500
+        args.morse_characters = 50
+        args.repeats = min(args.repeats, 2)
+
+    glyph_bank.preload(['modulated', 'non_human', 'narrowband'])
+    results = {'environment': environment(), 'cases': []}
+    with tempfile.TemporaryDirectory() as scratch:
+        for case in build_cases(args, scratch):
+            measured = measure(case, args.repeats)
+            results['cases'].append({'name': case.name, 'params': case.params, **measured})
+            print(f"{case.name:55s} best {measured['best_s'] * 1000:10.2f} ms   "
+                  f"peak {measured['peak_bytes'] / 2 ** 20:8.2f} MiB", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            found = regressions(results, json.load(file), args.tolerance, args.min_seconds)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
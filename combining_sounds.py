@@ -1,12 +1,23 @@
-import logging
+import sys, os
+import io
+import wave
+import audio_formats
+import glyph_bank
+import instrumentation
 
-# Setup logging
-logging.basicConfig(filename='app.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# numpy, pydub and pygame are imported on first use, so importing this module stays
+# cheap and never starts an audio backend
+_np = None
 
-# Rest of your imports
-from pydub import AudioSegment
-import pygame
-import sys, os
+
+def _numpy():
+    """ numpy, imported the first time an encoder needs it """
+    global _np
+    if _np is None:
+        import numpy
+
+        _np = numpy
+    return _np
 
 
 def resource_path(relative_path):
@@ -72,45 +83,166 @@ def mapping_sounds(sound_type):
     return sounds
 
 
-def combining_sounds(text, sound_type):
-    sound_file = AudioSegment.silent(duration=0)
+@instrumentation.timed('encode.concatenate')
+def encode_pcm(text, sound_type):
+    """ Encode text into a single int16 PCM array, sized up front from the glyph lengths """
+    np = _numpy()
 
-    # Correctly resolve the path for gap.wav using resource_path
-    gap_sound_path = resource_path(os.path.join(sound_type, 'gap.wav')) #.2 second gap
+    bank = glyph_bank.get_glyph_bank(sound_type)
 
+    pieces = []
+    words = text.split()
+    for i, word in enumerate(words):
+        for letter in word:
+            samples = bank.get(letter.lower())
+            if samples is not None:
+                pieces.append(samples)
+
+        # Add gap/silence between words, never after the last one
+        if i < len(words) - 1 and bank.gap is not None:
+            pieces.append(bank.gap)
+
+    total_samples = sum(len(piece) for piece in pieces)
+    buffer = np.empty(total_samples, dtype=np.int16)
+    position = 0
+    for piece in pieces:
+        buffer[position:position + len(piece)] = piece
+        position += len(piece)
+
+    instrumentation.add_bytes('encode.concatenate', buffer.nbytes)
+    instrumentation.peak('encode.buffer', buffer.nbytes)
+    return buffer
+
+
+def iter_encode_pcm(text, sound_type, max_glyphs=8, progress=None):
+    """
+    encode_pcm a word at a time, for streaming: yields each word's glyphs (at most `max_glyphs`
+    per block, so one huge word cannot hold up the first block) followed by the word gap.
+    Joined together the blocks are exactly encode_pcm(text, sound_type).
+    `progress(words done, words)` is called after every word.
+    """
+    np = _numpy()
+
+    bank = glyph_bank.get_glyph_bank(sound_type)
     words = text.split()
     for i, word in enumerate(words):
-        for j, letter in enumerate(word):
-            file_path = mapping_sounds(sound_type).get(letter.lower())
-            if file_path:
-                try:
-                    new_sound = AudioSegment.from_wav(file_path)
-                    sound_file = sound_file.append(new_sound, crossfade=0)
-                except Exception as e:
-                    logging.debug(f"Error loading sound for letter '{letter}': {e}")
+        pieces = [samples for samples in (bank.get(letter.lower()) for letter in word) if samples is not None]
+        if i < len(words) - 1 and bank.gap is not None:
+            pieces.append(bank.gap)
+        for start in range(0, len(pieces), max_glyphs):
+            block = np.concatenate(pieces[start:start + max_glyphs])
+            instrumentation.add_bytes('encode.stream', block.nbytes)
+            yield block
+        if progress is not None:
+            progress(i + 1, len(words))
+
+
+def combining_sounds(text, sound_type):
+    from pydub import AudioSegment
+
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    samples = encode_pcm(text, sound_type)
+
+    if len(samples) == 0:
+        return AudioSegment.silent(duration=0)
+
+    return AudioSegment(
+        data=samples.tobytes(),
+        sample_width=bank.sample_width,
+        frame_rate=bank.frame_rate,
+        channels=bank.channels)
+
+
+@instrumentation.timed('wav.write')
+def write_wav(samples, frame_rate, destination=None, channels=1):
+    """
+    Write int16 samples as a WAV file to a path or a file object. Without a destination
+    the WAV file is returned as bytes, so nothing has to touch the disk.
+    """
+    np = _numpy()
+
+    target = io.BytesIO() if destination is None else destination
+    wav_file = wave.open(target, 'wb')
+    wav_file.setnchannels(channels)
+    wav_file.setsampwidth(2)
+    wav_file.setframerate(frame_rate)
+    data = np.asarray(samples, dtype='<i2').tobytes()
+    wav_file.writeframes(data)
+    wav_file.close()
+    instrumentation.add_bytes('wav.write', len(data))
+    return target.getvalue() if destination is None else destination
+
+
+def encode_wav(text, sound_type, destination=None):
+    """ Encode text straight to WAV, returned as bytes or written to a caller supplied path / file object """
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    return write_wav(encode_pcm(text, sound_type), bank.frame_rate, destination, bank.channels)
+
+
+def encode_audio(text, sound_type, destination=None, format='wav'):
+    """
+    Encode text in one of audio_formats.FORMATS, written a word at a time as it is encoded.
+    Returned as bytes, or written to a caller supplied path / file object.
+    """
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    return audio_formats.write_audio(iter_encode_pcm(text, sound_type), bank.frame_rate, destination,
+                                     bank.channels, format)
+
+
+@instrumentation.timed('audio.export')
+def export_audio(sound_file, destination=None, format='wav'):
+    """ export_wav for any of audio_formats.FORMATS """
+    np = _numpy()
+
+    if format == 'wav':
+        return export_wav(sound_file, destination)
+    samples = np.frombuffer(sound_file.set_sample_width(2).raw_data, dtype='<i2')
+    return audio_formats.write_audio(samples, sound_file.frame_rate, destination, sound_file.channels, format)
+
+
+@instrumentation.timed('wav.export')
+def export_wav(sound_file, destination=None):
+    """ Export an AudioSegment as WAV bytes, or to a caller supplied path / file object """
+    if destination is None:
+        buffer = io.BytesIO()
+        sound_file.export(buffer, format="wav")
+        return buffer.getvalue()
+    if isinstance(destination, (str, os.PathLike)):
+        with open(destination, 'wb') as file:
+            sound_file.export(file, format="wav")
+    else:
+        sound_file.export(destination, format="wav")
+    return destination
+
 
-            # Check if it's the last letter of the last word
-            if i == len(words) - 1 and j == len(word) - 1:
-                break  # Skip adding gap/silence after the last letter
+# pygame streams music from the file object while it plays, so keep the buffer alive
+_playback_buffer = None
 
-        # Add gap/silence between words
-        if i < len(words) - 1:
-            sound_file += AudioSegment.from_wav(gap_sound_path)
 
-    # Adjust the volume of the entire final sound file
-    sound_file = sound_file
+def mixer():
+    """ Import pygame and start its mixer on first use """
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    with instrumentation.timer('playback.mixer_init'):
+        import pygame
 
-    return sound_file
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+    return pygame.mixer
 
 
-import pygame
+def play_wav_bytes(wav_bytes):
+    global _playback_buffer
+    music = mixer().music
+    _playback_buffer = io.BytesIO(wav_bytes)
+    with instrumentation.timer('playback.mixer_load'):
+        music.load(_playback_buffer, 'wav')
+    instrumentation.add_bytes('playback.mixer_load', len(wav_bytes))
+    music.play()
 
 
-def play_sound(sound_file, sound_type):
-    if not pygame.mixer.get_init():
-        pygame.mixer.init()
+def play_sound(sound_file, sound_type=None):
+    """ Play an AudioSegment from memory and return its WAV bytes so the caller can save them later """
     if sound_file:
-        final_sound_path = resource_path(os.path.join(sound_type, 'final.wav'))
-        sound_file.export(final_sound_path, format="wav")
-        pygame.mixer.music.load(final_sound_path)
-        pygame.mixer.music.play()
\ No newline at end of file
+        wav_bytes = export_wav(sound_file)
+        play_wav_bytes(wav_bytes)
+        return wav_bytes
@@ -1,13 +1,15 @@
 import math
 import wave
 import struct
-from playsound import playsound
 import os 
+import numpy as np
+import glyph_pack
+import instrumentation
 
 class BeepGenerator:
-    def __init__(self):
+    def __init__(self, sample_rate=44100.0):
         self.audio = []
-        self.sample_rate = 44100.0
+        self.sample_rate = float(sample_rate)
 
     def append_silence(self, duration_milliseconds=500):
         num_samples = duration_milliseconds * (self.sample_rate / 1000.0)
@@ -63,27 +65,140 @@ class BeepGenerator:
         wav_file.close()
 
         return    
-def generate_sounds(sound_folder, base_frequency, text_characters, symbol_filenames, text_symbols, use_modulation=False):
-    if not os.path.exists(sound_folder):
+
+
+class NumpyBeepGenerator:
+    """ Drop-in replacement for BeepGenerator that synthesizes whole tones with NumPy """
+    def __init__(self, capacity=0, sample_rate=44100.0):
+        self.sample_rate = float(sample_rate)
+        # Samples live in a preallocated int16 buffer, only the first `length` are valid
+        self._buffer = np.zeros(int(capacity), dtype=np.int16)
+        self._length = 0
+
+    @property
+    def audio(self):
+        return self._buffer[:self._length]
+
+    def reserve(self, num_samples):
+        # Grow the buffer geometrically so repeated appends stay linear
+        needed = self._length + int(num_samples)
+        if needed > len(self._buffer):
+            new_buffer = np.zeros(max(needed, 2 * len(self._buffer)), dtype=np.int16)
+            new_buffer[:self._length] = self._buffer[:self._length]
+            self._buffer = new_buffer
+
+    def _append_samples(self, samples):
+        self.reserve(len(samples))
+        # Same scaling and truncation towards zero as BeepGenerator.save_wav
+        self._buffer[self._length:self._length + len(samples)] = (samples * 32767.0).astype(np.int16)
+        self._length += len(samples)
+        instrumentation.peak('synthesis.buffer', self._buffer.nbytes)
+
+    def append_silence(self, duration_milliseconds=500):
+        num_samples = int(duration_milliseconds * (self.sample_rate / 1000.0))
+        self.reserve(num_samples)
+        self._buffer[self._length:self._length + num_samples] = 0
+        self._length += num_samples
+
+        return
+
+    @instrumentation.timed('synthesis.sinewave')
+    def append_sinewave(
+            self,
+            freq,
+            duration_milliseconds=100,
+            volume=1.0,
+            use_modulation=False,
+            modulator_freq=5.0,
+            modulation_factor=5.0):
+
+        num_samples = int(duration_milliseconds * (self.sample_rate / 1000.0))
+        t = np.arange(num_samples) / self.sample_rate
+
+        if use_modulation:
+            # Same FM formula as BeepGenerator, evaluated for every sample at once
+            modulator = np.sin(2 * np.pi * modulator_freq * t)
+            current_frequency = freq + modulation_factor * modulator
+            samples = volume * np.sin(2 * np.pi * current_frequency * t)
+        else:
+            samples = volume * np.sin(2 * np.pi * freq * t)
+
+        self._append_samples(samples)
+
+        return
+
+    def save_wav(self, file_name):
+        wav_file = wave.open(file_name, "w")
+
+        nchannels = 1
+
+        sampwidth = 2
+
+        nframes = self._length
+        comptype = "NONE"
+        compname = "not compressed"
+        wav_file.setparams((nchannels, sampwidth, self.sample_rate, nframes, comptype, compname))
+
+        # Single bulk write of the little-endian int16 payload
+        data = self.audio.astype('<i2').tobytes()
+        wav_file.writeframes(data)
+        instrumentation.add_bytes('synthesis.save_wav', len(data))
+
+        wav_file.close()
+
+        return
+
+
+def profile_glyphs(profile):
+    """ Synthesize an alphabet_profile.AlphabetProfile's glyphs in memory, returns ({character: samples}, gap samples) """
+    def tone(frequency, duration_milliseconds):
+        bg = NumpyBeepGenerator(sample_rate=profile.sample_rate)
+        bg.append_sinewave(freq=frequency, volume=profile.volume, duration_milliseconds=duration_milliseconds,
+                           use_modulation=profile.use_modulation)
+        return bg.audio.copy()
+
+    glyphs = {char: tone(frequency, profile.symbol_ms) for char, frequency in profile.frequencies().items()}
+    return glyphs, tone(profile.gap_tone, profile.gap_ms)
+
+
+def generate_sounds(sound_folder, base_frequency, text_characters, symbol_filenames, text_symbols, use_modulation=False,
+                    pack_path=None, write_wavs=True, duration_milliseconds=100, sample_rate=44100.0):
+    """
+    Generate one glyph per character into sound_folder. With `pack_path` the glyphs are also
+    written as a single glyph pack, see glyph_pack.py; `write_wavs=False` skips the WAV files.
+    """
+    if write_wavs and not os.path.exists(sound_folder):
         os.makedirs(sound_folder)
 
+    glyphs = {}
+
+    def save(bg, name, filename):
+        glyphs[name] = bg.audio.copy()
+        if write_wavs:
+            bg.save_wav(f"{sound_folder}/{filename}.wav")
+
     for character in text_characters:
-        bg = BeepGenerator()
-        bg.append_sinewave(freq=base_frequency, volume=0.5, duration_milliseconds=100, use_modulation=use_modulation)
-        bg.save_wav(f"{sound_folder}/{character}.wav")
+        bg = NumpyBeepGenerator(sample_rate=sample_rate)
+        bg.append_sinewave(freq=base_frequency, volume=0.5, duration_milliseconds=duration_milliseconds,
+                           use_modulation=use_modulation)
+        save(bg, character, character)
         base_frequency += 10
 
     for symbol in text_symbols:
-        bg = BeepGenerator()
-        bg.append_sinewave(freq=base_frequency, volume=0.5, duration_milliseconds=100, use_modulation=use_modulation)
+        bg = NumpyBeepGenerator(sample_rate=sample_rate)
+        bg.append_sinewave(freq=base_frequency, volume=0.5, duration_milliseconds=duration_milliseconds,
+                           use_modulation=use_modulation)
         base_frequency += 10
         filename = symbol_filenames.get(symbol, f"unknown_symbol_{ord(symbol)}")
-        bg.save_wav(f"{sound_folder}/{filename}.wav")
+        save(bg, symbol, filename)
 
     # Generate silence separately
-    bg = BeepGenerator()
-    bg.append_silence(duration_milliseconds=200)
-    bg.save_wav(f"{sound_folder}/silence.wav")
+    bg = NumpyBeepGenerator(sample_rate=sample_rate)
+    bg.append_silence(duration_milliseconds=2 * duration_milliseconds)
+    save(bg, 'silence', 'silence')
+
+    if pack_path:
+        glyph_pack.write_pack(pack_path, glyphs, int(bg.sample_rate))
 
 
 if __name__ == "__main__": 
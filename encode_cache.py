@@ -0,0 +1,317 @@
+"""
+Content-addressed cache of encoded messages, so repeated ones (templates, status codes) are not
+synthesized again. The key is a sha256 of everything the samples depend on: the text, the sound
+type, its alphabet profile and glyphs, the Morse scale and seed, the parallel bands and symbol_ms.
+
+Two tiers:
+
+    memory   an LRU of read-only int16 arrays and encoded files, bounded in bytes, per process
+    disk     a directory of files named by key and format, bounded in bytes and shared between
+             processes; the least recently used files are deleted first
+
+    cache = EncodeCache(directory='encode_cache', disk_bytes=512 * 2 ** 20)
+    samples, frame_rate, channels = cache.pcm('status ok', 'modulated')
+    file_path = cache.path('status ok', 'modulated', format='adpcm')
+
+Morse without a seed gets random notes, it is encoded every time and never stored.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import instrumentation
+
+# Part of every key, bump it when the encoders change what they output for the same input
+CACHE_VERSION = 1
+DEFAULT_MEMORY_BYTES = 64 * 2 ** 20
+DEFAULT_DISK_BYTES = 512 * 2 ** 20
+TEMP_SUFFIX = '.tmp'
+KEY_LENGTH = 64  # Hex digits of a sha256
+
+_cache = None
+
+
+def cache_key(text, sound_type, scale=None, seed=None, bands=None, symbol_ms=None):
+    """ Hex sha256 of an encode request, None when its output is random (Morse without a seed) """
+    import hashlib
+    import json
+
+    parts = {'version': CACHE_VERSION, 'text': text, 'type': sound_type}
+    if sound_type == 'morse':
+        if seed is None:
+            return None
+        parts.update(scale=list(scale.items()), seed=seed)
+    elif sound_type == 'parallel':
+        from parallel_tones import DEFAULT_BANDS, DEFAULT_SYMBOL_MS
+
+        parts.update(bands=bands or DEFAULT_BANDS, symbol_ms=symbol_ms or DEFAULT_SYMBOL_MS)
+    else:
+        import alphabet_profile
+        import glyph_bank
+
+        parts.update(profile=vars(alphabet_profile.get_profile(sound_type)),
+                     glyphs=glyph_bank.get_glyph_bank(sound_type).digest())
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def render(text, sound_type, scale=None, seed=None, bands=None, symbol_ms=None):
+    """ Encode without the cache, returns (int16 samples, frame_rate, channels) """
+    if sound_type == 'morse':
+        from morse_playback import morse_code_to_musical_sequence, render_sequence
+
+        return render_sequence(morse_code_to_musical_sequence(text, scale, seed), scale), 44100, 1
+    if sound_type == 'parallel':
+        from parallel_tones import DEFAULT_BANDS, DEFAULT_SYMBOL_MS, encode_parallel_pcm
+
+        return encode_parallel_pcm(text, bands or DEFAULT_BANDS, symbol_ms or DEFAULT_SYMBOL_MS), 44100, 1
+    import glyph_bank
+    from combining_sounds import encode_pcm
+
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    return encode_pcm(text, sound_type), bank.frame_rate, bank.channels
+
+
+class EncodeCache:
+    """
+    Both tiers of the cache. Without a `directory` there is only the memory tier, with
+    memory_bytes=0 only the disk one. Safe to share between threads.
+    """
+    def __init__(self, memory_bytes=DEFAULT_MEMORY_BYTES, directory=None, disk_bytes=DEFAULT_DISK_BYTES):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'uncached': 0}
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def pcm(self, text, sound_type, scale=None, seed=None, bands=None, symbol_ms=None):
+        """ (read-only int16 samples, frame_rate, channels) of a message, encoded only if no tier has it """
+        request = (text, sound_type, scale, seed, bands, symbol_ms)
+        return self._pcm(cache_key(*request), request)
+
+    def path(self, text, sound_type, format='wav', scale=None, seed=None, bands=None, symbol_ms=None):
+        """
+        Path of the message's file in `format` in the disk tier, written if it is not there yet.
+        The file may be evicted later on, copy it rather than keeping the path.
+        """
+        import audio_formats
+
+        audio_formats.check_format(format)
+        if not self.directory:
+            raise ValueError("the cache has no directory to keep files in")
+        request = (text, sound_type, scale, seed, bands, symbol_ms)
+        key = cache_key(*request)
+        if key is None:
+            raise ValueError("Morse needs a seed for its audio to be cached")
+        return self._path(key, request, format)
+
+    def write(self, text, sound_type, destination=None, format='wav', scale=None, seed=None, bands=None,
+              symbol_ms=None):
+        """ Like audio_formats.write_audio: the message in `format`, as bytes or to a path / file object """
+        import audio_formats
+
+        audio_formats.check_format(format)
+        request = (text, sound_type, scale, seed, bands, symbol_ms)
+        key = cache_key(*request)
+        if key is None:
+            samples, frame_rate, channels = self._pcm(key, request)
+            return audio_formats.write_audio(samples, frame_rate, destination, channels, format)
+
+        data = self._recall((key, format))
+        if data is not None:
+            self._hit('memory_hits')
+        elif self.directory:
+            with open(self._path(key, request, format), 'rb') as file:
+                data = file.read()
+        else:
+            # Only the encoded bytes are kept, the samples would take the room of several more messages
+            samples, frame_rate, channels = self._pcm(key, request, remember=False)
+            data = audio_formats.write_audio(samples, frame_rate, None, channels, format)
+        self._remember((key, format), data, len(data))
+
+        if destination is None:
+            return data
+        if isinstance(destination, (str, os.PathLike)):
+            with open(destination, 'wb') as file:
+                file.write(data)
+        else:
+            destination.write(data)
+        return destination
+
+    def _pcm(self, key, request, remember=True):
+        if key is None:
+            self._hit('uncached')
+            return render(*request)
+
+        entry = self._recall((key, 'pcm'))
+        if entry is not None:
+            self._hit('memory_hits')
+            return entry
+
+        entry = self._read_disk(key)
+        if entry is not None:
+            self._hit('disk_hits')
+        else:
+            self._hit('misses')
+            samples, frame_rate, channels = render(*request)
+            samples.setflags(write=False)  # Handed out to every later caller
+            entry = (samples, frame_rate, channels)
+            if self.directory:
+                self._write_disk(key, 'wav', entry)
+        if remember:
+            self._remember((key, 'pcm'), entry, entry[0].nbytes)
+        return entry
+
+    def _path(self, key, request, format):
+        file_path = self._file_path(key, format)
+        if self._touch(file_path):
+            self._hit('disk_hits')
+            return file_path
+        entry = self._pcm(key, request)
+        # A miss has just written the WAV, a memory hit may have outlived it on disk
+        if format == 'wav' and self._touch(file_path):
+            return file_path
+        return self._write_disk(key, format, entry)
+
+    def clear(self):
+        """ Empty the memory tier and delete every file of the disk tier """
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        for file_path, _, _ in self._disk_entries():
+            _remove(file_path)
+
+    def _hit(self, kind):
+        with self._lock:
+            self.stats[kind] += 1
+        instrumentation.count('cache.' + kind)
+
+    def _recall(self, memory_key):
+        """ A value of the memory tier, (key, 'pcm') for samples or (key, format) for a file's bytes """
+        with self._lock:
+            entry = self._memory.get(memory_key)
+            if entry is None:
+                return None
+            self._memory.move_to_end(memory_key)
+            return entry[0]
+
+    def _remember(self, memory_key, value, size):
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            if memory_key in self._memory:
+                self._memory.move_to_end(memory_key)
+                return
+            self._memory[memory_key] = (value, size)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, (_, evicted) = self._memory.popitem(last=False)
+                self._memory_used -= evicted
+                instrumentation.count('cache.memory_evictions')
+        instrumentation.peak('cache.memory', self._memory_used)
+
+    def _file_path(self, key, format):
+        import audio_formats
+
+        return os.path.join(self.directory, f"{key}-{format}{audio_formats.extension_for(format)}")
+
+    def _touch(self, file_path):
+        """ Mark a file as just used, False if it is not there (never written, or evicted) """
+        try:
+            os.utime(file_path)
+            return True
+        except OSError:
+            return False
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        import numpy as np
+        import audio_formats
+
+        file_path = self._file_path(key, 'wav')
+        if not self._touch(file_path):
+            return None
+        try:
+            samples, frame_rate, channels = audio_formats.read_audio(file_path)
+        except (OSError, ValueError) as e:
+            import logging
+
+            # Evicted by another process between the touch and the read, or cut short
+            logging.debug(f"Encode cache could not read {file_path}: {e}")
+            return None
+        # A copy, so the file is not mapped while it is waiting to be evicted
+        samples = np.array(samples)
+        samples.setflags(write=False)
+        return samples, frame_rate, channels
+
+    def _write_disk(self, key, format, entry):
+        """ Write atomically through a temporary file, then evict down to disk_bytes. Returns the path """
+        import tempfile
+        import audio_formats
+
+        samples, frame_rate, channels = entry
+        file_path = self._file_path(key, format)
+        handle, temp_path = tempfile.mkstemp(prefix=key, suffix=TEMP_SUFFIX, dir=self.directory)
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                audio_formats.write_audio(samples, frame_rate, file, channels, format)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            _remove(temp_path)
+            raise
+        instrumentation.add_bytes('cache.disk_write', os.path.getsize(file_path))
+        self._evict(keep=file_path)
+        return file_path
+
+    def _disk_entries(self):
+        """ (path, size, mtime) of every finished file in the directory that the cache wrote """
+        if not self.directory:
+            return []
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                name = entry.name
+                if len(name) <= KEY_LENGTH or name[KEY_LENGTH] != '-' or name.endswith(TEMP_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def _evict(self, keep):
+        entries = self._disk_entries()
+        used = sum(size for _, size, _ in entries)
+        for file_path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if used <= self.disk_bytes:
+                break
+            # The file just written stays even when it is bigger than the whole tier, its caller needs it
+            if file_path == keep:
+                continue
+            _remove(file_path)
+            used -= size
+            instrumentation.count('cache.disk_evictions')
+
+
+def _remove(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def configure_cache(memory_bytes=DEFAULT_MEMORY_BYTES, directory=None, disk_bytes=DEFAULT_DISK_BYTES):
+    """ Set up this process's cache for an entry point, or turn it off when both tiers are empty """
+    global _cache
+    _cache = EncodeCache(memory_bytes, directory, disk_bytes) if memory_bytes > 0 or directory else None
+    return _cache
+
+
+def get_cache():
+    """ The process's EncodeCache, or None while caching is off """
+    return _cache
@@ -0,0 +1,154 @@
+import logging
+import os
+
+import alphabet_profile
+import combining_sounds
+import glyph_pack
+import instrumentation
+import wav_reader
+
+
+def read_wav_samples(file_path):
+    """ Read a 16-bit PCM WAV file into an int16 array, returns (samples, frame_rate, channels) """
+    wav_file = wav_reader.open_wav(file_path)
+    if wav_file.sample_width != 2:
+        raise ValueError(f"{file_path} is not 16-bit PCM")
+    # Glyphs are tiny, copying them keeps the files unmapped so banks can be regenerated in place
+    return wav_file.samples.copy(), wav_file.frame_rate, wav_file.channels
+
+
+class GlyphBank:
+    """ All character sounds of one sound type, decoded once and kept in memory as PCM arrays """
+    def __init__(self, sound_type):
+        self.sound_type = sound_type
+        self.glyphs = {}
+        self.gap = None
+        self.frame_rate = 44100
+        self.channels = 1
+        self.sample_width = 2
+        self._segments = {}
+        self._digest = None
+        self.loaded = False
+
+    @instrumentation.timed('glyph_bank.load')
+    def load(self):
+        """
+        Load from the sound type's glyph pack when there is one, else from its WAV files.
+        Synthesized profiles have neither, their glyphs are generated.
+        """
+        profile = alphabet_profile.get_profile(self.sound_type)
+        if profile.synthesized:
+            return self._loaded(self.generate(profile))
+        file_path = glyph_pack.pack_path(self.sound_type)
+        if os.path.exists(file_path):
+            try:
+                return self._loaded(self.load_pack(file_path))
+            except Exception as e:
+                logging.debug(f"Error loading glyph pack {file_path}, falling back to WAV files: {e}")
+        return self._loaded(self.load_wavs())
+
+    def _loaded(self, bank):
+        if instrumentation.enabled():
+            instrumentation.count('glyph_bank.glyphs', len(bank.glyphs))
+            instrumentation.add_bytes('glyph_bank.load', sum(samples.nbytes for samples in bank.glyphs.values()))
+        return bank
+
+    def load_pack(self, file_path):
+        pack = glyph_pack.open_pack(file_path)
+        self.frame_rate, self.channels, self.sample_width = pack.frame_rate, pack.channels, pack.sample_width
+        self.gap = pack.get('gap')
+        self.glyphs = {name: samples for name, samples in pack.glyphs.items() if name not in ('gap', 'silence')}
+        self._segments = {}
+        self._digest = None
+        self.loaded = True
+        return self
+
+    def generate(self, profile):
+        from creating_sounds import profile_glyphs
+
+        self.glyphs, self.gap = profile_glyphs(profile)
+        self.frame_rate, self.channels, self.sample_width = profile.sample_rate, 1, 2
+        self._segments = {}
+        self._digest = None
+        self.loaded = True
+        return self
+
+    def load_wavs(self):
+        glyphs = {}
+        for char, file_path in combining_sounds.mapping_sounds(self.sound_type).items():
+            try:
+                samples, self.frame_rate, self.channels = read_wav_samples(file_path)
+                glyphs[char] = samples
+            except Exception as e:
+                logging.debug(f"Error loading sound for letter '{char}': {e}")
+
+        gap_sound_path = combining_sounds.resource_path(os.path.join(self.sound_type, 'gap.wav'))
+        try:
+            self.gap, _, _ = read_wav_samples(gap_sound_path)
+        except Exception as e:
+            logging.debug(f"Error loading gap sound for {self.sound_type}: {e}")
+            self.gap = None
+
+        self.glyphs = glyphs
+        self._segments = {}
+        self._digest = None
+        self.loaded = True
+        return self
+
+    def digest(self):
+        """ sha256 of the format, glyphs and gap, so encode_cache can tell when they change """
+        if self._digest is None:
+            import hashlib
+
+            digest = hashlib.sha256(f"{self.frame_rate}/{self.channels}/{self.sample_width}".encode('ascii'))
+            glyphs = dict(self.glyphs, gap=self.gap) if self.gap is not None else self.glyphs
+            for name in sorted(glyphs):
+                digest.update(name.encode('utf-8') + b'\0')
+                digest.update(glyphs[name].tobytes())
+            self._digest = digest.hexdigest()
+        return self._digest
+
+    def get(self, char):
+        """ PCM samples for a character, or None if the sound type has no glyph for it """
+        return self.glyphs.get(char)
+
+    def segment(self, char):
+        """ The glyph as an AudioSegment, built once from the cached PCM """
+        from pydub import AudioSegment
+
+        if char not in self._segments:
+            samples = self.gap if char == 'gap' else self.glyphs.get(char)
+            if samples is None:
+                return None
+            self._segments[char] = AudioSegment(
+                data=samples.tobytes(),
+                sample_width=self.sample_width,
+                frame_rate=self.frame_rate,
+                channels=self.channels)
+        return self._segments[char]
+
+
+_banks = {}
+
+
+def get_glyph_bank(sound_type):
+    """ Return the loaded glyph bank for a sound type, loading it on first use """
+    bank = _banks.get(sound_type)
+    if bank is None:
+        bank = GlyphBank(sound_type).load()
+        _banks[sound_type] = bank
+    return bank
+
+
+def preload(sound_types=('modulated', 'non_human')):
+    """ Load the given sound types up front, e.g. at application startup """
+    for sound_type in sound_types:
+        get_glyph_bank(sound_type)
+
+
+def invalidate(sound_type=None):
+    """ Drop a cached bank (or all of them) so the next use reloads from disk """
+    if sound_type is None:
+        _banks.clear()
+    else:
+        _banks.pop(sound_type, None)
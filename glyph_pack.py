@@ -0,0 +1,135 @@
+"""
+Packed glyph banks: every glyph of a sound type in one file, loaded with a single mmap.
+
+    python glyph_pack.py modulated non_human beeps
+
+Layout, all little-endian:
+
+    magic     8s    b'ACGLYPH1'
+    header    IHHI  frame_rate, channels, sample_width, glyph count
+    index     per glyph: name length (H), UTF-8 name, offset and length in samples (QQ)
+    padding   up to a multiple of 16 bytes
+    payload   the int16 samples of every glyph back to back
+
+Glyph names are the characters themselves plus 'gap' and 'silence'.
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+import combining_sounds
+import glyph_bank
+
+MAGIC = b'ACGLYPH1'
+PACK_EXTENSION = '.glyphs'
+_HEADER = struct.Struct('<IHHI')
+_NAME_LENGTH = struct.Struct('<H')
+_LOCATION = struct.Struct('<QQ')
+_ALIGNMENT = 16
+
+
+def pack_path(sound_type):
+    """ Where the pack for a sound type lives, next to its directory of WAV files """
+    return combining_sounds.resource_path(sound_type + PACK_EXTENSION)
+
+
+class GlyphPack:
+    """ A glyph pack mapped into memory, every glyph is a read-only int16 view into the map """
+    def __init__(self, file_path):
+        import numpy as np
+
+        self.file_path = file_path
+        with open(file_path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        data = self._mmap
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{file_path} is not a glyph pack")
+        position = len(MAGIC)
+        self.frame_rate, self.channels, self.sample_width, count = _HEADER.unpack_from(data, position)
+        position += _HEADER.size
+        if self.sample_width != 2:
+            raise ValueError(f"{file_path}: only 16-bit glyph packs are supported")
+
+        index = {}
+        for _ in range(count):
+            (name_length,) = _NAME_LENGTH.unpack_from(data, position)
+            position += _NAME_LENGTH.size
+            name = bytes(data[position:position + name_length]).decode('utf-8')
+            position += name_length
+            index[name] = _LOCATION.unpack_from(data, position)
+            position += _LOCATION.size
+        payload_offset = -(-position // _ALIGNMENT) * _ALIGNMENT
+
+        payload = np.frombuffer(data, dtype='<i2', offset=payload_offset)
+        self.glyphs = {}
+        for name, (offset, length) in index.items():
+            if offset + length > len(payload):
+                raise ValueError(f"{file_path}: glyph {name!r} runs past the end of the file")
+            self.glyphs[name] = payload[offset:offset + length]
+
+    def get(self, name):
+        return self.glyphs.get(name)
+
+
+def open_pack(file_path):
+    return GlyphPack(file_path)
+
+
+def write_pack(file_path, glyphs, frame_rate=44100, channels=1):
+    """
+    Write {name: int16 samples} as a glyph pack. The file is replaced atomically, so a pack
+    that is mapped by a running process keeps its old contents.
+    """
+    import numpy as np
+
+    names = list(glyphs)
+    index = bytearray()
+    offset = 0
+    for name in names:
+        encoded = name.encode('utf-8')
+        index += _NAME_LENGTH.pack(len(encoded)) + encoded + _LOCATION.pack(offset, len(glyphs[name]))
+        offset += len(glyphs[name])
+
+    header = MAGIC + _HEADER.pack(frame_rate, channels, 2, len(names)) + bytes(index)
+    header += b'\0' * (-len(header) % _ALIGNMENT)
+
+    directory = os.path.dirname(os.path.abspath(file_path))
+    handle, temporary_path = tempfile.mkstemp(dir=directory, suffix=PACK_EXTENSION)
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            file.write(header)
+            for name in names:
+                file.write(np.asarray(glyphs[name], dtype='<i2').tobytes())
+        os.replace(temporary_path, file_path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+    return file_path
+
+
+def convert_directory(sound_type, destination=None):
+    """ Pack the WAV files of a sound type directory, including gap.wav and silence.wav when present """
+    paths = dict(combining_sounds.mapping_sounds(sound_type))
+    for name in ('gap', 'silence'):
+        paths[name] = combining_sounds.resource_path(os.path.join(sound_type, f"{name}.wav"))
+
+    glyphs = {}
+    frame_rate, channels = 44100, 1
+    for name, file_path in paths.items():
+        if os.path.exists(file_path):
+            glyphs[name], frame_rate, channels = glyph_bank.read_wav_samples(file_path)
+
+    return write_pack(destination or pack_path(sound_type), glyphs, frame_rate, channels)
+
+
+def main(argv=None):
+    sound_types = (argv if argv is not None else sys.argv[1:]) or ['modulated', 'non_human', 'beeps']
+    for sound_type in sound_types:
+        print(f"{sound_type} -> {convert_directory(sound_type)}")
+
+
+if __name__ == "__main__":
+    main()
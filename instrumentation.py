@@ -0,0 +1,324 @@
+"""
+Timers, counters and peak gauges around the hot paths (glyph loading, concatenation, FFT windows,
+synthesis, WAV export, mixer load), and optional cProfile captures per request.
+
+Metrics are off unless an entry point calls configure_metrics() with AUDIOCIPHER_METRICS=1 set or
+enabled=True. While off every hook returns straight away, so they can stay in the hot paths:
+
+    @timed('encode.concatenate')            time every call
+    with timer('playback.mixer_load'):      time a block
+    add_bytes('wav.write', len(data))       bytes processed, a counter named wav.write_bytes
+    peak('encode.buffer', buffer.nbytes)    largest value seen, for buffer sizes
+
+export() hands a snapshot to the configured sink:
+
+    MemorySink        keeps the snapshots in memory (the default)
+    JsonLinesSink     appends one JSON object per export to a file
+    PrometheusSink    rewrites a file in the Prometheus text format, for a node exporter textfile collector
+
+Like app_logging this module only uses the standard library, so importing it costs nothing.
+"""
+import functools
+import itertools
+import os
+import threading
+import time
+
+PROMETHEUS_PREFIX = 'audiocipher'
+
+_metrics = None
+_sink = None
+_profile_dir = None
+_profile_numbers = itertools.count(1)
+
+
+class Metrics:
+    """ Thread safe counters, timers and peaks of one process, see snapshot() for the layout """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self.peaks = {}
+
+    def count(self, name, value):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_time(self, name, seconds):
+        with self._lock:
+            entry = self.timers.get(name)
+            if entry is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                if seconds > entry[2]:
+                    entry[2] = seconds
+
+    def peak(self, name, value):
+        with self._lock:
+            if value > self.peaks.get(name, 0):
+                self.peaks[name] = value
+
+    def snapshot(self, reset=False):
+        """
+        {'counters': {name: total}, 'timers': {name: {'count', 'seconds', 'max_seconds'}}, 'peaks': {name: max}}
+        With `reset` everything starts again from zero, for handing deltas to another process.
+        """
+        with self._lock:
+            snapshot = {
+                'counters': dict(self.counters),
+                'timers': {name: {'count': count, 'seconds': seconds, 'max_seconds': longest}
+                           for name, (count, seconds, longest) in self.timers.items()},
+                'peaks': dict(self.peaks),
+            }
+            if reset:
+                self.counters, self.timers, self.peaks = {}, {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """ Add a snapshot taken in another process, e.g. a worker's """
+        for name, value in snapshot['counters'].items():
+            self.count(name, value)
+        with self._lock:
+            for name, timing in snapshot['timers'].items():
+                entry = self.timers.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += timing['count']
+                entry[1] += timing['seconds']
+                entry[2] = max(entry[2], timing['max_seconds'])
+        for name, value in snapshot['peaks'].items():
+            self.peak(name, value)
+
+
+class MemorySink:
+    """ Keeps every exported snapshot, `latest` is the last one """
+    def __init__(self):
+        self.snapshots = []
+
+    @property
+    def latest(self):
+        return self.snapshots[-1] if self.snapshots else None
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+class JsonLinesSink:
+    """ Appends each snapshot as one JSON line, with a timestamp and the process id """
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def write(self, snapshot):
+        import json
+
+        line = json.dumps({'timestamp': time.time(), 'pid': os.getpid(), **snapshot})
+        with open(self.file_path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+class PrometheusSink:
+    """ Replaces the file with the latest snapshot in the Prometheus text format """
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def write(self, snapshot):
+        # Written next to the target and renamed, so a scraper never reads half a file
+        temporary = f"{self.file_path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            file.write(prometheus_text(snapshot))
+        os.replace(temporary, self.file_path)
+
+
+def metric_name(name, suffix=''):
+    """ 'glyph_bank.load' -> 'audiocipher_glyph_bank_load' + suffix """
+    cleaned = ''.join(char if char.isalnum() else '_' for char in name)
+    return f"{PROMETHEUS_PREFIX}_{cleaned}{suffix}"
+
+
+def prometheus_text(snapshot):
+    """ A snapshot in the Prometheus text exposition format """
+    lines = []
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = metric_name(name, '_total')
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, timing in sorted(snapshot['timers'].items()):
+        metric = metric_name(name, '_seconds')
+        lines += [f"# TYPE {metric} summary",
+                  f"{metric}_count {timing['count']}",
+                  f"{metric}_sum {timing['seconds']:.9f}",
+                  f"# TYPE {metric}_max gauge",
+                  f"{metric}_max {timing['max_seconds']:.9f}"]
+    for name, value in sorted(snapshot['peaks'].items()):
+        metric = metric_name(name, '_peak_bytes')
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_requested():
+    return os.environ.get('AUDIOCIPHER_METRICS', '') not in ('', '0')
+
+
+def sink_for(file_path):
+    """ PrometheusSink for a .prom file, JsonLinesSink for anything else, MemorySink without a file """
+    if not file_path:
+        return MemorySink()
+    if file_path.endswith('.prom'):
+        return PrometheusSink(file_path)
+    return JsonLinesSink(file_path)
+
+
+def configure_metrics(enabled=None, sink=None, profile_dir=None):
+    """
+    Set up instrumentation for an entry point. Metrics are opt-in, either with enabled=True or by
+    setting AUDIOCIPHER_METRICS=1; AUDIOCIPHER_METRICS_FILE picks the sink when none is given.
+    With `profile_dir` (or AUDIOCIPHER_PROFILE_DIR) profiled() blocks dump cProfile stats there.
+    """
+    global _metrics, _sink, _profile_dir
+    if enabled is None:
+        enabled = metrics_requested()
+    _metrics = Metrics() if enabled else None
+    _sink = (sink or sink_for(os.environ.get('AUDIOCIPHER_METRICS_FILE'))) if enabled else None
+    _profile_dir = profile_dir or os.environ.get('AUDIOCIPHER_PROFILE_DIR') or None
+    if _profile_dir:
+        os.makedirs(_profile_dir, exist_ok=True)
+    return _metrics
+
+
+def enabled():
+    return _metrics is not None
+
+
+def metrics():
+    """ The current Metrics, or None while instrumentation is off """
+    return _metrics
+
+
+def snapshot(reset=False):
+    return _metrics.snapshot(reset) if _metrics is not None else None
+
+
+def merge(worker_snapshot):
+    if _metrics is not None and worker_snapshot:
+        _metrics.merge(worker_snapshot)
+
+
+def export():
+    """ Hand the current snapshot to the sink, returns the snapshot """
+    if _metrics is None:
+        return None
+    current = _metrics.snapshot()
+    _sink.write(current)
+    return current
+
+
+def count(name, value=1):
+    if _metrics is not None:
+        _metrics.count(name, value)
+
+
+def add_bytes(name, value):
+    if _metrics is not None:
+        _metrics.count(name + '_bytes', value)
+
+
+def peak(name, value):
+    if _metrics is not None:
+        _metrics.peak(name, value)
+
+
+def record_time(name, seconds):
+    """ Add a duration measured elsewhere, e.g. between two callbacks """
+    if _metrics is not None:
+        _metrics.record_time(name, seconds)
+
+
+class _Timer:
+    __slots__ = ('name', 'metrics', 'started')
+
+    def __init__(self, name, metrics):
+        self.name = name
+        self.metrics = metrics
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record_time(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name):
+    """ Context manager timing its block under `name`, a shared no-op while metrics are off """
+    if _metrics is None:
+        return _NULL_TIMER
+    return _Timer(name, _metrics)
+
+
+def timed(name):
+    """ Decorator timing every call under `name`. Not for generators, those return before doing any work """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            metrics = _metrics
+            if metrics is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.record_time(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def profile_dir():
+    """ Where profiled() writes its stats, None while profiling is off """
+    return _profile_dir
+
+
+class ProfileCapture:
+    """ cProfile around a with block, see profiled() """
+    def __init__(self, label, wanted=True):
+        self.label = ''.join(char if char.isalnum() or char in '-_' else '_' for char in label).strip('_')
+        self.wanted = wanted and _profile_dir is not None
+        self.path = None
+        self._profile = None
+
+    def __enter__(self):
+        if self.wanted:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profile is not None:
+            self._profile.disable()
+            number = next(_profile_numbers)
+            self.path = os.path.join(_profile_dir, f"{self.label or 'profile'}-{os.getpid()}-{number}.prof")
+            self._profile.dump_stats(self.path)
+            count('profiles')
+        return False
+
+
+def profiled(label, wanted=True):
+    """
+    Run a with block under cProfile and dump the stats to <profile dir>/<label>-<pid>-<n>.prof, readable
+    with `python -m pstats`. Does nothing unless a profile directory is configured and `wanted` is true;
+    the capture's `path` is where the stats went, or None.
+    """
+    return ProfileCapture(label, wanted)
@@ -0,0 +1,166 @@
+"""
+Live decoding: text comes out while the audio is still arriving, from a microphone or any
+iterable of int16 PCM blocks.
+
+A source yields interleaved int16 blocks and knows its sample rate and channel count:
+
+    MicrophoneSource  sounddevice.InputStream callback
+    WavSource         a 16-bit WAV file read block by block, optionally paced in real time
+
+LiveDecoder feeds those blocks to recognize_text.stream_decoder on a thread of its own and
+collects the text, which the GUI's typewriter picks up with take_text().
+"""
+import logging
+import queue
+import threading
+import time
+import wave
+
+DEFAULT_BLOCK_FRAMES = 1024
+
+
+class MicrophoneSource:
+    """ Blocks recorded by a sounddevice.InputStream, iterating stops once stop() was called """
+    def __init__(self, sample_rate=44100, channels=1, block_frames=DEFAULT_BLOCK_FRAMES, device=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = block_frames
+        self.device = device
+        self.overflows = 0
+        self._blocks = queue.Queue()
+        self._stream = None
+        # Imported here so a missing backend shows up before decoding starts
+        import sounddevice
+        self._sounddevice = sounddevice
+
+    def __iter__(self):
+        sounddevice = self._sounddevice
+
+        def callback(indata, frames, time_info, status):
+            if status.input_overflow:
+                self.overflows += 1
+            # The stream reuses its buffer, the block has to be copied before the callback returns
+            self._blocks.put(indata.reshape(-1).copy())
+
+        self._stream = sounddevice.InputStream(
+            samplerate=self.sample_rate, channels=self.channels, dtype='int16', blocksize=self.block_frames,
+            device=self.device, callback=callback)
+        with self._stream:
+            while True:
+                block = self._blocks.get()
+                if block is None:
+                    return
+                yield block
+
+    def stop(self):
+        self._blocks.put(None)
+
+
+class WavSource:
+    """
+    Blocks of a 16-bit PCM WAV file. With `realtime` they come no faster than the file would
+    play, so decoding keeps pace with playback of the same file.
+    """
+    def __init__(self, file_path, block_frames=DEFAULT_BLOCK_FRAMES, realtime=False):
+        self.file_path = file_path
+        self.block_frames = block_frames
+        self.realtime = realtime
+        try:
+            with wave.open(file_path, 'rb') as wav_file:
+                sample_width = wav_file.getsampwidth()
+                self.sample_rate = wav_file.getframerate()
+                self.channels = wav_file.getnchannels()
+        except (wave.Error, EOFError) as e:
+            raise ValueError(f"{file_path} is not a PCM WAV file: {e}")
+        if sample_width != 2:
+            raise ValueError(f"{file_path} is not 16-bit PCM")
+        self._stop = threading.Event()
+
+    def __iter__(self):
+        import numpy as np
+
+        started = time.perf_counter()
+        frames_read = 0
+        with wave.open(self.file_path, 'rb') as wav_file:
+            while not self._stop.is_set():
+                frames = wav_file.readframes(self.block_frames)
+                if not frames:
+                    return
+                block = np.frombuffer(frames, dtype='<i2')
+                frames_read += len(block) // self.channels
+                if self.realtime:
+                    time.sleep(max(0.0, started + frames_read / self.sample_rate - time.perf_counter()))
+                yield block
+
+    def stop(self):
+        self._stop.set()
+
+
+class LiveDecoder:
+    """
+    Decodes a source on a background thread. Text is queued for take_text() and, when given,
+    passed to `on_text` from the decoding thread. `worst_block_seconds` is the longest time
+    spent on one block, to compare against the block duration. Building one loads the glyph bank
+    and the frequency index, a GUI does that on a worker thread and calls start() once it is done.
+    """
+    def __init__(self, source, sound_type, on_text=None, **options):
+        import recognize_text
+
+        self.source = source
+        self.sound_type = sound_type
+        self.on_text = on_text
+        self.decoder = recognize_text.stream_decoder(sound_type, source.sample_rate, source.channels, **options)
+        self.blocks = 0
+        self.worst_block_seconds = 0.0
+        self.error = None
+        self._text = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='audiocipher-live-decoder', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for block in self.source:
+                started = time.perf_counter()
+                self._emit(self.decoder.feed(block))
+                self.worst_block_seconds = max(self.worst_block_seconds, time.perf_counter() - started)
+                self.blocks += 1
+            self._emit(self.decoder.flush())
+        except Exception as e:
+            self.error = e
+            logging.debug(f"Live decoding failed: {e}")
+
+    def _emit(self, text):
+        if text:
+            self._text.put(text)
+            if self.on_text is not None:
+                self.on_text(text)
+
+    def take_text(self):
+        """ Text decoded since the last call, never blocks """
+        pieces = []
+        while True:
+            try:
+                pieces.append(self._text.get_nowait())
+            except queue.Empty:
+                return ''.join(pieces)
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self.source.stop()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return not self.active
+
+
+def decode_live(source, sound_type, on_text=None, **options):
+    """ Start decoding a source, returns the running LiveDecoder """
+    return LiveDecoder(source, sound_type, on_text, **options).start()
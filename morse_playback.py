@@ -1,7 +1,13 @@
 import random
 import time
-from pydub import AudioSegment
-from pydub.generators import Sine
+from functools import lru_cache
+
+import instrumentation
+
+# numpy and pydub are imported on first render, reading scales does not need them
+
+# Up to 8 notes x 3 durations per scale, enough room for a dozen scales before evicting
+TONE_CACHE_SIZE = 512
 
 # Function to read scales and frequencies from a text file
 def read_scales_from_file(file_path):
@@ -24,31 +30,102 @@ morse_code = {
     '5': '.....', '6': '-....', '7': '--...', '8': '---..', '9': '----.'
 }
 
+# Timing of every sequence, recognize_text decodes against it
+DOT_SECONDS = 0.125
+DASH_SECONDS = 0.25
+LETTER_REST_SECONDS = 0.125  # After every letter
+SPACE_REST_SECONDS = 0.25  # For every space, on top of the rest after the letter before it
+END_NOTE = ('C', 0.5)  # Closes every sequence
+
 # Convert Morse code to a sequence of notes and durations
-def morse_code_to_musical_sequence(message, scale):
+def morse_code_to_musical_sequence(message, scale, seed=None):
+    """ Every symbol gets a random note of the scale; with a `seed` the same message always gets the same notes """
+    choice = random.choice if seed is None else random.Random(seed).choice
     sequence = []
     for char in message.upper():
         if char == ' ':
-            sequence.append(('R', 0.25))
+            sequence.append(('R', SPACE_REST_SECONDS))
         elif char in morse_code:
             for symbol in morse_code[char]:
-                note = random.choice(list(scale.keys()))
-                duration = 0.125 if symbol == '.' else 0.25
+                note = choice(list(scale.keys()))
+                duration = DOT_SECONDS if symbol == '.' else DASH_SECONDS
                 sequence.append((note, duration))
-            sequence.append(('R', 0.125))
-    sequence.append(('C', 0.5))
+            sequence.append(('R', LETTER_REST_SECONDS))
+    sequence.append(END_NOTE)
     return sequence
 
-# Generate the audio for a sequence of notes
-def generate_audio_from_sequence(sequence, scale):
-    total_audio = AudioSegment.silent(duration=0)  # Start with a silent segment
+@lru_cache(maxsize=TONE_CACHE_SIZE)
+def tone_samples(scale_key, note, tone_duration, sample_rate=44100):
+    """
+    Full-scale int16 sine for one note of a scale, the same samples pydub's Sine generator makes.
+    `scale_key` is the scale as a tuple of (note, frequency) pairs so it can be part of the cache key.
+    """
+    import numpy as np
+
+    frequency = dict(scale_key)[note]
+    sample_count = int(sample_rate * (tone_duration / 1000.0))
+    sine_of = (frequency * 2 * np.pi) / sample_rate
+    samples = (np.sin(sine_of * np.arange(sample_count)) * 32767).astype(np.int16)
+    samples.setflags(write=False)  # Shared between every sequence that uses this tone
+    return samples
+
+
+@instrumentation.timed('morse.render')
+def render_sequence(sequence, scale, sample_rate=44100):
+    """ Render a note sequence into one preallocated int16 array, rests are left as zeros """
+    import numpy as np
+
+    scale_key = tuple(scale.items())
+    pieces = []
     for note, duration in sequence:
+        duration_ms = int(duration * 1000)  # Convert to milliseconds
         if note == 'R':
-            silence_duration = int(duration * 1000)  # Convert to milliseconds
-            total_audio += AudioSegment.silent(duration=silence_duration)
+            pieces.append(int(sample_rate * (duration_ms / 1000.0)))
         else:
-            frequency = scale[note]
-            tone_duration = int(duration * 1000)  # Convert to milliseconds
-            tone = Sine(frequency).to_audio_segment(duration=tone_duration)
-            total_audio += tone
-    return total_audio
\ No newline at end of file
+            pieces.append(tone_samples(scale_key, note, duration_ms, sample_rate))
+
+    total_samples = sum(piece if isinstance(piece, int) else len(piece) for piece in pieces)
+    buffer = np.zeros(total_samples, dtype=np.int16)
+    position = 0
+    for piece in pieces:
+        if isinstance(piece, int):
+            position += piece
+        else:
+            buffer[position:position + len(piece)] = piece
+            position += len(piece)
+    instrumentation.peak('morse.buffer', buffer.nbytes)
+    return buffer
+
+
+def iter_render_sequence(sequence, scale, sample_rate=44100, progress=None):
+    """
+    render_sequence one note at a time, for streaming; joined together the blocks are render_sequence's output.
+    `progress(notes done, notes)` is called after every note.
+    """
+    import numpy as np
+
+    scale_key = tuple(scale.items())
+    for i, (note, duration) in enumerate(sequence):
+        duration_ms = int(duration * 1000)
+        if note == 'R':
+            yield np.zeros(int(sample_rate * (duration_ms / 1000.0)), dtype=np.int16)
+        else:
+            yield tone_samples(scale_key, note, duration_ms, sample_rate)
+        if progress is not None:
+            progress(i + 1, len(sequence))
+
+
+def write_sequence(sequence, scale, destination=None, format='wav', sample_rate=44100):
+    """ Render a note sequence in one of audio_formats.FORMATS a note at a time, as bytes or to a path / file object """
+    import audio_formats
+
+    return audio_formats.write_audio(iter_render_sequence(sequence, scale, sample_rate), sample_rate, destination,
+                                     format=format)
+
+
+# Generate the audio for a sequence of notes
+def generate_audio_from_sequence(sequence, scale, sample_rate=44100):
+    from pydub import AudioSegment
+
+    samples = render_sequence(sequence, scale, sample_rate)
+    return AudioSegment(data=samples.tobytes(), sample_width=2, frame_rate=sample_rate, channels=1)
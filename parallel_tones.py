@@ -0,0 +1,157 @@
+"""
+Parallel-tone (frequency-division) encoding, the 'parallel' sound type. A glyph sound type sends
+one 100 ms tone per character, about 10 characters per second; here `bands` characters go out at
+once, each as a tone in its own frequency band, summed into one frame of `symbol_ms` milliseconds.
+4 bands of 20 ms frames carry 200 characters per second.
+
+Every band has one tone per ALPHABET character. Tones are 1000 / symbol_ms Hz apart, so over a
+frame each one completes a whole number of cycles and lands on its own bin of a frame-long FFT;
+recognize_text.decode_parallel_samples reads the strongest bin of every band. Characters go out in
+reading order, frame by frame and band by band, and the unused bands of the last frame stay silent.
+
+The decoder has to be given the same bands and symbol_ms as the encoder.
+"""
+import math
+from functools import lru_cache
+
+import instrumentation
+from alphabet_profile import CHARACTERS
+
+DEFAULT_BANDS = 4
+DEFAULT_SYMBOL_MS = 20
+BASE_FREQUENCY = 1000  # Lowest tone of the first band, rounded up to the tone spacing
+VOLUME = 0.5  # Peak of a frame with every band sounding, the glyphs' volume
+GUARD_TONES = 1  # Unused tone slots between two bands
+MAX_FREQUENCY_SHARE = 0.95  # Highest tone allowed, as a share of the Nyquist frequency
+
+# The characters the glyph sound types have, plus the space between words
+ALPHABET = ' ' + CHARACTERS
+
+
+class ToneLayout:
+    """ Where every character of every band sits in the spectrum for one bands / symbol_ms / sample_rate """
+    def __init__(self, bands=DEFAULT_BANDS, symbol_ms=DEFAULT_SYMBOL_MS, sample_rate=44100,
+                 base_frequency=BASE_FREQUENCY):
+        import numpy as np
+
+        if bands < 1:
+            raise ValueError(f"need at least one band, got {bands}")
+        frame_length = sample_rate * symbol_ms / 1000
+        if frame_length != int(frame_length) or frame_length < 1:
+            raise ValueError(f"{symbol_ms} ms is not a whole number of samples at {sample_rate} Hz")
+        self.bands = bands
+        self.symbol_ms = symbol_ms
+        self.sample_rate = sample_rate
+        self.frame_length = int(frame_length)
+        self.spacing = 1000 / symbol_ms
+
+        # bins[band, character] is the FFT bin of a frame-long window the tone falls on, the same at any sample rate
+        first_bin = math.ceil(base_frequency / self.spacing)
+        slots = len(ALPHABET) + GUARD_TONES
+        self.bins = first_bin + np.arange(bands)[:, None] * slots + np.arange(len(ALPHABET))[None, :]
+        self.frequencies = self.bins * self.spacing
+        highest = float(self.frequencies.max())
+        if highest > MAX_FREQUENCY_SHARE * sample_rate / 2:
+            raise ValueError(f"{bands} bands of {symbol_ms} ms tones reach {highest:.0f} Hz, too high for "
+                             f"{sample_rate} Hz audio; use fewer bands or longer symbols")
+        self._codes = {char: code for code, char in enumerate(ALPHABET)}
+
+    @property
+    def characters_per_second(self):
+        return self.bands * 1000 / self.symbol_ms
+
+    def normalize(self, text):
+        """ The text as it comes back from decoding: lower case, single spaces, unknown characters left out """
+        return ' '.join(''.join(char for char in word if char in self._codes) for word in text.lower().split())
+
+    def codes(self, text):
+        import numpy as np
+
+        normalized = self.normalize(text)
+        return np.fromiter((self._codes[char] for char in normalized), dtype=np.intp, count=len(normalized))
+
+    def text(self, codes):
+        return ''.join(ALPHABET[code] for code in codes)
+
+    def tone_table(self):
+        """ float32 (bands, characters + 1, frame_length), the last row of a band is its silence """
+        return _tone_table(self.bands, self.symbol_ms, self.sample_rate)
+
+
+@lru_cache(maxsize=16)
+def get_layout(bands=DEFAULT_BANDS, symbol_ms=DEFAULT_SYMBOL_MS, sample_rate=44100):
+    return ToneLayout(bands, symbol_ms, sample_rate)
+
+
+@lru_cache(maxsize=4)
+def _tone_table(bands, symbol_ms, sample_rate):
+    import numpy as np
+
+    layout = get_layout(bands, symbol_ms, sample_rate)
+    t = np.arange(layout.frame_length) / sample_rate
+    table = np.zeros((bands, len(ALPHABET) + 1, layout.frame_length), dtype=np.float32)
+    # Each band gets an equal share of the volume so a full frame never clips
+    table[:, :-1] = (VOLUME / bands) * np.sin(2 * np.pi * layout.frequencies[..., None] * t)
+    table.setflags(write=False)
+    return table
+
+
+def frame_codes(layout, text):
+    """ (frames, bands) character codes of the text, bands without a character in the last frame play the silent row """
+    import numpy as np
+
+    codes = layout.codes(text)
+    frame_count = -(-len(codes) // layout.bands)
+    padded = np.full(frame_count * layout.bands, len(ALPHABET), dtype=np.intp)
+    padded[:len(codes)] = codes
+    return padded.reshape(frame_count, layout.bands)
+
+
+def render_frames(layout, codes):
+    """ int16 audio of (frames, bands) character codes """
+    import numpy as np
+
+    frames = layout.tone_table()[np.arange(layout.bands), codes].sum(axis=1)
+    return (frames * 32767.0).astype(np.int16).reshape(-1)
+
+
+@instrumentation.timed('encode.parallel')
+def encode_parallel_pcm(text, bands=DEFAULT_BANDS, symbol_ms=DEFAULT_SYMBOL_MS, sample_rate=44100, block_frames=4096):
+    """ Encode text into int16 PCM, `bands` characters per frame of `symbol_ms` milliseconds """
+    import numpy as np
+
+    layout = get_layout(bands, symbol_ms, sample_rate)
+    codes = frame_codes(layout, text)
+    buffer = np.empty(len(codes) * layout.frame_length, dtype=np.int16)
+    # Blocks of frames keep the float intermediate bounded for long messages
+    for start in range(0, len(codes), block_frames):
+        block = render_frames(layout, codes[start:start + block_frames])
+        buffer[start * layout.frame_length:start * layout.frame_length + len(block)] = block
+
+    instrumentation.add_bytes('encode.parallel', buffer.nbytes)
+    instrumentation.peak('encode.buffer', buffer.nbytes)
+    return buffer
+
+
+def iter_parallel_pcm(text, bands=DEFAULT_BANDS, symbol_ms=DEFAULT_SYMBOL_MS, sample_rate=44100, block_frames=4096):
+    """ encode_parallel_pcm `block_frames` frames at a time, for writing out as it goes """
+    layout = get_layout(bands, symbol_ms, sample_rate)
+    codes = frame_codes(layout, text)
+    for start in range(0, len(codes), block_frames):
+        yield render_frames(layout, codes[start:start + block_frames])
+
+
+def encode_parallel_wav(text, bands=DEFAULT_BANDS, symbol_ms=DEFAULT_SYMBOL_MS, destination=None, sample_rate=44100):
+    """ encode_parallel_pcm straight to WAV, returned as bytes or written to a path / file object """
+    from combining_sounds import write_wav
+
+    return write_wav(encode_parallel_pcm(text, bands, symbol_ms, sample_rate), sample_rate, destination)
+
+
+def encode_parallel_audio(text, bands=DEFAULT_BANDS, symbol_ms=DEFAULT_SYMBOL_MS, destination=None, format='wav',
+                          sample_rate=44100):
+    """ encode_parallel_wav for any of audio_formats.FORMATS, written a block of frames at a time """
+    import audio_formats
+
+    return audio_formats.write_audio(iter_parallel_pcm(text, bands, symbol_ms, sample_rate), sample_rate, destination,
+                                     format=format)
@@ -1,37 +1,141 @@
 import logging
-
-# Setup logging
-logging.basicConfig(filename='app.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-
-from scipy.io import wavfile
-from scipy.signal import find_peaks
+import math
+import time
+from functools import lru_cache
 import numpy as np
-from pydub import AudioSegment
-from combining_sounds import mapping_sounds
+import wave
+import alphabet_profile
+import audio_formats
+import glyph_bank
+import instrumentation
+import wav_reader
+import alignment
+import parallel_tones
+import morse_playback
 
-def recognize_text_from_sound(sound_file_path, sound_type):
+def recognize_text_from_sound(sound_file_path, sound_type, batched=True, detector='fft', sync=True,
+                              bands=parallel_tones.DEFAULT_BANDS, symbol_ms=parallel_tones.DEFAULT_SYMBOL_MS):
     if sound_type == "morse":
-        recognized_text = analyze_morse_audio()
-        print(recognized_text)
+        recognized_text = analyze_morse_audio(sound_file_path)
     else:
-        sound_map = {k: AudioSegment.from_wav(v) for k, v in mapping_sounds(sound_type).items()}
-        sound = AudioSegment.from_wav(sound_file_path)
-        recognized_text = analyze_audio(sound, sound_map, sound_type)
+        wav_file = None
+        if batched:
+            try:
+                wav_file = wav_reader.open_wav(sound_file_path)
+            except ValueError:
+                pass
+        # 16-bit PCM is decoded from the memory map and u-law / ADPCM WAVs once expanded, anything else goes through pydub
+        if wav_file is not None and wav_file.sample_width == 2:
+            recognized_text = recognize_text_from_samples(
+                wav_file.samples, wav_file.frame_rate, sound_type, wav_file.channels, detector, sync, bands, symbol_ms)
+        else:
+            sound_map = None
+            if sound_type != "parallel":
+                bank = glyph_bank.get_glyph_bank(sound_type)
+                sound_map = {k: bank.segment(k) for k in bank.glyphs}
+            from pydub import AudioSegment
+            sound = AudioSegment.from_file(sound_file_path)
+            recognized_text = analyze_audio(sound, sound_map, sound_type, bands, symbol_ms)
         logging.debug(f"Recognizing text from sound for sound type: {sound_type}")
         # print("Recognized text:", recognized_text)
     return recognized_text
 
-def analyze_audio(sound, sound_map, sound_type):
+
+def recognize_text_from_samples(samples, frame_rate, sound_type, channels=1, detector='fft', sync=True,
+                                bands=parallel_tones.DEFAULT_BANDS, symbol_ms=parallel_tones.DEFAULT_SYMBOL_MS):
+    """
+    Decode int16 samples that are already in memory, e.g. a WAV received over the network.
+    `bands` and `symbol_ms` only apply to the 'parallel' sound type and must match its encoder.
+    """
+    if sound_type == "morse":
+        first_channel = samples[::channels] if channels > 1 else samples
+        return translate_morse_to_text(decode_morse_samples(first_channel, frame_rate))
+    if sound_type == "parallel":
+        first_channel = samples[::channels] if channels > 1 else samples
+        return decode_parallel_samples(first_channel, frame_rate, bands, symbol_ms)
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    sound_map = {k: bank.segment(k) for k in bank.glyphs}
+    return analyze_samples(samples, frame_rate, sound_map, sound_type, channels, detector, sync)
+
+
+def dominant_frequency_of(samples, sample_rate):
+    frequencies, amplitudes = np.fft.fftfreq(len(samples), 1/sample_rate), np.abs(np.fft.fft(samples))
+    return abs(frequencies[np.argmax(amplitudes)])
+
+
+class FrequencyIndex:
+    """ Reference glyphs sorted by dominant frequency, so a window is matched with one binary search """
+    def __init__(self, sound_map, sample_rate):
+        by_frequency = {}
+        for letter, sound_segment in sound_map.items():
+            letter_audio_data = np.array(sound_segment.get_array_of_samples())
+            # Glyphs are measured at their own rate, a capture may have been resampled
+            frequency = dominant_frequency_of(letter_audio_data, sound_segment.frame_rate)
+            # When several glyphs share a frequency the first one in the map wins, as in a linear scan
+            by_frequency.setdefault(frequency, letter)
+
+        self.frequencies = np.array(sorted(by_frequency))
+        self.letters = np.array([by_frequency[frequency] for frequency in self.frequencies], dtype=object)
+        # Position of each letter in the sound map, used to break ties like the linear scan did
+        order = {letter: rank for rank, letter in enumerate(sound_map)}
+        self.ranks = np.array([order[letter] for letter in self.letters])
+
+    def closest(self, frequency):
+        return self.closest_many([frequency])[0]
+
+    def closest_many(self, frequencies):
+        """ Closest glyph for every frequency in an array, all looked up in one searchsorted call """
+        frequencies = np.asarray(frequencies, dtype=float)
+        if len(self.frequencies) == 0:
+            return np.full(len(frequencies), 'silence', dtype=object)
+
+        positions = np.searchsorted(self.frequencies, frequencies)
+        below_index = np.clip(positions - 1, 0, len(self.frequencies) - 1)
+        above_index = np.clip(positions, 0, len(self.frequencies) - 1)
+
+        below = frequencies - self.frequencies[below_index]
+        above = self.frequencies[above_index] - frequencies
+        take_below = (below < above) | ((below == above) & (self.ranks[below_index] < self.ranks[above_index]))
+        return self.letters[np.where(take_below, below_index, above_index)]
+
+
+_frequency_indexes = {}
+
+
+def get_frequency_index(sound_type, sound_map, sample_rate):
+    """ Build the frequency index for a sound type's glyph bank once and reuse it for every later decode """
+    digest = glyph_bank.get_glyph_bank(sound_type).digest()
+    key = (sound_type, sample_rate)
+    cached = _frequency_indexes.get(key)
+    if cached is None or cached[0] != digest:
+        # A reloaded or re-registered bank gets a new index, and goertzel_candidates, keyed by the index, follows
+        _frequency_indexes[key] = (digest, FrequencyIndex(sound_map, sample_rate))
+    return _frequency_indexes[key][1]
+
+
+def gap_frequency_for(sound_type):
+    return alphabet_profile.get_profile(sound_type).gap_frequency
+
+
+def symbol_ms_for(sound_type):
+    """ Length of one glyph in milliseconds, the analysis window """
+    return alphabet_profile.get_profile(sound_type).symbol_ms
+
+
+def analyze_audio(sound, sound_map, sound_type, bands=parallel_tones.DEFAULT_BANDS,
+                  symbol_ms=parallel_tones.DEFAULT_SYMBOL_MS):
+    if sound_type == "parallel":
+        # Parallel tones are read from whole frames at once, there is no glyph map to match against
+        samples = np.array(sound.get_array_of_samples())[::sound.channels]
+        return decode_parallel_samples(samples, sound.frame_rate, bands, symbol_ms)
+
     recognized_text = ""
     consecutive_zeros = 0  # Counter for consecutive zeros
-    window_size = 100  # Assuming sound files are 0.1 seconds long
+    window_size = symbol_ms_for(sound_type)
+
+    gap_frequency = gap_frequency_for(sound_type)
 
-    if sound_type == "modulated":
-        gap_frequency = 495
-    elif sound_type =="beeps":
-        gap_frequency = 490
-    elif sound_type == "non_human":
-        gap_frequency = 20890
+    frequency_index = get_frequency_index(sound_type, sound_map, sound.frame_rate)
 
     for i in range(0, len(sound), window_size):
         # Extract the current segment
@@ -57,19 +161,7 @@ def analyze_audio(sound, sound_map, sound_type):
                 consecutive_zeros = 0  # Reset the counter since we have a non-zero frequency
 
                 # Find the letter with the closest match in terms of dominant frequency
-                min_difference = float('inf')
-                closest_letter = 'silence'  # Default to silence if no match is found
-
-                for letter, sound_segment in sound_map.items():
-                    letter_audio_data = np.array(sound_segment.get_array_of_samples())
-                    letter_frequencies, _ = np.fft.fftfreq(len(letter_audio_data), 1/sample_rate), np.abs(np.fft.fft(letter_audio_data))
-                    letter_dominant_frequency = np.abs(letter_frequencies[np.argmax(_)])
-
-                    frequency_difference = abs(letter_dominant_frequency - dominant_frequency)
-
-                    if frequency_difference < min_difference:
-                        min_difference = frequency_difference
-                        closest_letter = letter
+                closest_letter = frequency_index.closest(dominant_frequency)
 
                 # Check if the recognized letter is not 'silence'
                 if closest_letter != 'silence':
@@ -77,66 +169,949 @@ def analyze_audio(sound, sound_map, sound_type):
 
     return recognized_text
 
+def frame_windows(samples, window_length):
+    """ View samples as a (n_windows, window_length) array without copying, the partial tail is left out """
+    n_windows = len(samples) // window_length
+    stride = samples.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        samples, shape=(n_windows, window_length), strides=(window_length * stride, stride), writeable=False)
+
+
+@instrumentation.timed('decode.fft')
+def dominant_frequencies(samples, sample_rate, window_length, block_windows=1024):
+    """ Dominant frequency of every consecutive window, FFT'd a block of windows at a time """
+    windows = frame_windows(samples, window_length)
+    tail = samples[len(windows) * window_length:]
+    result = np.empty(len(windows) + (1 if len(tail) else 0))
+
+    bin_frequencies = np.fft.rfftfreq(window_length, 1/sample_rate)
+    # Blocks keep the float spectrum bounded no matter how long the recording is
+    for start in range(0, len(windows), block_windows):
+        block = windows[start:start + block_windows]
+        bins = np.argmax(np.abs(np.fft.rfft(block, axis=1)), axis=1)
+        result[start:start + len(block)] = bin_frequencies[bins]
+
+    # The last, shorter window is analysed on its own like the per-segment decoder does
+    if len(tail):
+        result[-1] = dominant_frequency_of(tail, sample_rate)
+
+    instrumentation.count('decode.fft_windows', len(result))
+    instrumentation.add_bytes('decode.fft', samples.nbytes)
+    return result
+
+
+def text_from_windows(frequencies, letters, gap_frequency, consecutive_zeros=0):
+    """ Turn per-window frequencies and glyphs into text, returns (text, consecutive_zeros) so it can resume """
+    recognized_text = ""
+    for dominant_frequency, closest_letter in zip(frequencies, letters):
+        if dominant_frequency < gap_frequency:
+            consecutive_zeros += 1
+            if consecutive_zeros == 1:  # Only add a space for the first zero/gap frequency encountered
+                recognized_text += ' '
+        else:
+            consecutive_zeros = 0
+            if closest_letter != 'silence':
+                recognized_text += closest_letter
+    return recognized_text, consecutive_zeros
+
+
+@lru_cache(maxsize=32)
+def goertzel_candidates(sound_type, frequency_index, sample_rate, window_length):
+    """
+    Every frequency the Goertzel bank listens for, the glyphs plus the word gap tone, and the
+    frequency to report for each. The gap is reported the way the FFT detector reads one window
+    of it, so both detectors feed text_from_windows the same values.
+    """
+    candidates = {frequency: frequency for frequency in frequency_index.frequencies}
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    bank_window = int(round(window_length * bank.frame_rate / sample_rate))
+    if bank.gap is not None and len(bank.gap) >= bank_window:
+        candidates.setdefault(dominant_frequency_of(bank.gap, bank.frame_rate),
+                              dominant_frequency_of(bank.gap[:bank_window], bank.frame_rate))
+    listened = tuple(sorted(candidates))
+    return listened, np.array([candidates[frequency] for frequency in listened], dtype=float)
+
+
+@lru_cache(maxsize=32)
+def goertzel_bank(candidates, window_length, sample_rate):
+    """ Cosine and sine of every candidate frequency over one window, as (window_length, n_candidates) """
+    phase = 2 * np.pi * np.outer(np.arange(window_length), candidates) / sample_rate
+    return np.cos(phase).astype(np.float32), np.sin(phase).astype(np.float32)
+
+
+def strongest_candidates(windows, candidates, labels, sample_rate, min_tone_ratio):
+    cos_bank, sin_bank = goertzel_bank(candidates, windows.shape[1], sample_rate)
+    windows = windows.astype(np.float32)
+    power = (windows @ cos_bank) ** 2 + (windows @ sin_bank) ** 2
+    best = np.argmax(power, axis=1)
+    # A pure tone on a candidate puts (N/2) * energy into its bin, white noise about 2/N of that
+    energy = np.einsum('ij,ij->i', windows, windows) * windows.shape[1] / 2
+    is_tone = power[np.arange(len(best)), best] >= min_tone_ratio * np.maximum(energy, 1e-9)
+    return np.where(is_tone & (energy > 0), labels[best], 0.0)
+
+
+@instrumentation.timed('decode.goertzel')
+def goertzel_frequencies(samples, sample_rate, window_length, candidates, labels=None,
+                         block_windows=1024, min_tone_ratio=0.0):
+    """
+    Like dominant_frequencies, but only the known glyph frequencies are evaluated: every window is
+    projected onto a precomputed sine/cosine bank, one matrix multiply per block of windows.
+    Silent windows, and with `min_tone_ratio` > 0 windows whose best candidate holds less than
+    that share of the window energy, come back as 0 Hz, i.e. a gap. A hit on candidates[i] is
+    reported as labels[i], which defaults to the candidate itself.
+    """
+    labels = np.asarray(candidates, dtype=float) if labels is None else labels
+    windows = frame_windows(samples, window_length)
+    tail = samples[len(windows) * window_length:]
+    result = np.empty(len(windows) + (1 if len(tail) else 0))
+
+    for start in range(0, len(windows), block_windows):
+        block = windows[start:start + block_windows]
+        result[start:start + len(block)] = strongest_candidates(block, candidates, labels, sample_rate, min_tone_ratio)
+
+    if len(tail):
+        result[-1] = strongest_candidates(tail[None, :], candidates, labels, sample_rate, min_tone_ratio)[0]
+
+    instrumentation.count('decode.goertzel_windows', len(result))
+    instrumentation.add_bytes('decode.goertzel', samples.nbytes)
+    return result
+
+
+def window_frequencies(samples, sample_rate, window_length, sound_type, frequency_index, detector='fft'):
+    if detector == 'fft':
+        return dominant_frequencies(samples, sample_rate, window_length)
+    if detector == 'goertzel':
+        candidates, labels = goertzel_candidates(sound_type, frequency_index, sample_rate, window_length)
+        return goertzel_frequencies(samples, sample_rate, window_length, candidates, labels)
+    raise ValueError(f"Unknown detector '{detector}', expected 'fft' or 'goertzel'")
+
+
+def synced_frequencies(samples, sample_rate, window_frames, channels, sound_type, frequency_index,
+                       detector='fft', final=True, start=None):
+    """
+    Per-window frequencies with the windows placed on the glyph grid found by alignment.glyph_segments,
+    so leading silence, a capture trimmed mid-glyph or clock drift do not smear windows over two glyphs.
+    Returns (frequencies, frames used); without `final` the unused frames belong to the next block,
+    which is passed with `start` at the grid position carried over.
+    """
+    first_channel = samples[::channels] if channels > 1 else samples
+    candidates, _ = goertzel_candidates(sound_type, frequency_index, sample_rate, window_frames)
+    segments = alignment.glyph_segments(first_channel, sample_rate, window_frames, candidates,
+                                        final=final, start=start)
+    logging.debug(f"Decoding {len(segments)} synced segments, first window at sample {segments[0][0] if segments else None}")
+
+    pieces = []
+    for first, last in segments:
+        piece = first_channel[max(0, first):last]
+        if first < 0:
+            # The capture was trimmed inside its first glyph, what is missing of it is read as silence
+            piece = np.concatenate((np.zeros(-first, dtype=piece.dtype), piece))
+        pieces.append(window_frequencies(piece, sample_rate, window_frames, sound_type, frequency_index, detector))
+    frequencies = np.concatenate(pieces) if pieces else np.empty(0)
+    if segments:
+        return frequencies, segments[-1][1]
+    if start is not None:
+        return frequencies, start
+    # Still no grid, a glyph may be starting in the last window of silence so keep that for the next block
+    return frequencies, max(0, len(first_channel) - window_frames)
+
+
+@instrumentation.timed('decode.analyze')
+def analyze_samples(samples, sample_rate, sound_map, sound_type, channels=1, detector='fft', sync=True):
+    """
+    Batched counterpart of analyze_audio working on raw int16 samples instead of an AudioSegment.
+    `detector` is 'fft' (full spectrum per window) or 'goertzel' (only the known glyph frequencies).
+    With `sync` the windows follow the glyph onsets instead of starting at sample 0.
+    """
+    window_size = symbol_ms_for(sound_type)
+    gap_frequency = gap_frequency_for(sound_type)
+    frequency_index = get_frequency_index(sound_type, sound_map, sample_rate)
+    instrumentation.peak('decode.input', samples.nbytes)
+
+    window_frames = int(window_size * sample_rate / 1000)
+    if sync:
+        frequencies, _ = synced_frequencies(samples, sample_rate, window_frames, channels,
+                                            sound_type, frequency_index, detector)
+    else:
+        # Only the first channel is windowed, interleaved frames would read every tone an octave low
+        first_channel = samples[::channels] if channels > 1 else samples
+        frequencies = window_frequencies(first_channel, sample_rate, window_frames,
+                                         sound_type, frequency_index, detector)
+    letters = frequency_index.closest_many(frequencies)
+
+    recognized_text, _ = text_from_windows(frequencies, letters, gap_frequency)
+    return recognized_text
+
+
+PARALLEL_IDLE_RATIO = 0.25  # A band peak below this share of the loudest one is a silent band, not a character
+PARALLEL_ALIGN_STEPS = 32  # Frame starts tried within a frame of the onset
+PARALLEL_ALIGN_FRAMES = 8  # Frames scored for each of them
+PARALLEL_MIN_TAIL = 0.5  # Share of a frame the audio must still hold past the last whole one for it to be read
+
+
+def top_peaks(spectra, bins):
+    """
+    The N strongest spectral peaks of every window, one per band: for (windows, fft bins) magnitudes and
+    a (bands, tones) array of bins, the strongest tone of each band and its magnitude, both (windows, bands).
+    """
+    magnitudes = spectra[:, bins]
+    best = np.argmax(magnitudes, axis=2)
+    return best, np.take_along_axis(magnitudes, best[..., None], axis=2)[..., 0]
+
+
+def parallel_offset(samples, layout, onset):
+    """
+    Frame start near the onset where the band peaks hold the largest share of the spectrum, so a
+    capture with leading silence or one that starts mid frame is read frame-aligned. A coarse search
+    over PARALLEL_ALIGN_STEPS starts is refined to the sample around the best of them.
+    """
+    frame_length = layout.frame_length
+    step = max(1, frame_length // PARALLEL_ALIGN_STEPS)
+    coarse = range(max(0, onset - frame_length // 2), onset + frame_length // 2 + 1, step)
+    best = max((alignment_score(samples, layout, start), start) for start in coarse)
+    # The score falls off steadily either side of the true start, halve the step around the best one
+    while step > 1:
+        step = (step + 1) // 2
+        best = max([best] + [(alignment_score(samples, layout, start), start)
+                             for start in (best[1] - step, best[1] + step) if start >= 0])
+    return best[1]
+
+
+def alignment_score(samples, layout, start):
+    """ Share of the spectrum in the band peaks over PARALLEL_ALIGN_FRAMES frames from `start` """
+    windows = frame_windows(samples[start:start + layout.frame_length * PARALLEL_ALIGN_FRAMES], layout.frame_length)
+    if len(windows) == 0:
+        return -1.0
+    spectra = np.abs(np.fft.rfft(windows, axis=1))
+    _, peaks = top_peaks(spectra, layout.bins)
+    return float((peaks ** 2).sum() / max((spectra ** 2).sum(), 1e-9))
+
+
+@instrumentation.timed('decode.parallel')
+def decode_parallel_samples(samples, sample_rate, bands=parallel_tones.DEFAULT_BANDS,
+                            symbol_ms=parallel_tones.DEFAULT_SYMBOL_MS, block_windows=1024):
+    """
+    Decode mono parallel-tone audio (see parallel_tones.py): every frame-long window is FFT'd and the
+    strongest tone of each band read off with top_peaks, in frame then band order. Bands whose peak
+    is far below the loudest one in the recording are silent and left out.
+    """
+    layout = parallel_tones.get_layout(bands, symbol_ms, sample_rate)
+    onset = alignment.first_onset(samples, sample_rate)
+    if onset is None:
+        return ""
+    start = parallel_offset(samples, layout, onset)
+    frame_length = layout.frame_length
+    tail = (len(samples) - start) % frame_length
+    if tail >= frame_length * PARALLEL_MIN_TAIL:
+        # Audio that ends right on the last frame can still come out a few samples short of the grid
+        samples = np.concatenate((samples, np.zeros(frame_length - tail, dtype=samples.dtype)))
+    # A shorter partial last frame is a truncated capture, it is left out
+    windows = frame_windows(samples[start:], frame_length)
+
+    codes = np.empty((len(windows), bands), dtype=np.intp)
+    peaks = np.empty((len(windows), bands))
+    for first in range(0, len(windows), block_windows):
+        spectra = np.abs(np.fft.rfft(windows[first:first + block_windows], axis=1))
+        codes[first:first + len(spectra)], peaks[first:first + len(spectra)] = top_peaks(spectra, layout.bins)
+
+    instrumentation.count('decode.parallel_windows', len(windows))
+    instrumentation.add_bytes('decode.parallel', samples.nbytes)
+    if len(windows) == 0:
+        return ""
+    sounding = peaks >= PARALLEL_IDLE_RATIO * peaks.max()
+    return layout.text(codes[sounding])
+
+
+def iter_recognize(sound_file_path, sound_type, chunk_seconds=10, detector='fft', sync=True):
+    """
+    Decode a 16-bit WAV file block by block and yield the text as it is recognized.
+    Only one chunk of samples is in memory at a time, so memory stays flat for any recording length.
+    Morse goes through MorseStreamDecoder, which only keeps the audio since the last settled word.
+    """
+    if sound_type == "parallel":
+        raise ValueError(f"Streaming recognition is not available for {sound_type} audio")
+    if sound_type == "morse":
+        yield from iter_recognize_morse(sound_file_path, chunk_seconds)
+        return
+
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    sound_map = {k: bank.segment(k) for k in bank.glyphs}
+    window_size = symbol_ms_for(sound_type)
+    gap_frequency = gap_frequency_for(sound_type)
+
+    with wave.open(sound_file_path, 'rb') as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{sound_file_path} is not 16-bit PCM")
+        sample_rate = wav_file.getframerate()
+        channels = wav_file.getnchannels()
+        frequency_index = get_frequency_index(sound_type, sound_map, sample_rate)
+
+        # Chunks always hold whole windows, so window alignment carries over from one chunk to the next
+        window_frames = int(window_size * sample_rate / 1000)
+        chunk_frames = max(1, int(chunk_seconds * sample_rate) // window_frames) * window_frames
+
+        consecutive_zeros = 0
+        carry = np.empty(0, dtype='<i2')
+        grid_start = None
+        while True:
+            frames = wav_file.readframes(chunk_frames)
+            if sync:
+                # Frames past the last synced window are decoded with the next chunk
+                samples = np.concatenate((carry, np.frombuffer(frames, dtype='<i2')))
+                if len(samples) == 0:
+                    break
+                frequencies, used = synced_frequencies(samples, sample_rate, window_frames, channels, sound_type,
+                                                       frequency_index, detector, not frames, grid_start)
+                if len(frequencies):
+                    # Some lookback lets the next chunk re-fit the grid in either direction
+                    grid_start = min(used, window_frames + window_frames // 4)
+                carry = samples[(used - (grid_start or 0)) * channels:]
+            else:
+                if not frames:
+                    break
+                samples = np.frombuffer(frames, dtype='<i2')[::channels]
+                frequencies = window_frequencies(
+                    samples, sample_rate, window_frames, sound_type, frequency_index, detector)
+            letters = frequency_index.closest_many(frequencies)
+            text, consecutive_zeros = text_from_windows(frequencies, letters, gap_frequency, consecutive_zeros)
+            if text:
+                yield text
+            if not frames:
+                break
+
+
+def iter_recognize_morse(sound_file_path, chunk_seconds=10):
+    """ iter_recognize for Morse audio """
+    with wave.open(sound_file_path, 'rb') as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{sound_file_path} is not 16-bit PCM")
+        sample_rate = wav_file.getframerate()
+        decoder = MorseStreamDecoder(sample_rate, wav_file.getnchannels())
+        chunk_frames = max(1, int(chunk_seconds * sample_rate))
+        while True:
+            frames = wav_file.readframes(chunk_frames)
+            if not frames:
+                break
+            text = decoder.feed(np.frombuffer(frames, dtype='<i2'))
+            if text:
+                yield text
+    text = decoder.flush()
+    if text:
+        yield text
+
+
+LIVE_SYNC_WINDOWS = 3  # Windows after the first onset used to lock onto the grid before any text comes out
+LIVE_STEP_WINDOWS = 10  # Windows decoded between two checks of the CPU budget
+LIVE_CPU_SHARE = 0.5  # Share of a block's duration the decoder may spend on it
+LIVE_MAX_BACKLOG_SECONDS = 2.0  # Audio waiting to be decoded beyond this is skipped to catch up
+LIVE_RELOCK_WINDOWS = 10  # Gap windows in a row after which the next sound is synced from scratch
+
+
+class StreamDecoder:
+    """
+    Decode glyph audio as it arrives. feed() takes interleaved int16 blocks of any size and returns
+    the text of every glyph window they complete, flush() decodes what is left when the stream ends.
+
+    The grid is locked at the first onset and re-fitted every alignment.SYNC_INTERVAL_WINDOWS windows
+    like the batch decoder does, so a window costs one detector pass. Each feed() spends at most
+    `cpu_share` of its block's duration decoding; what is left waits for the next block, and once
+    more than LIVE_MAX_BACKLOG_SECONDS are waiting whole windows are skipped (`dropped_windows`).
+    With cpu_share=None every block is decoded completely, for audio that is not live.
+    """
+    def __init__(self, sound_type, sample_rate, channels=1, detector='fft', sync=True, cpu_share=LIVE_CPU_SHARE):
+        if sound_type == "morse":
+            raise ValueError("Use MorseStreamDecoder for morse audio")
+        bank = glyph_bank.get_glyph_bank(sound_type)
+        sound_map = {k: bank.segment(k) for k in bank.glyphs}
+        window_size = symbol_ms_for(sound_type)
+
+        self.sound_type = sound_type
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.detector = detector
+        self.sync = sync
+        self.cpu_share = cpu_share
+        self.gap_frequency = gap_frequency_for(sound_type)
+        self.frequency_index = get_frequency_index(sound_type, sound_map, sample_rate)
+        self.window_frames = int(window_size * sample_rate / 1000)
+        self.candidates, _ = goertzel_candidates(sound_type, self.frequency_index, sample_rate, self.window_frames)
+        # The tone banks are built here so their cost does not land on the first blocks
+        alignment.tone_bank(self.candidates, self.window_frames, sample_rate)
+        if detector == 'goertzel':
+            goertzel_bank(self.candidates, self.window_frames, sample_rate)
+
+        self.buffer = np.empty(0, dtype='<i2')  # Interleaved samples from frame `offset` on
+        self.offset = 0
+        self.position = None if sync else 0  # Frame where the next window starts, None until locked
+        self.windows_since_refit = 0
+        self.consecutive_zeros = 0
+        self.dropped_windows = 0
+        self.lock_attempted_at = None  # Frame count at the last attempt to lock, one is made per window
+
+    @property
+    def frames(self):
+        """ Frames received so far """
+        return self.offset + len(self.buffer) // self.channels
+
+    @instrumentation.timed('decode.live_block')
+    def feed(self, samples):
+        started = time.perf_counter()
+        self.buffer = np.concatenate((self.buffer, np.asarray(samples, dtype='<i2')))
+        instrumentation.peak('decode.live_buffer', self.buffer.nbytes)
+        if self.position is None and not self._lock():
+            return ""
+        if self.cpu_share is None:
+            budget = float('inf')
+        else:
+            budget = self.cpu_share * len(samples) / self.channels / self.sample_rate
+
+        W = self.window_frames
+        backlog = (self.frames - self.position) // W - int(LIVE_MAX_BACKLOG_SECONDS * self.sample_rate / W)
+        if backlog > 0 and self.cpu_share is not None:
+            logging.debug(f"Live decoder is behind, skipping {backlog} windows")
+            self.position += backlog * W
+            self.dropped_windows += backlog
+
+        text = ""
+        while self.position is not None:
+            step = self._decode(LIVE_STEP_WINDOWS)
+            if step is None:
+                break
+            text += step
+            if time.perf_counter() - started >= budget:
+                break
+        self._trim()
+        return text
+
+    def flush(self):
+        """ Decode everything still buffered, including a last window cut short """
+        W = self.window_frames
+        if self.position is None:
+            frequencies, _ = synced_frequencies(self.buffer, self.sample_rate, W, self.channels, self.sound_type,
+                                                self.frequency_index, self.detector)
+            text = self._text(frequencies)
+        else:
+            text = ""
+            while (step := self._decode(LIVE_STEP_WINDOWS, final=True)) is not None:
+                text += step
+            tail = self.frames - self.position
+            if tail >= W // 2:
+                first = self.position - self.offset
+                text += self._text(window_frequencies(self._mono()[first:], self.sample_rate, W,
+                                                      self.sound_type, self.frequency_index, self.detector))
+        self.offset = self.frames
+        self.buffer = self.buffer[:0]
+        self.position = None if self.sync else self.offset
+        return text
+
+    def _mono(self):
+        return self.buffer[::self.channels] if self.channels > 1 else self.buffer
+
+    def _lock(self):
+        """ Find the grid at the first onset, returns False while there is not enough sound for it """
+        W = self.window_frames
+        if self.lock_attempted_at is not None and self.frames - self.lock_attempted_at < W:
+            return False
+        self.lock_attempted_at = self.frames
+        mono = self._mono()
+        onset = alignment.first_onset(mono, self.sample_rate)
+        if onset is None:
+            self._drop(len(mono) - W)
+            return False
+        if len(mono) < onset + W + LIVE_SYNC_WINDOWS * W:
+            return False
+        start, score = alignment.sync_position(mono, self.sample_rate, W, self.candidates,
+                                               onset - W // 4, onset - W // 4 + W, LIVE_SYNC_WINDOWS)
+        if start is None or score < alignment.SYNC_MIN_SCORE:
+            # Not glyph audio, e.g. noise from a microphone, look for the next onset after it
+            self._drop(max(onset + W // 2, len(mono) - (LIVE_SYNC_WINDOWS + 1) * W))
+            return False
+        self.position = self.offset + start
+        self.windows_since_refit = 0
+        logging.debug(f"Live decoder locked onto the glyph grid at frame {self.position}, score {score:.2f}")
+        return True
+
+    def _decode(self, max_windows, final=False):
+        """ Text of up to `max_windows` whole windows from the grid position, None when none are complete """
+        W = self.window_frames
+        if self.sync and self.windows_since_refit >= alignment.SYNC_INTERVAL_WINDOWS:
+            # A re-fit looks a few windows ahead like glyph_segments does between two segments,
+            # only at the end of the stream it makes do with what there is
+            if not final and self.frames < self.position + (alignment.RESYNC_WINDOWS + 1) * W:
+                return None
+            local = alignment.refit_position(self._mono(), self.sample_rate, W, self.candidates,
+                                             self.position - self.offset)
+            self.position = self.offset + local
+            self.windows_since_refit = 0
+
+        count = min(max_windows, (self.frames - self.position) // W)
+        if self.sync:
+            count = min(count, alignment.SYNC_INTERVAL_WINDOWS - self.windows_since_refit)
+        if count <= 0:
+            return None
+        first = self.position - self.offset
+        frequencies = window_frequencies(self._mono()[first:first + count * W], self.sample_rate, W,
+                                         self.sound_type, self.frequency_index, self.detector)
+        self.position += count * W
+        self.windows_since_refit += count
+        text = self._text(frequencies)
+        if self.sync and self.consecutive_zeros >= LIVE_RELOCK_WINDOWS:
+            # The sender went quiet, whatever comes next is on a grid of its own
+            self._drop(self.position - self.offset)
+            self.position = None
+        return text
+
+    def _text(self, frequencies):
+        letters = self.frequency_index.closest_many(frequencies)
+        text, self.consecutive_zeros = text_from_windows(frequencies, letters, self.gap_frequency,
+                                                         self.consecutive_zeros)
+        return text
+
+    def _trim(self):
+        # A re-fit looks a window and a quarter back from the grid position
+        if self.position is not None:
+            self._drop(self.position - self.offset - self.window_frames - self.window_frames // 2)
+
+    def _drop(self, frames):
+        if frames > 0:
+            self.buffer = self.buffer[frames * self.channels:]
+            self.offset += frames
+
+
+MORSE_PAUSE_SECONDS = 0.3  # Silence that ends a word, the sequence rests 0.375 s between words
+MORSE_CONTEXT_SECONDS = 10.0  # Audio re-decoded at every pause before the words in it are settled
+MORSE_FEED_STEP_SECONDS = 0.1  # Longest piece of a block taken in at once, well under a pause
+
+
+class MorseStreamDecoder:
+    """
+    Decode Morse audio as it arrives. Tones are tracked from the envelope of each block and at every
+    pause of MORSE_PAUSE_SECONDS the audio since the last settled word is decoded again with
+    decode_morse_samples, so the dot length keeps being estimated from everything heard.
+    Only words beyond the ones already returned come out of feed().
+    """
+    def __init__(self, sample_rate, channels=1):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer = np.empty(0, dtype='<i2')  # First channel since the last settled word
+        self.scanned = 0  # Samples of the buffer already looked at for tones
+        self.level = 0.0
+        self.silent_blocks = 0
+        self.heard_tone = False
+        self.emitted_words = 0  # Words returned for the audio in the buffer
+        self.last_pause = 0  # Where the silence before the last decoded word starts
+
+    def feed(self, samples):
+        samples = np.asarray(samples, dtype='<i2')
+        samples = samples[::self.channels] if self.channels > 1 else samples
+        # Pauses are only looked for at the end of what has been fed, big blocks go in a step at a time
+        step = max(ENVELOPE_BLOCK, int(MORSE_FEED_STEP_SECONDS * self.sample_rate))
+        return ''.join(self._feed(samples[start:start + step]) for start in range(0, len(samples), step))
+
+    def _feed(self, samples):
+        self.buffer = np.concatenate((self.buffer, samples))
+        envelope = morse_envelope(self.buffer[self.scanned:])
+        self.scanned += len(envelope) * ENVELOPE_BLOCK
+        if len(envelope) == 0:
+            return ""
+
+        self.level = max(self.level, float(envelope.max()))
+        tones = np.flatnonzero(envelope > 0.5 * self.level)
+        if len(tones):
+            self.heard_tone = True
+            self.silent_blocks = len(envelope) - 1 - int(tones[-1])
+        else:
+            self.silent_blocks += len(envelope)
+        if not self.heard_tone or self.silent_blocks * ENVELOPE_BLOCK < MORSE_PAUSE_SECONDS * self.sample_rate:
+            return ""
+
+        self.heard_tone = False
+        text = self._decode(final=False)
+        pause = len(self.buffer) - self.silent_blocks * ENVELOPE_BLOCK
+        if len(self.buffer) > MORSE_CONTEXT_SECONDS * self.sample_rate:
+            # Everything before the last word is settled, that word stays as context for the next ones
+            self.buffer = self.buffer[self.last_pause:]
+            self.scanned -= self.last_pause
+            pause -= self.last_pause
+            self.emitted_words = len(self._words(final=False))
+        self.last_pause = pause
+        return text
+
+    def flush(self):
+        text = self._decode(final=True) if self.heard_tone else ""
+        self.buffer = self.buffer[:0]
+        self.scanned = 0
+        return text
+
+    def _words(self, final):
+        decoded = translate_morse_to_text(decode_morse_samples(self.buffer, self.sample_rate, final))
+        return decoded.split(' ') if decoded else []
+
+    def _decode(self, final):
+        words = self._words(final)
+        new_words = words[self.emitted_words:]
+        if not new_words:
+            return ""
+        text = (' ' if self.emitted_words else '') + ' '.join(new_words)
+        self.emitted_words = len(words)
+        return text
+
+
+def stream_decoder(sound_type, sample_rate, channels=1, **options):
+    """ The incremental decoder for a sound type, StreamDecoder or MorseStreamDecoder """
+    if sound_type == "parallel":
+        raise ValueError("parallel-tone audio is decoded in one go, use recognize_text_from_samples")
+    if sound_type == "morse":
+        return MorseStreamDecoder(sample_rate, channels)
+    return StreamDecoder(sound_type, sample_rate, channels, **options)
+
+
+def decode_blocks(blocks, sound_type, sample_rate, channels=1, **options):
+    """ Decode an iterable of interleaved int16 PCM blocks, yielding text as soon as it is recognized """
+    decoder = stream_decoder(sound_type, sample_rate, channels, **options)
+    for block in blocks:
+        text = decoder.feed(block)
+        if text:
+            yield text
+    text = decoder.flush()
+    if text:
+        yield text
+
+
+def recognize_text_with_progress(sound_file_path, sound_type, progress, block_seconds=1.0):
+    """
+    recognize_text_from_sound a block at a time, calling progress(frames done, frames) after every
+    block so a long decode can be followed and given up on (progress may raise). Files that are
+    not 16-bit WAV are converted with pydub first.
+    """
+    wav_file = None
+    try:
+        wav_file = wav_reader.open_wav(sound_file_path)
+    except ValueError:
+        pass
+    if wav_file is not None and wav_file.sample_width == 2:
+        samples, sample_rate, channels = wav_file.samples, wav_file.frame_rate, wav_file.channels
+    else:
+        from pydub import AudioSegment
+        sound = AudioSegment.from_file(sound_file_path).set_sample_width(2)
+        samples = np.array(sound.get_array_of_samples(), dtype=np.int16)
+        sample_rate, channels = sound.frame_rate, sound.channels
+
+    frames = len(samples) // channels
+    if sound_type in ("morse", "parallel"):
+        # Morse is timed against the whole recording and parallel tones are aligned on it, they are decoded in one go
+        progress(0, frames)
+        text = recognize_text_from_samples(samples, sample_rate, sound_type, channels)
+        progress(frames, frames)
+        return text
+
+    decoder = StreamDecoder(sound_type, sample_rate, channels, cpu_share=None)
+    block_frames = max(1, int(block_seconds * sample_rate))
+    text = ""
+    for start in range(0, frames, block_frames):
+        text += decoder.feed(samples[start * channels:(start + block_frames) * channels])
+        progress(min(frames, start + block_frames), frames)
+    return text + decoder.flush()
+
+
 def analyze_morse_audio(sound_file):
     morse_code = decode_morse_from_audio(sound_file)
     return translate_morse_to_text(morse_code)
 
 def decode_morse_from_audio(file_path):
-    samplerate, data = wavfile.read(file_path)
-    if data.ndim > 1:
-        data = data[:, 0]  # Take first channel if stereo
-
-    # Convert data to a normalized amplitude
-    data = np.abs(data.astype(float))
-    data = data / np.max(data)
-
-    # Threshold to detect presence of a tone
-    threshold = 0.5
-    is_tone = data > threshold
-
-    # Convert is_tone to change points (edges) and measure durations
-    changes = np.diff(is_tone.astype(int))
-    change_points = np.where(changes != 0)[0]
-    durations = np.diff(change_points) / samplerate
-
-    # Translate durations into Morse code
-    morse_code = ""
-    last_value = is_tone[0]
-    for duration in durations:
-        if last_value:  # Tone was on
-            if duration < 0.18:  # Duration slightly longer than a dot to accommodate inaccuracies
-                morse_code += "."
-            else:
-                morse_code += "-"
-        else:  # Tone was off
-            if duration < 0.18:
-                pass  # Ignore short gaps (within a letter)
-            elif duration < 0.4:
-                morse_code += " "  # Space between letters
-            else:
-                morse_code += "   "  # Space between words
-        last_value = not last_value
+    try:
+        wav_file = wav_reader.open_wav(file_path)
+    except ValueError:
+        # FLAC, Opus and anything else ffmpeg reads
+        samples, frame_rate, channels = audio_formats.read_audio(file_path)
+        return decode_morse_samples(samples[::channels], frame_rate)
+    return decode_morse_samples(wav_file.channel(0), wav_file.frame_rate)  # Take first channel if stereo
+
+
+ENVELOPE_BLOCK = 64  # Samples averaged into one envelope point
+ENVELOPE_SMOOTHING_SECONDS = 0.01
+MIN_RUN_SECONDS = 0.02  # Tone or gap runs shorter than this are glitches
+MIN_TONE_LEVEL = 64.0  # Envelope level (mean absolute int16) below which audio is taken as silence
+SLOT_WINDOW = 2048  # Samples FFT'd for the note of a slot
+PHASE_WINDOW = 1024  # Samples in the middle of a slot its phase is taken from, clear of edges only known to a block
+NOTE_CHANGE_HZ = 4.0
+PITCH_SNAP_HZ = 3.0  # Frequencies this close to an equal-tempered pitch are taken to be that pitch
+ON_GRID_TOLERANCE = 0.25  # Units a run may be off a whole number of sequence units
+MAX_LETTER_UNITS = 12  # Longest burst split into symbols, the longest letter of the sequence is 10 units
+TEMPO_TOLERANCE = 0.005  # Measured units this close to DOT_SECONDS are taken to be the sequence's own tempo
+STRETCHED_SPLIT_PENALTY = 0.05  # Coherence a split gives up per symbol when the tempo was measured
+CLOSING_UNITS = int(morse_playback.END_NOTE[1] / morse_playback.DOT_SECONDS)
+
+
+def morse_envelope(samples, block=ENVELOPE_BLOCK, chunk_blocks=65536):
+    """ Rectified, block-averaged and smoothed amplitude, one point per `block` samples """
+    n_blocks = len(samples) // block
+    envelope = np.empty(n_blocks, dtype=np.float32)
+    for start in range(0, n_blocks, chunk_blocks):
+        stop = min(n_blocks, start + chunk_blocks)
+        chunk = samples[start * block:stop * block].astype(np.float32)
+        envelope[start:stop] = np.abs(chunk).reshape(-1, block).mean(axis=1)
+    return envelope
+
+
+def runs_of(mask):
+    """ (starts, lengths, values) of the constant runs in a boolean array """
+    edges = np.flatnonzero(np.diff(mask.astype(np.int8))) + 1
+    starts = np.concatenate(([0], edges))
+    lengths = np.diff(np.concatenate((starts, [len(mask)])))
+    return starts, lengths, mask[starts]
+
+
+def estimate_unit(durations, unit=None, iterations=5):
+    """
+    Cluster durations onto integer multiples of one base unit (the dot length) and return that unit.
+    Starts from the shortest durations, or from the runs of about one `unit` when a starting value is
+    given, and refines with a least-squares fit over every run.
+    """
+    durations = np.sort(np.asarray(durations, dtype=float))
+    if unit is None:
+        unit = durations[int(0.1 * (len(durations) - 1))]
+    else:
+        # Runs of one unit cannot be mistaken for two even well off the starting tempo
+        single = durations[(durations > 0.5 * unit) & (durations < 1.5 * unit)]
+        if len(single):
+            unit = np.median(single)
+    for _ in range(iterations):
+        multiples = np.maximum(1, np.round(durations / unit))
+        unit = np.sum(durations * multiples) / np.sum(multiples * multiples)
+    return unit
+
+
+def slot_frequencies(samples, centers, sample_rate, window=SLOT_WINDOW, block_slots=1024):
+    """ Interpolated dominant frequency around each center, FFT'd a block of slots at a time """
+    hann = np.hanning(window).astype(np.float32)
+    offsets = np.arange(window) - window // 2
+    frequencies = np.empty(len(centers))
+    for start in range(0, len(centers), block_slots):
+        index = np.clip(centers[start:start + block_slots], window // 2, len(samples) - window // 2)[:, None] + offsets
+        spectrum = np.abs(np.fft.rfft(samples[index].astype(np.float32) * hann, axis=1)) + 1e-9
+        peak = np.clip(np.argmax(spectrum[:, 1:-1], axis=1) + 1, 1, spectrum.shape[1] - 2)
+        rows = np.arange(len(peak))
+        a, b, c = (np.log(spectrum[rows, peak + k]) for k in (-1, 0, 1))
+        shift = 0.5 * (a - c) / np.where(a - 2 * b + c == 0, -1e-9, a - 2 * b + c)
+        frequencies[start:start + len(peak)] = (peak + shift) * sample_rate / window
+    return frequencies
+
+
+def snap_to_pitches(frequencies, tempo=1.0):
+    """
+    Move every frequency within PITCH_SNAP_HZ of an equal-tempered pitch (A = 440 Hz) onto it.
+    Audio resampled to another `tempo` (the played unit over the sequence's) has every pitch divided
+    by it too, the frequencies are read that way when more of them land on a pitch like that.
+    """
+    frequencies = np.asarray(frequencies, dtype=float)
+    best = None
+    for factor in ((1.0, tempo) if tempo != 1 else (1.0,)):
+        played = frequencies * factor
+        pitches = 440.0 * 2 ** (np.round(12 * np.log2(np.maximum(played, 1.0) / 440.0)) / 12)
+        close = np.abs(pitches - played) <= PITCH_SNAP_HZ
+        if best is None or close.sum() > best[0]:
+            best = (close.sum(), np.where(close, pitches / factor, frequencies))
+    return best[1]
+
+
+def slot_phases(samples, slot_starts, frequencies, slot_length, sample_rate, window=PHASE_WINDOW):
+    """
+    Phase of the tone in the middle of every slot, demodulated against its own frequency with time
+    zero at the (fractional) slot start. A tone starting at phase zero there reads as -pi/2 whatever its note.
+    """
+    offsets = np.arange(window) + (int(slot_length) - window) // 2
+    first = np.floor(slot_starts).astype(int)
+    phasors = np.empty(len(slot_starts), dtype=np.complex128)
+    # Snapped notes repeat, so one reference serves every slot on the same frequency
+    notes, note_of_slot = np.unique(frequencies, return_inverse=True)
+    for note, frequency in enumerate(notes):
+        slots = np.flatnonzero(note_of_slot == note)
+        omega = 2 * np.pi * frequency / sample_rate
+        reference = np.exp(-1j * omega * offsets).astype(np.complex64)
+        index = np.clip(first[slots, None] + offsets, 0, len(samples) - 1)
+        phasors[slots] = (samples[index].astype(np.float32) @ reference) * np.exp(-1j * omega * (first[slots] - slot_starts[slots]))
+    return np.angle(phasors)
+
+
+def symbol_splits(changes, units, closing):
+    """
+    Every way to cut a burst of `units` unit slots into dots (1) and dashes (2) that starts a symbol
+    at every note change (changes[k] is True when slot k+1 is on another note than slot k), plus the
+    whole burst as one tone when it may be the closing note.
+    """
+    def splits(slot):
+        if slot == units:
+            yield ()
+            return
+        for length in (1, 2):
+            if slot + length <= units and not (length == 2 and changes[slot]):
+                for rest in splits(slot + length):
+                    yield (length,) + rest
+
+    yield from splits(0)
+    if closing:
+        yield (units,)
+
+
+def split_coherence(split, phases, omegas, changes, unit_samples, symbol_samples):
+    """
+    How well a split explains the phases of a burst's slots: every symbol starts at phase zero, so
+    each slot's phase is predicted from how far into its symbol the slot starts. Adjacent slots on
+    the same note are compared, which keeps a slightly off frequency from adding up over a long burst.
+    Plain lists, a burst is a handful of slots.
+    """
+    residuals = []
+    slot = 0
+    symbol_start = 0
+    for length in split:
+        for k in range(slot, slot + length):
+            residuals.append(phases[k] - omegas[k] * (k * unit_samples - symbol_start))
+        symbol_start += symbol_samples[length]
+        slot += length
+    return sum(math.cos(residuals[k + 1] - residuals[k]) for k in range(len(residuals) - 1) if not changes[k])
+
+
+@instrumentation.timed('decode.morse')
+def decode_morse_samples(samples, sample_rate, final=True):
+    """
+    Decode Morse audio into dots, dashes and spaces (' ' between letters, '   ' between words).
+
+    Tones are found from a smoothed envelope. The output of morse_code_to_musical_sequence is read
+    against its timing: every run is a whole number of units, measured from the runs themselves
+    starting from DOT_SECONDS so a capture played a little fast or slow still decodes. A gap of two
+    units or more is a word gap, and the symbols of a letter are back to back on random notes. A
+    burst is split at every note change, and between notes that repeat by the split whose symbols
+    all start at phase zero; the closing note is dropped. Classic Morse, with symbols separated by silence, is timed
+    against a dot length clustered from the recording itself.
+    Without `final` the audio is a prefix of a longer stream and its last tone is not known to be
+    the closing note.
+    """
+    samples = np.asarray(samples)
+    # Very short clips are padded so every analysis window fits
+    shortfall = 2 * SLOT_WINDOW - len(samples)
+    if shortfall > 0:
+        samples = np.concatenate((samples, np.zeros(shortfall, dtype=samples.dtype)))
+    block = ENVELOPE_BLOCK
+    envelope = morse_envelope(samples, block)
+    if len(envelope) == 0:
+        return ""
+
+    smoothing = max(1, int(ENVELOPE_SMOOTHING_SECONDS * sample_rate / block))
+    envelope = np.convolve(envelope, np.ones(smoothing, dtype=np.float32) / smoothing, mode='same')
+    level = np.percentile(envelope, 99)
+    if level < MIN_TONE_LEVEL:
+        return ""
+    is_tone = envelope > 0.5 * level
+
+    # Flip glitch-length runs so they merge into their neighbours
+    starts, lengths, values = runs_of(is_tone)
+    short = lengths < max(1, int(MIN_RUN_SECONDS * sample_rate / block))
+    short[0] = short[-1] = False
+    starts, lengths, values = runs_of(np.repeat(np.where(short, ~values, values), lengths))
+
+    # Leading and trailing silence say nothing about timing
+    inner = slice(1 if not values[0] else 0, len(values) - 1 if not values[-1] else len(values))
+    starts, lengths, values = starts[inner], lengths[inner], values[inner]
+    if not values.any():
+        return ""
+
+    # The sequence's dot length is only where the estimate starts, a capture may play slightly fast or slow
+    nominal_unit = morse_playback.DOT_SECONDS * sample_rate
+    unit_samples = estimate_unit(lengths * block, nominal_unit)
+    if len(lengths) > 1:
+        # Onset to onset spans whole units, which pins the unit down far better than any single run
+        span_units = np.maximum(1, np.round(lengths[:-1] * block / unit_samples)).sum()
+        unit_samples = (starts[-1] - starts[0]) * block / span_units
+    if abs(unit_samples / nominal_unit - 1) < TEMPO_TOLERANCE:
+        # Envelope edges are only known to a block, at the sequence's own tempo its exact lengths are better
+        unit_samples = nominal_unit
+    tempo = unit_samples / nominal_unit
+    runs = lengths * block / unit_samples
+    units = np.maximum(1, np.round(runs)).astype(int)
+    burst_units = units[values]
+    burst_starts = starts[values] * block
+
+    # Note of every unit-long slot of every burst, all in one batch
+    burst_of_slot = np.repeat(np.arange(len(burst_units)), burst_units)
+    slot_in_burst = np.arange(len(burst_of_slot)) - np.repeat(np.cumsum(burst_units) - burst_units, burst_units)
+    slot_starts = burst_starts[burst_of_slot] + slot_in_burst * unit_samples
+    frequencies = snap_to_pitches(slot_frequencies(samples, (slot_starts + unit_samples / 2).astype(int), sample_rate),
+                                  tempo)
+
+    on_grid = np.all(np.abs(runs - np.round(runs)) < ON_GRID_TOLERANCE)
+    spread = np.ptp(frequencies) > NOTE_CHANGE_HZ
+    if not spread and not (on_grid and np.isin(burst_units, (1, 3), invert=True).any()):
+        # One note, and every tone a dot or a dash of classic Morse
+        unit = estimate_unit(lengths)
+        letters = ['.' if length < 2 else '-' for length in np.maximum(1, np.round(lengths[values] / unit))]
+        gaps = np.maximum(1, np.round(lengths[~values] / unit))
+        separators = ['' if gap < 2 else (' ' if gap < 5 else '   ') for gap in gaps]
+    else:
+        omegas = 2 * np.pi * frequencies / sample_rate
+        phases = slot_phases(samples, slot_starts, frequencies, unit_samples, sample_rate)
+        changes = np.abs(np.diff(frequencies)) > NOTE_CHANGE_HZ
+        symbol_samples = {1: int(morse_playback.DOT_SECONDS * sample_rate * tempo),
+                          2: int(morse_playback.DASH_SECONDS * sample_rate * tempo)}
+        symbol_samples[CLOSING_UNITS] = int(morse_playback.END_NOTE[1] * sample_rate * tempo)
+        # Off the sequence's tempo the phases are only known roughly, and a note with a whole number of
+        # cycles per unit reads the same as a dash or two dots; a symbol more then has to earn its place
+        split_penalty = 0.0 if tempo == 1 else STRETCHED_SPLIT_PENALTY
+        letters = []
+        first_slot = 0
+        for burst, n_units in enumerate(burst_units):
+            slots = slice(first_slot, first_slot + n_units)
+            first_slot += n_units
+            burst_changes = changes[slots.start:slots.stop - 1].tolist()
+            last = burst == len(burst_units) - 1
+            closing = last and n_units == CLOSING_UNITS and not any(burst_changes)
+            if closing and final:
+                break
+            if n_units > MAX_LETTER_UNITS:
+                letters.append('')
+                continue
+            scored = []
+            burst_phases, burst_omegas = phases[slots].tolist(), omegas[slots].tolist()
+            for split in symbol_splits(burst_changes + [False], n_units, closing):
+                reading = '' if split == (n_units,) and closing else ''.join('.' if length == 1 else '-'
+                                                                             for length in split)
+                coherence = split_coherence(split, burst_phases, burst_omegas, burst_changes, unit_samples,
+                                            symbol_samples) - split_penalty * len(split)
+                # Real letters (or the closing note) first, then the split the phases agree with best
+                scored.append((reading not in MORSE_TO_TEXT and reading != '', -coherence, reading))
+            letters.append(min(scored)[2] if scored else '')
+        while letters and letters[-1] == '':
+            letters.pop()
+        if not letters:
+            return ""
+        separators = ['   ' if gap >= 2 else ' ' for gap in units[~values][:len(letters) - 1]]
+
+    morse_code = letters[0]
+    for separator, letter in zip(separators, letters[1:]):
+        morse_code += separator + letter
+    return morse_code.strip()
+
+
+MORSE_TO_TEXT = {
+    '.-': 'A', '-...': 'B', '-.-.': 'C', '-..': 'D', '.': 'E', '..-.': 'F',
+    '--.': 'G', '....': 'H', '..': 'I', '.---': 'J', '-.-': 'K', '.-..': 'L',
+    '--': 'M', '-.': 'N', '---': 'O', '.--.': 'P', '--.-': 'Q', '.-.': 'R',
+    '...': 'S', '-': 'T', '..-': 'U', '...-': 'V', '.--': 'W', '-..-': 'X',
+    '-.--': 'Y', '--..': 'Z', '-----': '0', '.----': '1', '..---': '2',
+    '...--': '3', '....-': '4', '.....': '5', '-....': '6', '--...': '7',
+    '---..': '8', '----.': '9', '/': ' ', '.-.-.-': '.', '--..--': ',',
+    '---...': ':', '-.-.-.': ';', '-...-': '=', '.----.': '\'', '-..-.': '/',
+    '-.-.--': '!', '..--..': '?', '.--.-.': '@', '-.--.': '('
+}
 
-    return morse_code
 
 def translate_morse_to_text(morse_code):
     """
     Translate Morse code to text using the Morse code dictionary.
     """
-    morse_to_text = {
-        '.-': 'A', '-...': 'B', '-.-.': 'C', '-..': 'D', '.': 'E', '..-.': 'F',
-        '--.': 'G', '....': 'H', '..': 'I', '.---': 'J', '-.-': 'K', '.-..': 'L',
-        '--': 'M', '-.': 'N', '---': 'O', '.--.': 'P', '--.-': 'Q', '.-.': 'R',
-        '...': 'S', '-': 'T', '..-': 'U', '...-': 'V', '.--': 'W', '-..-': 'X',
-        '-.--': 'Y', '--..': 'Z', '-----': '0', '.----': '1', '..---': '2',
-        '...--': '3', '....-': '4', '.....': '5', '-....': '6', '--...': '7',
-        '---..': '8', '----.': '9', '/': ' ', '.-.-.-': '.', '--..--': ',',
-        '---...': ':', '-.-.-.': ';', '-...-': '=', '.----.': '\'', '-..-.': '/',
-        '-.-.--': '!', '..--..': '?', '.--.-.': '@', '-.--.': '('
-    }
     words = []
     for word in morse_code.split("   "):  # Three spaces to split words
         letters = word.split()
-        translated_word = ''.join(morse_to_text.get(letter) for letter in letters if letter in morse_to_text)
+        translated_word = ''.join(MORSE_TO_TEXT.get(letter) for letter in letters if letter in MORSE_TO_TEXT)
         words.append(translated_word)
     return ' '.join(words)
\ No newline at end of file
@@ -0,0 +1,337 @@
+"""
+Local HTTP service for encoding and decoding.
+
+    python server.py --port 8765 --workers 4
+
+    POST /encode?type=modulated|non_human|narrowband|studio|morse|parallel&scale=C%20Major   body: UTF-8 text -> audio/wav
+    POST /decode?type=modulated|non_human|narrowband|studio|morse|parallel                    body: audio file -> text/plain
+    GET  /health
+    GET  /metrics                                                  Prometheus text, with --metrics
+
+/encode takes format=wav|mulaw|adpcm|flac|opus (see audio_formats, flac and opus need ffmpeg) and
+answers with that format's content type; /decode reads any of them back. Morse takes seed=<integer>,
+with one the same text always gets the same notes.
+The parallel type takes bands=4&symbol_ms=20 (those are the defaults) on both endpoints, the decoder
+has to be given what the encoder was. Requests are queued, and jobs arriving within --batch-window-ms of each other are sent to the
+worker pool together, split into a chunk per worker. When the queue is full the server answers 503 instead of piling up work.
+
+Encoded messages are kept in a per-worker memory cache of --cache-mb, and with --cache-dir in a
+directory of at most --cache-disk-mb shared by the workers (see encode_cache). Repeated messages
+are answered from there; Morse only when it has a seed, without one its notes are random.
+
+With --metrics the workers' timers and counters are merged into the server's after every batch.
+With --profile-dir a request can add profile=1 to its query to be run under cProfile, the stats
+file is named in the X-Profile response header.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import logging
+import os
+import wave
+from urllib.parse import urlsplit, parse_qs
+
+import audio_formats
+import encode_cache
+import instrumentation
+from app_logging import configure_logging
+from instrumentation import configure_metrics
+from combining_sounds import encode_audio, resource_path
+from parallel_tones import DEFAULT_BANDS, DEFAULT_SYMBOL_MS, encode_parallel_audio
+from recognize_text import recognize_text_from_samples
+from morse_playback import read_scales_from_file, morse_code_to_musical_sequence, write_sequence
+
+DEFAULT_SCALE = 'C Major'
+SOUND_TYPES = ('modulated', 'non_human', 'narrowband', 'studio', 'morse', 'parallel')
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+_scales = None
+
+
+class PayloadTooLarge(ValueError):
+    pass
+
+
+def morse_scales():
+    global _scales
+    if _scales is None:
+        _scales = read_scales_from_file(resource_path(os.path.join('morse', 'scales_frequencies.txt')))
+    return _scales
+
+
+def parallel_options(params):
+    return int(params.get('bands', DEFAULT_BANDS)), int(params.get('symbol_ms', DEFAULT_SYMBOL_MS))
+
+
+def encode_job(params, body):
+    sound_type = params.get('type', 'modulated')
+    format = params.get('format', 'wav')
+    text = body.decode('utf-8')
+    bands, symbol_ms = parallel_options(params)
+    scale = morse_scales()[params.get('scale', DEFAULT_SCALE)] if sound_type == 'morse' else None
+    seed = int(params['seed']) if params.get('seed') else None
+    cache = encode_cache.get_cache()
+    if cache is not None:
+        return cache.write(text, sound_type, format=format, scale=scale, seed=seed, bands=bands, symbol_ms=symbol_ms)
+    if sound_type == 'parallel':
+        return encode_parallel_audio(text, bands, symbol_ms, format=format)
+    if sound_type == 'morse':
+        sequence = morse_code_to_musical_sequence(text, scale, seed)
+        return write_sequence(sequence, scale, format=format)
+    return encode_audio(text, sound_type, format=format)
+
+
+def decode_job(params, body):
+    sound_type = params.get('type', 'modulated')
+    samples, frame_rate, channels = audio_formats.read_audio(body)
+    bands, symbol_ms = parallel_options(params)
+    return recognize_text_from_samples(samples, frame_rate, sound_type, channels,
+                                       bands=bands, symbol_ms=symbol_ms).encode('utf-8')
+
+
+JOBS = {'/encode': (encode_job, 'audio/wav'), '/decode': (decode_job, 'text/plain; charset=utf-8')}
+
+
+def content_type(path, params):
+    if path == '/encode':
+        return audio_formats.content_type_for(params.get('format', 'wav'))
+    return JOBS[path][1]
+
+
+def run_job(path, params, body):
+    try:
+        return 200, JOBS[path][0](params, body)
+    except (ValueError, KeyError, UnicodeDecodeError, wave.Error, EOFError) as e:
+        return 400, f"{type(e).__name__}: {e}".encode('utf-8')
+    except Exception as e:
+        logging.debug(f"Job {path} failed: {e}")
+        return 500, f"{type(e).__name__}: {e}".encode('utf-8')
+
+
+def run_jobs(jobs):
+    """
+    Run a micro-batch of (path, params, body) jobs in a worker. Returns one (status, payload, headers)
+    per job, and the worker's metrics since its last batch (None while metrics are off).
+    """
+    results = []
+    for path, params, body in jobs:
+        with instrumentation.profiled(path, params.get('profile') == '1') as capture:
+            with instrumentation.timer('server.job' + path.replace('/', '.')):
+                status, payload = run_job(path, params, body)
+        results.append((status, payload, [f"X-Profile: {capture.path}"] if capture.path else []))
+    return results, instrumentation.snapshot(reset=True)
+
+
+class BatchingService:
+    def __init__(self, executor, queue_size=256, batch_window_ms=5, max_batch=32, max_inflight=None, workers=1):
+        self.executor = executor
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch = max_batch
+        self.workers = workers
+        # Bounds the number of chunks handed to the pool, the queue absorbs the rest
+        self.inflight = asyncio.Semaphore(max_inflight or 2)
+        self.batcher = None
+
+    def start(self):
+        self.batcher = asyncio.get_running_loop().create_task(self._collect())
+
+    async def stop(self):
+        if self.batcher:
+            self.batcher.cancel()
+
+    def submit(self, path, params, body):
+        """ Queue a job and return a future for its (status, payload), or raise asyncio.QueueFull """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(((path, params, body), future))
+        return future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            instrumentation.count('server.batches')
+            instrumentation.peak('server.batch_jobs', len(batch))
+            # Spread over the pool, one worker running the whole batch would leave the others idle
+            # and hold every job back until the last one is done
+            size = -(-len(batch) // self.workers)
+            for start in range(0, len(batch), size):
+                await self.inflight.acquire()
+                loop.create_task(self._run(batch[start:start + size]))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results, worker_metrics = await loop.run_in_executor(self.executor, run_jobs, [job for job, _ in batch])
+            instrumentation.merge(worker_metrics)
+        except Exception as e:
+            results = [(500, f"{type(e).__name__}: {e}".encode('utf-8'), [])] * len(batch)
+        finally:
+            self.inflight.release()
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, version = request_line.decode('latin-1').split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > MAX_BODY_BYTES:
+        raise PayloadTooLarge(f"body of {length} bytes is over the {MAX_BODY_BYTES} byte limit")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, version, headers, body
+
+
+def write_response(writer, status, payload, content_type='text/plain; charset=utf-8', keep_alive=True, extra_headers=()):
+    headers = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+               f"Content-Type: {content_type}",
+               f"Content-Length: {len(payload)}",
+               f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    headers.extend(extra_headers)
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + payload)
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            try:
+                request = await read_request(reader)
+            except PayloadTooLarge:
+                write_response(writer, 413, b"payload too large", keep_alive=False)
+                break
+            except (ValueError, asyncio.IncompleteReadError):
+                write_response(writer, 400, b"bad request", keep_alive=False)
+                break
+            if request is None:
+                break
+            method, target, version, headers, body = request
+            keep_alive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+            url = urlsplit(target)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            if url.path == '/health':
+                write_response(writer, 200, b"ok", keep_alive=keep_alive)
+            elif url.path == '/metrics':
+                if instrumentation.enabled():
+                    write_response(writer, 200, instrumentation.prometheus_text(instrumentation.snapshot()).encode('utf-8'),
+                                   'text/plain; version=0.0.4; charset=utf-8', keep_alive=keep_alive)
+                else:
+                    write_response(writer, 404, b"metrics are off, start the server with --metrics", keep_alive=keep_alive)
+            elif url.path not in JOBS:
+                write_response(writer, 404, b"not found", keep_alive=keep_alive)
+            elif method != 'POST':
+                write_response(writer, 405, b"use POST", keep_alive=keep_alive)
+            elif params.get('type', 'modulated') not in SOUND_TYPES:
+                write_response(writer, 400, f"unknown type {params['type']}".encode('utf-8'), keep_alive=keep_alive)
+            elif params.get('format', 'wav') not in audio_formats.FORMATS:
+                write_response(writer, 400, f"unknown format {params['format']}".encode('utf-8'), keep_alive=keep_alive)
+            else:
+                try:
+                    with instrumentation.timer('server.request' + url.path.replace('/', '.')):
+                        status, payload, job_headers = await service.submit(url.path, params, body)
+                except asyncio.QueueFull:
+                    instrumentation.count('server.rejected')
+                    write_response(writer, 503, b"busy", keep_alive=keep_alive, extra_headers=["Retry-After: 1"])
+                else:
+                    instrumentation.count(f"server.status_{status}")
+                    instrumentation.add_bytes('server.request', len(body))
+                    response_type = content_type(url.path, params) if status == 200 else 'text/plain; charset=utf-8'
+                    write_response(writer, status, payload, response_type, keep_alive=keep_alive, extra_headers=job_headers)
+
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def export_metrics(interval):
+    """ Hand the metrics to the configured sink every `interval` seconds """
+    while True:
+        await asyncio.sleep(interval)
+        instrumentation.export()
+
+
+def init_worker(metrics_setup, cache_setup):
+    instrumentation.configure_metrics(*metrics_setup)
+    encode_cache.configure_cache(*cache_setup)
+
+
+async def serve(host, port, workers, queue_size, batch_window_ms, max_batch, metrics_interval=60, cache_setup=(0,)):
+    workers = workers or os.cpu_count()
+    # Workers keep their own metrics and hand them back with every batch, profiling follows the server
+    metrics_setup = (instrumentation.enabled(), instrumentation.MemorySink(), instrumentation.profile_dir())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                                initargs=(metrics_setup, cache_setup)) as executor:
+        service = BatchingService(executor, queue_size, batch_window_ms, max_batch, max_inflight=2 * workers,
+                                  workers=workers)
+        service.start()
+        exporter = None
+        if instrumentation.enabled() and metrics_interval:
+            exporter = asyncio.get_running_loop().create_task(export_metrics(metrics_interval))
+        server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+        print(f"audiocipher server listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if exporter:
+                exporter.cancel()
+            instrumentation.export()
+            await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve audiocipher encoding and decoding over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes for encode/decode jobs")
+    parser.add_argument('--queue-size', type=int, default=256, help="jobs waiting before new requests get a 503")
+    parser.add_argument('--batch-window-ms', type=float, default=5, help="how long to wait for more jobs to batch together")
+    parser.add_argument('--max-batch', type=int, default=32, help="largest number of jobs batched together, split between the workers")
+    parser.add_argument('--metrics', action='store_true', help="collect timers and counters, served on /metrics")
+    parser.add_argument('--metrics-file', help="also export them here, Prometheus text for a .prom file, else JSON lines")
+    parser.add_argument('--metrics-interval', type=float, default=60, help="seconds between exports to --metrics-file")
+    parser.add_argument('--profile-dir', help="where cProfile stats of requests sent with profile=1 are written")
+    parser.add_argument('--cache-mb', type=float, default=64, help="memory cache of encoded messages per worker, 0 for none")
+    parser.add_argument('--cache-dir', help="also keep encoded messages on disk here, shared by the workers")
+    parser.add_argument('--cache-disk-mb', type=float, default=512, help="size the --cache-dir is evicted down to")
+    args = parser.parse_args(argv)
+    configure_logging()
+    configure_metrics(True if args.metrics or args.metrics_file else None,
+                      instrumentation.sink_for(args.metrics_file) if args.metrics_file else None, args.profile_dir)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.queue_size, args.batch_window_ms, args.max_batch,
+                          args.metrics_interval, (int(args.cache_mb * 2 ** 20), args.cache_dir,
+                                                  int(args.cache_disk_mb * 2 ** 20))))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+Streaming playback: sound starts as soon as the first word is encoded instead of after the whole message.
+
+A producer thread pulls PCM blocks from a generator (combining_sounds.iter_encode_pcm word by word,
+morse_playback.iter_render_sequence note by note) into a ring buffer, and an output sink drains the
+ring buffer from its own callback or thread. Sinks open their backend in prepare() and start
+pulling blocks in start():
+
+    SoundDeviceSink   sounddevice.OutputStream callback
+    PygameSink        pygame.mixer.Channel queue
+    NullSink          no audio device, drains as fast as possible (or in real time) for headless runs
+"""
+import logging
+import threading
+import time
+
+import instrumentation
+
+DEFAULT_BLOCK_FRAMES = 1024
+DEFAULT_BUFFER_SECONDS = 2.0
+
+
+class RingBuffer:
+    """
+    Fixed size int16 ring buffer with one writer and one reader. The writer blocks while the
+    buffer is full, the reader never blocks so it can run inside an audio callback.
+    """
+    def __init__(self, capacity):
+        import numpy as np
+
+        self._buffer = np.zeros(int(capacity), dtype=np.int16)
+        self._read = 0
+        self._size = 0
+        self._closed = False
+        self._stopped = False
+        self._space = threading.Condition()
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def finished(self):
+        """ Nothing more will ever come out: the writer is done and everything was read, or it was stopped """
+        return self._stopped or (self._closed and self._size == 0)
+
+    def write(self, samples):
+        """ Append samples, waiting for room as needed. Returns False if the buffer was stopped meanwhile """
+        position = 0
+        while position < len(samples):
+            with self._space:
+                while self._size == self.capacity and not self._stopped:
+                    self._space.wait()
+                if self._stopped:
+                    return False
+                count = min(len(samples) - position, self.capacity - self._size)
+                start = (self._read + self._size) % self.capacity
+                first = min(count, self.capacity - start)
+                self._buffer[start:start + first] = samples[position:position + first]
+                self._buffer[:count - first] = samples[position + first:position + count]
+                self._size += count
+            position += count
+        return True
+
+    def read_into(self, out):
+        """ Fill `out` with as many samples as are available and zero the rest, returns the count copied """
+        with self._space:
+            count = min(len(out), self._size)
+            first = min(count, self.capacity - self._read)
+            out[:first] = self._buffer[self._read:self._read + first]
+            out[first:count] = self._buffer[:count - first]
+            self._read = (self._read + count) % self.capacity
+            self._size -= count
+            self._space.notify()
+        out[count:] = 0
+        return count
+
+    def close(self):
+        with self._space:
+            self._closed = True
+            self._space.notify_all()
+
+    def stop(self):
+        with self._space:
+            self._stopped = True
+            self._space.notify_all()
+
+
+class StreamPlayer:
+    """
+    Plays an iterable of int16 PCM blocks through a sink while the blocks are still being produced.
+    `first_audio_latency` is the time from start() until the sink first received real samples.
+    """
+    def __init__(self, blocks, sample_rate=44100, sink=None, block_frames=DEFAULT_BLOCK_FRAMES,
+                 buffer_seconds=DEFAULT_BUFFER_SECONDS):
+        self.blocks = blocks
+        self.sample_rate = sample_rate
+        self.block_frames = block_frames
+        self.sink = sink if sink is not None else default_sink()
+        self.ring = RingBuffer(max(block_frames * 2, int(buffer_seconds * sample_rate)))
+        # Importing and opening the audio backend is not part of the time to first audio
+        self.sink.prepare(sample_rate)
+        self.started_at = None
+        self.first_audio_at = None
+        self.frames_played = 0
+        self.underruns = 0
+        self.error = None
+        self._producer = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._producer = threading.Thread(target=self._produce, name='audiocipher-producer', daemon=True)
+        self._producer.start()
+        self.sink.start(self)
+        return self
+
+    def _produce(self):
+        try:
+            for block in self.blocks:
+                if not self.ring.write(block):
+                    return
+                instrumentation.peak('playback.ring_buffer', len(self.ring) * 2)
+        except Exception as e:
+            self.error = e
+            logging.debug(f"Streaming producer failed: {e}")
+        finally:
+            self.ring.close()
+
+    def pull(self, out):
+        """ Called by the sink for every output block, fills `out` and returns the number of real frames """
+        count = self.ring.read_into(out)
+        if count:
+            if self.first_audio_at is None:
+                self.first_audio_at = time.perf_counter()
+                instrumentation.record_time('playback.first_audio', self.first_audio_at - self.started_at)
+            self.frames_played += count
+        if count < len(out) and not self.ring.finished:
+            self.underruns += 1
+        return count
+
+    @property
+    def drained(self):
+        return self.ring.finished
+
+    @property
+    def active(self):
+        return self.sink.active
+
+    @property
+    def first_audio_latency(self):
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.started_at
+
+    def stop(self):
+        self.ring.stop()
+        self.sink.stop()
+
+    def wait(self, timeout=None):
+        """ Block until the sink has played everything, returns False on timeout """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.active:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+class NullSink:
+    """
+    Output sink without an audio device. With `realtime` it consumes at the sample rate like a
+    sound card would, otherwise as fast as the producer allows. `keep` collects everything played.
+    """
+    def __init__(self, realtime=False, keep=False):
+        self.realtime = realtime
+        self.keep = keep
+        self.played = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def prepare(self, sample_rate):
+        pass
+
+    def start(self, player):
+        self._thread = threading.Thread(target=self._run, args=(player,), name='audiocipher-null-sink', daemon=True)
+        self._thread.start()
+
+    def _run(self, player):
+        import numpy as np
+
+        block_seconds = player.block_frames / player.sample_rate
+        next_block = time.perf_counter()
+        while not self._stop.is_set() and not player.drained:
+            out = np.empty(player.block_frames, dtype=np.int16)
+            count = player.pull(out)
+            if self.keep and count:
+                self.played.append(out[:count])
+            if self.realtime:
+                next_block += block_seconds
+                time.sleep(max(0.0, next_block - time.perf_counter()))
+            elif not count:
+                time.sleep(0.0005)
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+
+
+class SoundDeviceSink:
+    """ Plays through a sounddevice.OutputStream, the ring buffer is drained from the stream callback """
+    def __init__(self, device=None, latency='low'):
+        self.device = device
+        self.latency = latency
+        self.stream = None
+        self._done = threading.Event()
+        self._sounddevice = None
+
+    def prepare(self, sample_rate):
+        import sounddevice
+        self._sounddevice = sounddevice
+
+    def start(self, player):
+        sounddevice = self._sounddevice
+
+        def callback(outdata, frames, time_info, status):
+            player.pull(outdata[:, 0])
+            if player.drained:
+                raise sounddevice.CallbackStop
+
+        self.stream = sounddevice.OutputStream(
+            samplerate=player.sample_rate, channels=1, dtype='int16', blocksize=player.block_frames,
+            device=self.device, latency=self.latency, callback=callback, finished_callback=self._done.set)
+        self.stream.start()
+
+    @property
+    def active(self):
+        return self.stream is not None and not self._done.is_set()
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.abort()
+            self.stream.close()
+            self._done.set()
+
+
+class PygameSink:
+    """ Plays through a pygame mixer channel, a feeder thread keeps one block queued behind the playing one """
+    def __init__(self):
+        self.channel = None
+        self._pygame = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @instrumentation.timed('playback.mixer_init')
+    def prepare(self, sample_rate):
+        import os
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        import pygame
+
+        settings = pygame.mixer.get_init()
+        if settings is None or settings[0] != sample_rate:
+            if settings is not None:
+                pygame.mixer.quit()
+            pygame.mixer.init(frequency=sample_rate, size=-16, channels=1, buffer=512)
+        self.channel = pygame.mixer.find_channel(True)
+        self._pygame = pygame
+
+    def start(self, player):
+        self._thread = threading.Thread(target=self._run, args=(player, self._pygame), name='audiocipher-pygame-sink', daemon=True)
+        self._thread.start()
+
+    def _run(self, player, pygame):
+        import numpy as np
+
+        output_channels = pygame.mixer.get_init()[2]
+        while not self._stop.is_set():
+            if self.channel.get_queue() is not None:
+                time.sleep(0.002)
+                continue
+            out = np.empty(player.block_frames, dtype=np.int16)
+            count = player.pull(out)
+            if count == 0 and player.drained:
+                break
+            samples = np.repeat(out[:count], output_channels) if output_channels > 1 else out[:count]
+            sound = pygame.mixer.Sound(buffer=samples.tobytes())
+            if self.channel.get_busy():
+                self.channel.queue(sound)
+            else:
+                self.channel.play(sound)
+        # Let the last queued blocks finish unless playback was stopped
+        while not self._stop.is_set() and self.channel.get_busy():
+            time.sleep(0.01)
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        if self.channel is not None:
+            self.channel.stop()
+
+
+def default_sink():
+    """ sounddevice when it is installed and has an output device, pygame otherwise """
+    try:
+        import sounddevice
+        sounddevice.query_devices(kind='output')
+        return SoundDeviceSink()
+    except Exception as e:
+        logging.debug(f"sounddevice unavailable, streaming through pygame: {e}")
+        return PygameSink()
+
+
+def stream_text(text, sound_type, sink=None, start=True, **options):
+    """
+    Stream an encoded message, returns the StreamPlayer. With start=False it is only prepared
+    (glyphs and audio backend loaded), so that can happen off the GUI thread.
+    """
+    import combining_sounds
+    import glyph_bank
+
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    blocks = combining_sounds.iter_encode_pcm(text, sound_type)
+    player = StreamPlayer(blocks, bank.frame_rate, sink, **options)
+    return player.start() if start else player
+
+
+def stream_morse(sequence, scale, sink=None, sample_rate=44100, start=True, **options):
+    """ Stream a Morse note sequence from morse_code_to_musical_sequence, returns the StreamPlayer like stream_text """
+    import morse_playback
+
+    blocks = morse_playback.iter_render_sequence(sequence, scale, sample_rate)
+    player = StreamPlayer(blocks, sample_rate, sink, **options)
+    return player.start() if start else player
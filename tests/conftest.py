@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+
+@pytest.fixture(autouse=True)
+def repo_directory(monkeypatch):
+    """ Glyph directories and the Morse scales resolve against the working directory """
+    monkeypatch.chdir(REPO)
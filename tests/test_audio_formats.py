@@ -0,0 +1,115 @@
+import io
+import shutil
+import warnings
+
+import numpy as np
+import pytest
+
+import audio_formats
+import wav_reader
+from encode_cache import render
+from morse_playback import read_scales_from_file
+from recognize_text import recognize_text_from_sound
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    audioop = pytest.importorskip('audioop')
+
+FORMATS = ['wav', 'mulaw', 'adpcm'] + [format for format in ('flac', 'opus') if shutil.which('ffmpeg')]
+
+
+class Pipe(io.RawIOBase):
+    """ A destination that cannot seek, like a socket or stdout """
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += bytes(data)
+        return len(data)
+
+
+def sine(frames, channels=1):
+    return (np.sin(np.arange(frames * channels) * 0.05) * 20000).astype(np.int16)
+
+
+@pytest.mark.parametrize('format', ['wav', 'mulaw', 'adpcm'])
+def test_streamed_to_a_destination_that_cannot_seek(format):
+    samples = sine(10000)
+    pipe = Pipe()
+    with audio_formats.open_writer(pipe, 44100, 1, format) as writer:
+        writer.write(samples[:1234])
+        writer.write(samples[1234:])
+    read_back = wav_reader.WavFile(bytes(pipe.data)).samples
+    # Without a fact chunk filled in, ADPCM also returns the padding of its last block
+    assert len(samples) <= len(read_back) <= len(samples) + 8
+    expected = audio_formats.write_audio(samples, 44100, None, 1, format)
+    assert np.array_equal(read_back[:len(samples)], wav_reader.WavFile(expected).samples)
+
+
+def test_mulaw_matches_audioop():
+    rng = np.random.default_rng(1)
+    samples = np.concatenate((np.arange(-32768, 32768).astype(np.int16),
+                              rng.normal(0, 8000, 10000).clip(-32768, 32767).astype(np.int16)))
+    assert audio_formats.mulaw_encode(samples).tobytes() == audioop.lin2ulaw(samples.tobytes(), 2)
+    codes = np.arange(256, dtype=np.uint8)
+    assert audio_formats.mulaw_decode(codes).tobytes() == audioop.ulaw2lin(codes.tobytes(), 2)
+
+
+def test_adpcm_matches_audioop():
+    rng = np.random.default_rng(2)
+    blocks = (np.sin(np.arange(8 * 505).reshape(8, 505) * 0.07) * 20000 +
+              rng.normal(0, 3000, (8, 505))).clip(-32768, 32767).astype(np.int16)
+    first, indexes, codes = audio_formats.adpcm_encode_blocks(blocks)
+    decoded = audio_formats.adpcm_decode_blocks(first, indexes, codes)
+    for row in range(len(blocks)):
+        # audioop carries the block's first sample and step index as its state, and packs the high nibble first
+        state = (int(first[row]), int(indexes[row]))
+        expected, _ = audioop.lin2adpcm(blocks[row, 1:].tobytes(), 2, state)
+        packed = np.frombuffer(expected, dtype=np.uint8)
+        assert np.array_equal(codes[row], np.stack((packed >> 4, packed & 0x0F), axis=1).reshape(-1))
+        assert decoded[row, 1:].tobytes() == audioop.adpcm2lin(expected, 2, state)[0]
+
+
+@pytest.mark.filterwarnings('error::RuntimeWarning')
+@pytest.mark.parametrize('format', ['wav', 'mulaw', 'adpcm'])
+@pytest.mark.parametrize('channels', [1, 2])
+@pytest.mark.parametrize('frames', [0, 1, 9, 505])
+def test_round_trip_of_odd_lengths(format, channels, frames):
+    samples = sine(frames, channels)
+    read_back = wav_reader.WavFile(audio_formats.write_audio(samples, 44100, None, channels, format))
+    assert (read_back.frame_rate, read_back.channels, len(read_back.samples)) == (44100, channels, len(samples))
+    if format == 'wav':
+        assert np.array_equal(read_back.samples, samples)
+    elif format == 'mulaw':
+        assert np.array_equal(read_back.samples, audio_formats.mulaw_decode(audio_formats.mulaw_encode(samples)))
+    elif frames:
+        # Each block starts on its first sample exactly, the rest is within a few percent
+        assert np.array_equal(read_back.samples[:channels], samples[:channels])
+        assert np.abs(read_back.samples.astype(int) - samples).max() < 2000
+
+
+@pytest.mark.parametrize('format', FORMATS)
+@pytest.mark.parametrize('sound_type', ['modulated', 'beeps', 'non_human', 'narrowband', 'studio', 'morse',
+                                        'parallel'])
+def test_every_sound_type_decodes_from_every_format(tmp_path, format, sound_type):
+    text = "SOS 42" if sound_type == 'morse' else "fmt42"
+    options = {}
+    if sound_type == 'morse':
+        options = {'scale': read_scales_from_file('morse/scales_frequencies.txt')['C Major'], 'seed': 4}
+    samples, frame_rate, channels = render(text, sound_type, **options)
+    file_path = str(tmp_path / f"message{audio_formats.extension_for(format)}")
+    audio_formats.write_audio(samples, frame_rate, file_path, channels, format)
+    assert recognize_text_from_sound(file_path, sound_type) == text
+
+
+@pytest.mark.parametrize('format', FORMATS)
+def test_stereo_decodes_from_its_first_channel(tmp_path, format):
+    samples, frame_rate, _ = render("two channels", 'modulated')
+    stereo = np.stack((samples, samples // 2), axis=1).reshape(-1)
+    file_path = str(tmp_path / f"stereo{audio_formats.extension_for(format)}")
+    audio_formats.write_audio(stereo, frame_rate, file_path, 2, format)
+    assert audio_formats.read_audio(file_path)[1:] == (frame_rate, 2)
+    assert recognize_text_from_sound(file_path, 'modulated') == "two channels"
@@ -0,0 +1,65 @@
+import multiprocessing
+import time
+
+import pytest
+
+import batch
+import encode_cache
+
+# Workers see the patched encode_item only when they are forked from this process
+needs_fork = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="needs forked workers")
+
+
+def slow_encode_item(item, output_path, format='wav'):
+    if item['text'] == 'hang':
+        time.sleep(60)
+    if item['text'] == 'crash':
+        import os
+        os._exit(3)
+    return {'output': output_path, 'format': format, 'characters': len(item['text'])}
+
+
+def statuses(results):
+    return [(result['index'], result['status']) for result in results]
+
+
+@needs_fork
+def test_timed_out_worker_is_replaced_and_only_its_unfinished_rows_time_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'encode_item', slow_encode_item)
+    items = [{'text': text} for text in ('first', 'hang', 'never started', 'after', 'last')]
+    started = time.monotonic()
+    results = list(batch.run_batch(items, str(tmp_path), workers=1, chunksize=3, timeout=1.0))
+    assert time.monotonic() - started < 15
+    assert statuses(results) == [(0, 'ok'), (1, 'timeout'), (2, 'timeout'), (3, 'ok'), (4, 'ok')]
+
+
+@needs_fork
+def test_rows_waiting_for_a_worker_are_not_timed_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'encode_item', slow_encode_item)
+    items = [{'text': 'hang'}] + [{'text': f"row {index}"} for index in range(4)]
+    # Both later chunks wait behind the hanging one for the only worker, far longer than their own timeout
+    results = list(batch.run_batch(items, str(tmp_path), workers=1, chunksize=1, timeout=1.5))
+    assert statuses(results) == [(0, 'timeout')] + [(index, 'ok') for index in range(1, 5)]
+
+
+@needs_fork
+def test_a_dead_worker_fails_only_its_unfinished_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'encode_item', slow_encode_item)
+    items = [{'text': text} for text in ('first', 'crash', 'lost', 'next')]
+    results = list(batch.run_batch(items, str(tmp_path), workers=2, chunksize=3))
+    assert statuses(results) == [(0, 'ok'), (1, 'error'), (2, 'error'), (3, 'ok')]
+    assert 'exited with code 3' in results[1]['error']
+
+
+def test_only_short_messages_go_through_the_cache(tmp_path):
+    cache = encode_cache.configure_cache(2 ** 20)
+    try:
+        short = {'text': "status ok", 'type': 'narrowband'}
+        long = {'text': "x" * (batch.CACHE_MAX_CHARACTERS + 1), 'type': 'narrowband'}
+        for _ in range(2):
+            batch.encode_item(short, str(tmp_path / 'short.wav'))
+            batch.encode_item(long, str(tmp_path / 'long.wav'))
+        assert cache.stats['misses'] == 1 and cache.stats['memory_hits'] >= 1
+        assert all(key[0] == encode_cache.cache_key("status ok", 'narrowband') for key in cache._memory)
+    finally:
+        encode_cache.configure_cache(0)
@@ -0,0 +1,144 @@
+import random
+import wave
+
+import numpy as np
+import pytest
+
+import alphabet_profile
+import glyph_bank
+import recognize_text
+from alphabet_profile import AlphabetProfile
+from combining_sounds import encode_pcm
+from morse_playback import morse_code, morse_code_to_musical_sequence, read_scales_from_file, render_sequence
+from parallel_tones import encode_parallel_pcm, get_layout
+from recognize_text import decode_morse_samples, recognize_text_from_samples, translate_morse_to_text
+
+SCALES = read_scales_from_file('morse/scales_frequencies.txt')
+
+
+def decode_morse(text, scale_name='C Major', seed=0):
+    scale = SCALES[scale_name]
+    samples = render_sequence(morse_code_to_musical_sequence(text, scale, seed), scale)
+    return translate_morse_to_text(decode_morse_samples(samples, 44100))
+
+
+def morse_text(text):
+    """ What the sequence can carry: upper case, only characters with a Morse code, one space between words """
+    words = (''.join(char for char in word if char in morse_code) for word in text.upper().split())
+    return ' '.join(word for word in words if word)
+
+
+def test_reregistered_profile_is_decoded_with_its_new_glyphs():
+    original = alphabet_profile.get_profile('narrowband')
+    bank = glyph_bank.get_glyph_bank('narrowband')
+    assert recognize_text_from_samples(encode_pcm("hello world", 'narrowband'), bank.frame_rate,
+                                       'narrowband') == "hello world"
+    try:
+        alphabet_profile.register_profile(AlphabetProfile('narrowband', sample_rate=8000, symbol_ms=30, gap_ms=60,
+                                                          base_frequency=900))
+        glyph_bank.invalidate('narrowband')
+        for detector in ('fft', 'goertzel'):
+            assert recognize_text_from_samples(encode_pcm("hello world", 'narrowband'), 8000, 'narrowband',
+                                               detector=detector) == "hello world"
+    finally:
+        alphabet_profile.register_profile(original)
+        glyph_bank.invalidate('narrowband')
+
+
+def test_random_morse_messages_decode_exactly():
+    rng = random.Random(12)
+    names = sorted(SCALES)
+    for seed in range(72):
+        text = ' '.join(''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789') for _ in range(rng.randint(1, 7)))
+                        for _ in range(rng.randint(2, 6)))
+        assert decode_morse(text, names[seed % len(names)], seed) == text
+
+
+@pytest.mark.parametrize('text', ["HELLO, WORLD!", "  spaced   out ", "E", "T", "M", "0"])
+def test_morse_decodes_what_the_sequence_carries(text):
+    for seed in range(8):
+        assert decode_morse(text, seed=seed) == morse_text(text)
+
+
+@pytest.mark.parametrize('stretch', [0.9, 0.97, 1.03, 1.1])
+def test_morse_played_at_another_tempo_decodes(stretch):
+    scale = SCALES['C Major']
+    samples = render_sequence(morse_code_to_musical_sequence("hello world sos", scale, seed=3), scale)
+    # Resampled, so every duration and every pitch moves by the same factor
+    stretched = np.interp(np.arange(int(len(samples) * stretch)) / stretch, np.arange(len(samples)), samples)
+    assert translate_morse_to_text(decode_morse_samples(stretched.astype(np.int16), 44100)) == "HELLO WORLD SOS"
+
+
+def test_morse_without_a_message_decodes_to_nothing():
+    for seed in range(8):
+        assert decode_morse("", seed=seed) == ""
+    assert decode_morse_samples(np.zeros(44100, dtype=np.int16), 44100) == ""
+
+
+def test_iter_recognize_streams_morse_with_a_bounded_buffer(tmp_path, monkeypatch):
+    text = ' '.join(f"WORD{number} SENT" for number in range(12))
+    scale = SCALES['C Major']
+    samples = render_sequence(morse_code_to_musical_sequence(text, scale, seed=5), scale)
+    assert len(samples) > 3 * recognize_text.MORSE_CONTEXT_SECONDS * 44100
+    file_path = str(tmp_path / 'morse.wav')
+    with wave.open(file_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(44100)
+        wav_file.writeframes(samples.tobytes())
+
+    buffered = []
+    feed = recognize_text.MorseStreamDecoder._feed
+    def watched_feed(decoder, block):
+        text = feed(decoder, block)
+        buffered.append(len(decoder.buffer))
+        return text
+    monkeypatch.setattr(recognize_text.MorseStreamDecoder, '_feed', watched_feed)
+
+    pieces = list(recognize_text.iter_recognize(file_path, 'morse', chunk_seconds=5))
+    assert len(pieces) > 1
+    assert ''.join(pieces) == text
+    # The context, the word kept with it and the pause that ends the next one, never the whole recording
+    assert max(buffered) < (recognize_text.MORSE_CONTEXT_SECONDS + 5) * 44100
+
+
+@pytest.mark.parametrize('bands, symbol_ms', [(1, 20), (4, 20)])
+def test_parallel_keeps_the_last_frame_after_off_grid_leading_silence(bands, symbol_ms):
+    layout = get_layout(bands, symbol_ms)
+    text = "the last frame counts too"
+    # No silence after the message, so its last frame ends exactly where the audio does
+    samples = np.concatenate((np.zeros(1234, dtype=np.int16), encode_parallel_pcm(text, bands, symbol_ms)))
+    assert recognize_text_from_samples(samples, 44100, 'parallel', bands=bands, symbol_ms=symbol_ms) == \
+        layout.normalize(text)
+    assert recognize_text_from_samples(samples[:-layout.frame_length // 4], 44100, 'parallel', bands=bands,
+                                       symbol_ms=symbol_ms) == layout.normalize(text)
+
+
+@pytest.mark.parametrize('detector', ['fft', 'goertzel'])
+def test_capture_trimmed_inside_its_first_glyph_keeps_that_glyph(detector):
+    samples = encode_pcm("hello world again", 'modulated')
+    assert recognize_text_from_samples(samples[777:], 44100, 'modulated', detector=detector) == "hello world again"
+
+
+def add_noise(samples, snr_db, seed=0):
+    rng = np.random.default_rng(seed)
+    signal_power = np.mean(samples.astype(np.float64) ** 2)
+    noise = rng.normal(0, np.sqrt(signal_power / 10 ** (snr_db / 10)), len(samples))
+    return np.clip(samples + noise, -32768, 32767).astype(np.int16)
+
+
+@pytest.mark.parametrize('sound_type', ['modulated', 'non_human', 'narrowband', 'studio'])
+@pytest.mark.parametrize('snr_db', [None, 10, 0])
+@pytest.mark.parametrize('text', ["the quick brown fox jumps over the lazy dog 0123456789!",
+                                  "pack,my.box?with;five-dozen:liquor/jugs"])
+def test_goertzel_and_fft_decode_the_same_text(sound_type, snr_db, text):
+    bank = glyph_bank.get_glyph_bank(sound_type)
+    samples = encode_pcm(text, sound_type)
+    if snr_db is not None:
+        samples = add_noise(samples, snr_db)
+    fft = recognize_text_from_samples(samples, bank.frame_rate, sound_type, bank.channels)
+    goertzel = recognize_text_from_samples(samples, bank.frame_rate, sound_type, bank.channels, detector='goertzel')
+    assert goertzel == fft
+    # non_human word gaps sit on its gap frequency and are not read as spaces, only whole words are compared
+    if ' ' not in text:
+        assert fft == text
@@ -0,0 +1,46 @@
+import itertools
+import time
+
+import numpy as np
+
+from streaming_playback import NullSink, StreamPlayer
+
+
+def blocks_of(samples, size):
+    for start in range(0, len(samples), size):
+        yield samples[start:start + size]
+
+
+def test_every_frame_is_played_in_order():
+    samples = np.arange(50_000, dtype=np.int64).astype(np.int16)
+    sink = NullSink(keep=True)
+    player = StreamPlayer(blocks_of(samples, 777), 8000, sink, block_frames=256, buffer_seconds=0.5).start()
+    assert player.wait(timeout=10)
+    assert player.error is None
+    assert player.frames_played == len(samples)
+    assert np.array_equal(np.concatenate(sink.played), samples)
+    assert player.first_audio_latency is not None
+
+
+def test_a_slow_producer_is_counted_as_underruns():
+    def slow_blocks():
+        for _ in range(5):
+            time.sleep(0.05)
+            yield np.ones(100, dtype=np.int16)
+
+    player = StreamPlayer(slow_blocks(), 8000, NullSink(), block_frames=256).start()
+    assert player.wait(timeout=10)
+    assert player.frames_played == 500
+    assert player.underruns > 0
+
+
+def test_stop_ends_the_sink_and_the_producer():
+    endless = itertools.repeat(np.ones(1024, dtype=np.int16))
+    player = StreamPlayer(endless, 8000, NullSink(realtime=True), block_frames=256, buffer_seconds=0.5).start()
+    time.sleep(0.1)
+    player.stop()
+    assert player.wait(timeout=2)
+    # The producer was waiting for room in the full ring buffer, stopping it lets the thread end
+    player._producer.join(timeout=2)
+    assert not player._producer.is_alive()
+    assert 0 < player.frames_played < 8000
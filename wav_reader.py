@@ -0,0 +1,120 @@
+import mmap
+import struct
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_MULAW = 0x0007
+WAVE_FORMAT_IMA_ADPCM = 0x0011
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_PCM_DTYPES = {1: 'u1', 2: '<i2', 4: '<i4'}
+_FLOAT_DTYPES = {4: '<f4', 8: '<f8'}
+
+
+class WavFile:
+    """
+    A WAV file mapped into memory, or held in a bytes object. For PCM and float files `samples` is
+    a read-only NumPy view straight over the data chunk (interleaved when there is more than one
+    channel), nothing is copied. u-law and IMA ADPCM files are decoded into 16-bit `samples`.
+    """
+    def __init__(self, file_path):
+        import numpy as np
+
+        self.file_path = file_path
+        if isinstance(file_path, (bytes, bytearray, memoryview)):
+            self.file_path = '<memory>'
+            self._mmap = bytes(file_path)
+        else:
+            with open(file_path, 'rb') as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        fmt, data_offset, data_size, fact_frames = self._parse_chunks()
+        format_tag, self.channels, self.frame_rate, _, block_align, bits_per_sample = struct.unpack('<HHIIHH', fmt[:16])
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # The real format tag sits at the start of the sub-format GUID
+            format_tag = struct.unpack('<H', fmt[24:26])[0]
+        self.sample_width = bits_per_sample // 8
+        self.encoding = 'pcm'
+
+        # Writers that cannot seek back leave a placeholder like 0xFFFFFFFF, the data runs to the end of the file
+        data_size = min(data_size, len(self._mmap) - data_offset)
+        if format_tag in (WAVE_FORMAT_MULAW, WAVE_FORMAT_IMA_ADPCM) and self.channels:
+            self.samples = self._decode(format_tag, data_offset, data_size, block_align, fact_frames)
+            self.sample_width = 2
+            return
+
+        if format_tag == WAVE_FORMAT_PCM and self.sample_width in _PCM_DTYPES:
+            dtype = _PCM_DTYPES[self.sample_width]
+        elif format_tag == WAVE_FORMAT_IEEE_FLOAT and self.sample_width in _FLOAT_DTYPES:
+            dtype = _FLOAT_DTYPES[self.sample_width]
+        else:
+            raise ValueError(f"{self.file_path}: unsupported WAV format {format_tag} with {bits_per_sample} bits per sample")
+
+        dtype = np.dtype(dtype)
+        self.samples = np.frombuffer(self._mmap, dtype=dtype, count=data_size // dtype.itemsize, offset=data_offset)
+
+    def _decode(self, format_tag, data_offset, data_size, block_align, fact_frames):
+        import numpy as np
+        import audio_formats
+
+        data = np.frombuffer(self._mmap, dtype=np.uint8, count=data_size, offset=data_offset)
+        if format_tag == WAVE_FORMAT_MULAW:
+            self.encoding = 'mulaw'
+            return audio_formats.mulaw_decode(data)
+        self.encoding = 'adpcm'
+        samples = audio_formats.adpcm_unpack(data, self.channels, block_align)
+        # The last block is padded out to whole groups of codes, the fact chunk has the real length
+        if fact_frames:
+            samples = samples[:fact_frames * self.channels]
+        return samples
+
+    def _parse_chunks(self):
+        data = self._mmap
+        if len(data) < 12 or data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise ValueError(f"{self.file_path} is not a RIFF/WAVE file")
+
+        fmt = None
+        fact_frames = None
+        position = 12
+        while position + 8 <= len(data):
+            chunk_id = data[position:position + 4]
+            chunk_size = struct.unpack('<I', data[position + 4:position + 8])[0]
+            body = position + 8
+            if chunk_id == b'fmt ':
+                fmt = bytes(data[body:body + chunk_size])
+            elif chunk_id == b'fact' and chunk_size >= 4:
+                fact_frames = struct.unpack('<I', data[body:body + 4])[0]
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{self.file_path}: data chunk found before fmt chunk")
+                return fmt, body, chunk_size, fact_frames
+            # Chunks are padded to an even number of bytes
+            position = body + chunk_size + (chunk_size & 1)
+
+        raise ValueError(f"{self.file_path}: no data chunk")
+
+    @property
+    def frames(self):
+        return len(self.samples) // self.channels
+
+    @property
+    def duration_seconds(self):
+        return self.frames / self.frame_rate
+
+    def channel(self, index=0):
+        """ One channel as a strided view, still without copying """
+        return self.samples[index::self.channels]
+
+
+def open_wav(file_path):
+    return WavFile(file_path)
+
+
+def read_samples(file_path, copy=False):
+    """
+    Return (samples, frame_rate, channels) for a WAV file. Without `copy` the samples are a
+    view over the memory map, which stays open for as long as the array is referenced.
+    """
+    wav_file = WavFile(file_path)
+    samples = wav_file.samples.copy() if copy else wav_file.samples
+    return samples, wav_file.frame_rate, wav_file.channels